@@ -58,10 +58,54 @@ if DATABASE_URL.startswith("postgres://"):
 app.config["SQLALCHEMY_DATABASE_URI"] = DATABASE_URL
 app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
 
+# Implicit-Present mode: only Absent rows and rows with a note are stored;
+# Present is derived from the practice_day calendar. Run
+# `flask --app app compact-attendance` once when turning it on.
+app.config["IMPLICIT_PRESENT"] = os.getenv("IMPLICIT_PRESENT") == "1"
+
 
 db = SQLAlchemy()
 db.init_app(app)
 
+
+from sqlalchemy.types import TypeDecorator, Date, Integer
+
+class Day(TypeDecorator):
+    """
+    A calendar day. Python code keeps using ISO "YYYY-MM-DD" strings; the
+    database stores a native DATE on Postgres and an integer day number
+    (date.toordinal()) on SQLite, so range filters compare compact keys.
+    """
+    impl = Date
+    cache_ok = True
+
+    def load_dialect_impl(self, dialect):
+        if dialect.name == "sqlite":
+            return dialect.type_descriptor(Integer())
+        return dialect.type_descriptor(Date())
+
+    def process_bind_param(self, value, dialect):
+        if value is None:
+            return None
+        if not isinstance(value, pydt.date):
+            value = pydt.date.fromisoformat(str(value))
+        return value.toordinal() if dialect.name == "sqlite" else value
+
+    def process_result_value(self, value, dialect):
+        if value is None:
+            return None
+        if dialect.name == "sqlite":
+            return pydt.date.fromordinal(value).isoformat()
+        return value.isoformat()
+
+
+def parse_day(value):
+    """Normalize a user-supplied YYYY-MM-DD; "" if it is missing or malformed."""
+    try:
+        return pydt.date.fromisoformat((value or "").strip()[:10]).isoformat()
+    except ValueError:
+        return ""
+
 # Models
 class Athlete(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -70,6 +114,8 @@ class Athlete(db.Model):
     grade      = db.Column(db.Integer, nullable=True)     # was False
     gender     = db.Column(db.String(50), nullable=True)  # was False
     team_id    = db.Column(db.Integer, db.ForeignKey('team.id'), nullable=True)
+    active_since = db.Column(Day, nullable=True)  # first practice day that counts for them
+    change_seq = db.Column(db.BigInteger)  # see next_change_seq()
 
 
 class Team(db.Model):
@@ -83,12 +129,93 @@ class Attendance(db.Model):
     __table_args__ = (UniqueConstraint('athlete_id', 'date', name='uq_attendance_day'),)
     id = db.Column(db.Integer, primary_key=True)
     athlete_id = db.Column(db.Integer, db.ForeignKey('athlete.id'), nullable=False)
-    date = db.Column(db.String(10), nullable=False)  # ISO format string is fine
+    date = db.Column(Day, nullable=False)  # ISO string in Python, DATE / day number in the DB
     status = db.Column(db.String(20), nullable=False)
     notes = db.Column(db.String(255))
+    updated_at = db.Column(db.BigInteger)  # ms since epoch of the last write (last-write-wins)
+    change_seq = db.Column(db.BigInteger)  # see next_change_seq()
     athlete = db.relationship("Athlete", backref="attendance_records")
 
 
+class PracticeDay(db.Model):
+    """
+    A team's practice calendar. A "held" day had practice (in implicit-Present
+    mode everyone without a row was Present); "planned" is on the schedule but
+    hasn't happened yet; "cancelled" was called off and doesn't count.
+    """
+    __table_args__ = (UniqueConstraint('team_id', 'date', name='uq_practice_day'),)
+    id = db.Column(db.Integer, primary_key=True)
+    team_id = db.Column(db.Integer, db.ForeignKey('team.id'), nullable=False)
+    date = db.Column(Day, nullable=False)
+    status = db.Column(db.String(10), nullable=False, default="held", server_default="held")
+    change_seq = db.Column(db.BigInteger)  # stamped when the day becomes held
+
+
+class AthleteSeason(db.Model):
+    """Per-athlete, per-season attendance counters, kept current by every write path."""
+    athlete_id = db.Column(db.Integer, db.ForeignKey('athlete.id'), primary_key=True)
+    season = db.Column(db.Integer, primary_key=True)  # see season_of()
+    present_days = db.Column(db.Integer, nullable=False, default=0)
+    absent_days = db.Column(db.Integer, nullable=False, default=0)
+    last_absence = db.Column(Day)
+    current_streak = db.Column(db.Integer, nullable=False, default=0)  # Present days since the last absence
+
+
+class AthleteDayIndex(db.Model):
+    """Running Present / Absent totals per athlete through each practice day."""
+    athlete_id = db.Column(db.Integer, db.ForeignKey('athlete.id'), primary_key=True)
+    day = db.Column(Day, primary_key=True)
+    present_cum = db.Column(db.Integer, nullable=False)
+    absent_cum = db.Column(db.Integer, nullable=False)
+
+
+class AthleteFlag(db.Model):
+    """A flag rule an athlete currently meets in a season, kept by every roll write."""
+    __table_args__ = (
+        UniqueConstraint('athlete_id', 'season', 'rule', name='uq_athlete_flag'),
+        db.Index('ix_athlete_flag_season', 'season', 'rule'),
+    )
+    id = db.Column(db.Integer, primary_key=True)
+    athlete_id = db.Column(db.Integer, db.ForeignKey('athlete.id'), nullable=False)
+    season = db.Column(db.Integer, nullable=False)
+    rule = db.Column(db.String(20), nullable=False)  # see FLAG_RULES
+    value = db.Column(db.Integer, nullable=False)
+    raised_at = db.Column(db.BigInteger, nullable=False)  # ms since epoch, first time it was met
+
+
+class RollVersion(db.Model):
+    """Bumped by every write to a team's roll or roster (team_id 0: no team)."""
+    team_id = db.Column(db.Integer, primary_key=True)
+    version = db.Column(db.BigInteger, nullable=False, default=0)
+
+
+class SyncOp(db.Model):
+    """Idempotency keys of attendance operations that were already applied."""
+    key = db.Column(db.String(64), primary_key=True)
+    applied_at = db.Column(db.BigInteger, nullable=False)  # ms since epoch
+
+
+class ChangeSeq(db.Model):
+    """The change counter behind every change_seq stamp (a single row, id 1)."""
+    id = db.Column(db.Integer, primary_key=True)
+    seq = db.Column(db.BigInteger, nullable=False, default=0)
+
+
+class Tombstone(db.Model):
+    """
+    A deleted export row, so delta exports can report it: an athlete or coach
+    by row_id, an attendance day by (athlete_id, date).
+    """
+    id = db.Column(db.Integer, primary_key=True)
+    table_name = db.Column(db.String(20), nullable=False)
+    row_id = db.Column(db.Integer)
+    athlete_id = db.Column(db.Integer)
+    date = db.Column(Day)
+    team_id = db.Column(db.Integer)  # the team it was exported under
+    change_seq = db.Column(db.BigInteger, nullable=False, index=True)
+    deleted_at = db.Column(db.BigInteger, nullable=False)  # ms since epoch
+
+
 class Coach(UserMixin, db.Model):
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(100), nullable=False)
@@ -96,6 +223,7 @@ class Coach(UserMixin, db.Model):
     password = db.Column(db.String(255), nullable=False)
     team_id = db.Column(db.Integer, db.ForeignKey('team.id'), nullable=True)
     email = db.Column(db.String(120), unique=True, nullable=True)
+    change_seq = db.Column(db.BigInteger)  # see next_change_seq()
 
 
 
@@ -122,7 +250,7 @@ def rename_teams_to_coaches():
 
 
 
-from sqlalchemy import inspect, text
+from sqlalchemy import inspect, text, MetaData, String
 
 def ensure_athlete_columns():
     insp = inspect(db.engine)
@@ -137,6 +265,9 @@ def ensure_athlete_columns():
         stmts.append("ALTER TABLE athlete ADD COLUMN IF NOT EXISTS grade INTEGER")
     if 'gender' not in cols:
         stmts.append("ALTER TABLE athlete ADD COLUMN IF NOT EXISTS gender VARCHAR(20)")
+    if 'active_since' not in cols:
+        stmts.append("ALTER TABLE athlete ADD COLUMN active_since "
+                     + ("INTEGER" if db.engine.dialect.name == "sqlite" else "DATE"))
 
     if not stmts:
         print("Athlete table already has needed columns.")
@@ -148,6 +279,237 @@ def ensure_athlete_columns():
             conn.execute(text(s))
     print("Athlete columns ensured.")
 
+def ensure_attendance_columns():
+    insp = inspect(db.engine)
+    try:
+        cols = {c['name'] for c in insp.get_columns('attendance')}
+    except Exception as e:
+        print("Could not inspect 'attendance' table:", e)
+        return
+
+    if 'updated_at' in cols:
+        print("Attendance table already has needed columns.")
+        return
+
+    with db.engine.begin() as conn:
+        conn.execute(text("ALTER TABLE attendance ADD COLUMN updated_at BIGINT"))
+    print("Attendance columns ensured.")
+
+def ensure_practice_day_columns():
+    insp = inspect(db.engine)
+    try:
+        cols = {c['name'] for c in insp.get_columns('practice_day')}
+    except Exception as e:
+        print("Could not inspect 'practice_day' table:", e)
+        return
+
+    if 'status' in cols:
+        return
+
+    with db.engine.begin() as conn:
+        conn.execute(text("ALTER TABLE practice_day ADD COLUMN status VARCHAR(10) NOT NULL DEFAULT 'held'"))
+    print("Practice day columns ensured.")
+
+# ---------- Day column migration (String(10) -> DATE / day number) ----------
+#
+# (table, column, unique constraint it belongs to, keep-first ORDER BY for duplicates)
+DAY_COLUMNS = [
+    ("attendance", "date", ("uq_attendance_day", "athlete_id"),
+     "CASE WHEN status = 'Absent' THEN 0 ELSE 1 END, "
+     "CASE WHEN notes IS NULL THEN 1 ELSE 0 END, id DESC"),
+    ("practice_day", "date", ("uq_practice_day", "team_id"), "id"),
+    ("athlete", "active_since", None, None),
+]
+
+
+def _coerce_day(raw):
+    """Legacy text value -> date, tolerating timestamps like 2025-08-01T17:03:00."""
+    try:
+        return pydt.date.fromisoformat(str(raw).strip()[:10])
+    except ValueError:
+        return None
+
+
+def _backfill_day_column(conn, table, column, tmp, after_id, limit=None):
+    """Convert rows not converted yet; returns (last id seen, rows seen, unparseable)."""
+    sqlite = conn.dialect.name == "sqlite"
+    sql = (f"SELECT id, {column} FROM {table} "
+           f"WHERE id > :after AND {tmp} IS NULL AND {column} IS NOT NULL ORDER BY id")
+    params = {"after": after_id}
+    if limit:
+        sql += " LIMIT :n"
+        params["n"] = limit
+    rows = conn.execute(text(sql), params).all()
+    updates, bad = [], []
+    for rid, raw in rows:
+        d = _coerce_day(raw)
+        if d is None:
+            bad.append((rid, raw))
+        else:
+            updates.append({"id": rid, "v": d.toordinal() if sqlite else d})
+    if updates:
+        conn.execute(text(f"UPDATE {table} SET {tmp} = :v WHERE id = :id"), updates)
+    return (rows[-1][0] if rows else after_id), len(rows), bad
+
+
+def _migrate_day_column(table, column, unique, keep_order, batch_size):
+    sqlite = db.engine.dialect.name == "sqlite"
+    q = db.engine.dialect.identifier_preparer.quote
+    col, tmp = q(column), q(f"{column}__day")
+    nullable = unique is None
+
+    if f"{column}__day" not in {c["name"] for c in inspect(db.engine).get_columns(table)}:
+        with db.engine.begin() as conn:
+            conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {tmp} "
+                              + ("INTEGER" if sqlite else "DATE")))
+
+    # 1) Online backfill: one short transaction per batch, the app keeps writing.
+    last_id, done = 0, 0
+    while True:
+        with db.engine.begin() as conn:
+            last_id, n, bad = _backfill_day_column(conn, table, col, tmp, last_id, batch_size)
+        done += n
+        if not n:
+            break
+    print(f"Backfilled {done} {table}.{column} value(s).")
+
+    # 2) Swap in one transaction, after catching up on rows written meanwhile.
+    with db.engine.begin() as conn:
+        if not sqlite:
+            conn.execute(text(f"LOCK TABLE {table} IN ACCESS EXCLUSIVE MODE"))
+        _, _, bad = _backfill_day_column(conn, table, col, tmp, 0)
+        if bad:
+            # keep the unreadable values: the rows (as they were) go to <table>__bad_days
+            unreadable = f"{tmp} IS NULL AND {col} IS NOT NULL"
+            conn.execute(text(f"CREATE TABLE IF NOT EXISTS {table}__bad_days AS "
+                              f"SELECT * FROM {table} WHERE 1 = 0"))
+            conn.execute(text(f"INSERT INTO {table}__bad_days SELECT * FROM {table} WHERE {unreadable}"))
+            print(f"Copied {len(bad)} {table} row(s) with unreadable dates to {table}__bad_days:", bad[:20])
+            if not nullable:
+                conn.execute(text(f"DELETE FROM {table} WHERE {unreadable}"))
+
+        if unique:
+            # '2025-08-01' and '2025-08-01T17:03' become the same day; keep the best row
+            key = unique[1]
+            dups = conn.execute(text(
+                f"SELECT {key}, {tmp} FROM {table} GROUP BY {key}, {tmp} HAVING COUNT(*) > 1"
+            )).all()
+            for k, d in dups:
+                ids = conn.execute(text(
+                    f"SELECT id FROM {table} WHERE {key} = :k AND {tmp} = :d ORDER BY {keep_order}"
+                ), {"k": k, "d": d}).scalars().all()
+                conn.execute(text(f"DELETE FROM {table} WHERE id = :id"),
+                             [{"id": i} for i in ids[1:]])
+            if dups:
+                print(f"Merged {len(dups)} duplicate {table} day(s).")
+
+        if sqlite:
+            # SQLite can't change a column type (or drop a UNIQUE one): rebuild the table.
+            md = MetaData()
+            for t in db.metadata.sorted_tables:
+                t.to_metadata(md)
+            model = md.tables[table]
+            new = model.to_metadata(md, name=f"{table}__new")
+            new.create(conn)
+            old_cols = {c["name"] for c in inspect(conn).get_columns(table)}
+            names = [c.name for c in model.columns if c.name in old_cols]
+            select_list = ", ".join(tmp if n == column else q(n) for n in names)
+            conn.execute(text(
+                f"INSERT INTO {table}__new ({', '.join(q(n) for n in names)}) "
+                f"SELECT {select_list} FROM {table}"
+            ))
+            conn.execute(text(f"DROP TABLE {table}"))
+            conn.execute(text(f"ALTER TABLE {table}__new RENAME TO {table}"))
+        else:
+            # dropping the column also drops the indexes and constraints on it
+            conn.execute(text(f"ALTER TABLE {table} DROP COLUMN {col}"))
+            conn.execute(text(f"ALTER TABLE {table} RENAME COLUMN {tmp} TO {col}"))
+            if not nullable:
+                conn.execute(text(f"ALTER TABLE {table} ALTER COLUMN {col} SET NOT NULL"))
+            if unique:
+                conn.execute(text(
+                    f"ALTER TABLE {table} ADD CONSTRAINT {unique[0]} UNIQUE ({unique[1]}, {col})"
+                ))
+    print(f"Migrated {table}.{column} to a native day column.")
+
+
+def migrate_day_columns(batch_size=5000):
+    """
+    Move date columns still stored as text to DATE (Postgres) or an integer
+    day number (SQLite). Runs at boot inside schema_lock(); only text columns
+    are touched. Run before ensure_attendance_unique_index(), which rebuilds its index.
+    Rows whose date can't be read are copied to <table>__bad_days first.
+    """
+    insp = inspect(db.engine)
+    for table, column, unique, keep_order in DAY_COLUMNS:
+        try:
+            cols = {c["name"]: c["type"] for c in insp.get_columns(table)}
+        except Exception as e:
+            print(f"Could not inspect '{table}' table:", e)
+            continue
+        if isinstance(cols.get(column), String):
+            _migrate_day_column(table, column, unique, keep_order, batch_size)
+
+
+import fcntl
+from contextlib import contextmanager
+
+SCHEMA_LOCK_KEY = 7262025  # pg_advisory_lock key for boot-time schema changes
+
+
+@contextmanager
+def schema_lock():
+    """
+    Serialize the boot-time schema work (DDL, day-column migration, seeds)
+    across gunicorn workers starting at the same moment: a Postgres advisory
+    lock, or a file lock next to the SQLite database. Whoever comes second
+    finds the work done.
+    """
+    if db.engine.dialect.name == "postgresql":
+        with db.engine.connect() as conn:
+            conn.execute(text("SELECT pg_advisory_lock(:k)"), {"k": SCHEMA_LOCK_KEY})
+            try:
+                yield
+            finally:
+                conn.execute(text("SELECT pg_advisory_unlock(:k)"), {"k": SCHEMA_LOCK_KEY})
+        return
+    database = db.engine.url.database
+    if not database or database == ":memory:":
+        database = os.path.join(app.instance_path, "schema")
+    path = database + ".lock"
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, "a") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def ensure_attendance_range_index():
+    # Date-range filters across all athletes (leaders, exports) scan this.
+    with db.engine.begin() as conn:
+        conn.execute(text("CREATE INDEX IF NOT EXISTS ix_attendance_date ON attendance (date)"))
+
+def ensure_attendance_covering_index():
+    # Per-athlete windows over (date, status) read only this index, never the table.
+    with db.engine.begin() as conn:
+        conn.execute(text("CREATE INDEX IF NOT EXISTS ix_attendance_athlete_date_status "
+                          "ON attendance (athlete_id, date DESC, status)"))
+
+CHANGE_TRACKED_TABLES = ("athlete", "attendance", "coach", "practice_day")
+
+def ensure_change_seq_columns():
+    # change_seq stamps for delta exports, indexed so "changed since N" is a range scan.
+    # Runs after migrate_day_columns, whose SQLite table rebuild drops extra indexes.
+    insp = inspect(db.engine)
+    with db.engine.begin() as conn:
+        for table in CHANGE_TRACKED_TABLES:
+            if 'change_seq' not in {c['name'] for c in insp.get_columns(table)}:
+                conn.execute(text(f"ALTER TABLE {table} ADD COLUMN change_seq BIGINT"))
+                print(f"Added {table}.change_seq.")
+            conn.execute(text(f"CREATE INDEX IF NOT EXISTS ix_{table}_change_seq ON {table} (change_seq)"))
+
 from sqlalchemy import text
 
 def ensure_attendance_unique_index():
@@ -225,722 +587,4291 @@ def logout():
 
 from zoneinfo import ZoneInfo  # make sure this is imported once
 
+from sqlalchemy import select, literal, exists, or_
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import aliased
 
-@app.route("/attendance", methods=["GET", "POST"])
-@login_required
-def attendance():
-    central = ZoneInfo("America/Chicago")
-    today = datetime.datetime.now(central).date().isoformat()
 
-    # Get team_id from querystring or form; normalize to int or None
-    raw_team_id = request.args.get("team_id") or request.form.get("team_id")
-    try:
-        selected_team_id = int(raw_team_id) if raw_team_id else None
-    except (TypeError, ValueError):
-        selected_team_id = None
+def implicit_present():
+    return app.config.get("IMPLICIT_PRESENT", False)
 
-    # ---------- POST: toggle or save note (no unwanted flipping) ----------
-    if request.method == "POST":
-        athlete_id = request.form.get("athlete_id")
-        note = (request.form.get("note") or "").strip()
-        action = (request.form.get("action") or "toggle").strip()  # "toggle" or "save_note"
 
-        aid = None
-        try:
-            aid = int(athlete_id) if athlete_id else None
-        except (TypeError, ValueError):
-            aid = None
+def dialect_insert(model):
+    """INSERT construct for the current database (both support ON CONFLICT)."""
+    if db.engine.dialect.name == "postgresql":
+        return pg_insert(model)
+    return sqlite_insert(model)
 
-        if aid:
-            record = Attendance.query.filter_by(athlete_id=aid, date=today).first()
-            if not record:
-                # should rarely happen because you auto-create on GET, but be safe
-                record = Attendance(athlete_id=aid, date=today, status="Present", notes=None)
-                db.session.add(record)
 
-            if action == "toggle":
-                record.status = "Absent" if record.status == "Present" else "Present"
-                # also capture any note typed alongside the toggle
-                if note != (record.notes or ""):
-                    record.notes = note
-            elif action == "save_note":
-                # ONLY update the note; keep current status
-                if note != (record.notes or ""):
-                    record.notes = note
+def hold_practice_days(conn, src, reopen=True):
+    """
+    Put the (team_id, date) rows selected by `src` on the practice calendar
+    as held. Planned days become held; cancelled ones only with `reopen`
+    (someone took roll after all). Returns the (team_id, date) pairs that
+    weren't held before. `src` needs a WHERE clause (SQLite upsert parsing).
+    """
+    stmt = dialect_insert(PracticeDay).from_select(["team_id", "date"], src)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=["team_id", "date"],
+        set_={"status": "held"},
+        where=(PracticeDay.status != "held") if reopen else (PracticeDay.status == "planned"),
+    )
+    held = [tuple(r) for r in conn.execute(stmt.returning(PracticeDay.team_id, PracticeDay.date))]
+    if held:
+        stamp_changes(conn, PracticeDay, tuple_(PracticeDay.team_id, PracticeDay.date).in_(held))
+    return held
 
-            db.session.commit()
 
-        # Keep current team filter and jump back to the same athlete row
-        return redirect(url_for("attendance",
-                                team_id=selected_team_id,
-                                _anchor=f"athlete-{aid or ''}"))
-    # ----------------------------------------------------------------------
+def roll_needs_materializing(day, team_id=None):
+    """
+    Whether materialize_roll() has anything to write: a team on the roll
+    without the day on its calendar (held or cancelled), or, in explicit
+    mode, an athlete without a row on a day their team didn't cancel.
+    """
+    unheld = (
+        exists().where(Athlete.team_id == Team.id)
+        & ~exists().where(PracticeDay.team_id == Team.id, PracticeDay.date == day,
+                          PracticeDay.status.in_(["held", "cancelled"]))
+    )
+    if team_id:
+        unheld = unheld & (Team.id == team_id)
+    todo = exists(select(Team.id).where(unheld))
+    if not implicit_present():
+        missing = (
+            ~exists().where(Attendance.athlete_id == Athlete.id, Attendance.date == day)
+            & ~exists().where(PracticeDay.team_id == Athlete.team_id, PracticeDay.date == day,
+                              PracticeDay.status == "cancelled")
+        )
+        if team_id:
+            missing = missing & (Athlete.team_id == team_id)
+        todo = todo | exists(select(Athlete.id).where(missing))
+    return db.session.execute(select(todo)).scalar()
 
-    # ===== Auto-create Present rows on GET so green = saved in DB =====
-    q = Athlete.query
-    if selected_team_id:
-        q = q.filter_by(team_id=selected_team_id)
-    for athlete in q.all():
-        exists = Attendance.query.filter_by(athlete_id=athlete.id, date=today).first()
-        if not exists:
-            db.session.add(Attendance(
-                athlete_id=athlete.id,
-                date=today,
-                status="Present",
-                notes=None
-            ))
-    db.session.commit()
-    # =================================================================
 
-    # GET: fetch athletes (filtered if team selected)
-    if selected_team_id:
-        athletes = (Athlete.query
-                    .filter_by(team_id=selected_team_id)
-                    .order_by(Athlete.last_name, Athlete.first_name)
-                    .all())
-    else:
-        athletes = (Athlete.query
-                    .order_by(Athlete.last_name, Athlete.first_name)
-                    .all())
+def materialize_roll(day, team_id=None):
+    """
+    Make sure every athlete (optionally just one team) has a row for `day`.
+    One INSERT ... SELECT ... ON CONFLICT DO NOTHING instead of a lookup per
+    athlete. The NOT EXISTS skips rows we already have; ON CONFLICT on the
+    (athlete_id, date) unique index covers two coaches opening the same team
+    at the same moment, so this never raises IntegrityError.
+
+    The day goes on the practice calendar of each team on the roll, unless a
+    coach cancelled it. In implicit-Present mode that is all that's written.
+    Once a day is fully materialized, later calls are a single EXISTS read.
+    """
+    if not roll_needs_materializing(day, team_id):
+        return
+    conn = db.session.connection()
+    teams = select(Team.id, literal(day, PracticeDay.date.type))\
+        .where(exists().where(Athlete.team_id == Team.id))
+    if team_id:
+        teams = teams.where(Team.id == team_id)
+    new_teams = [t for t, _ in hold_practice_days(conn, teams, reopen=False)]
+
+    if implicit_present():
+        if new_teams:
+            team_roll_changed(conn, new_teams, day)
+        db.session.commit()
+        if new_teams:
+            roll_matrix.invalidate(season_of(day))  # a new practice-day column
+        return
 
-    # Attendance & notes for today (TEAM-FILTER AWARE)
-    today_records = (
-        Attendance.query
-        .join(Athlete, Attendance.athlete_id == Athlete.id)
-        .filter(
-            Attendance.date == today,
-            (Athlete.team_id == selected_team_id) if selected_team_id else True
+    src = (
+        select(
+            Athlete.id,
+            literal(day, Attendance.date.type),
+            literal("Present", Attendance.status.type),
         )
-        .all()
+        .where(~exists().where(
+            Attendance.athlete_id == Athlete.id,
+            Attendance.date == day,
+        ))
+        .where(~exists().where(
+            PracticeDay.team_id == Athlete.team_id,
+            PracticeDay.date == day,
+            PracticeDay.status == "cancelled",
+        ))
     )
-    attendance_data = {r.athlete_id: r.status for r in today_records}
-    notes_data = {r.athlete_id: r.notes for r in today_records}
-
-    present_count = sum(1 for s in attendance_data.values() if s == "Present")
-    absent_count = sum(1 for s in attendance_data.values() if s == "Absent")
-    unmarked_count = max(0, len(athletes) - len(attendance_data))
+    if team_id:
+        src = src.where(Athlete.team_id == team_id)
+
+    stmt = (
+        dialect_insert(Attendance)
+        .from_select(["athlete_id", "date", "status"], src)
+        .on_conflict_do_nothing(index_elements=["athlete_id", "date"])
+        .returning(Attendance.athlete_id)
+    )
+    added = db.session.execute(stmt).scalars().all()
+    if added:
+        stamp_changes(conn, Attendance, Attendance.date == day, Attendance.athlete_id.in_(added))
+        roll_changed(conn, added, day)
+    events = stamp_events(conn, [{"athlete_id": aid, "date": day, "status": "Present"} for aid in added])
+    db.session.commit()
+    if added:
+        roll_matrix.apply(events)
 
-    teams = Team.query.order_by(Team.name).all()
 
-    return render_template(
-        "attendance.html",
-        athletes=athletes,
-        attendance=attendance_data,
-        notes=notes_data,
-        teams=teams,
-        selected_team_id=selected_team_id,
-        date=today,
-        present_count=present_count,
-        absent_count=absent_count,
-        unmarked_count=unmarked_count
-    )
+import time
+import hashlib
+from collections import deque, namedtuple
+from flask import make_response
+from sqlalchemy.exc import IntegrityError
 
-from flask import jsonify
-from zoneinfo import ZoneInfo
-import datetime as pydt  # (avoid name clash if you use `import datetime` elsewhere)
+def now_ms():
+    return int(time.time() * 1000)
 
-@app.route("/attendance/note", methods=["POST"])
-@login_required
-def attendance_note():
-    """AJAX: save today's note for an athlete without changing status."""
-    central = ZoneInfo("America/Chicago")
-    today = pydt.datetime.now(central).date().isoformat()
 
-    # Support JSON or form-encoded
-    data = request.get_json(silent=True) or request.form
-    aid_raw = (data.get("athlete_id") or "").strip()
-    note = (data.get("note") or "").strip()
+def central_today():
+    """Today's date (ISO) in the team's time zone."""
+    return pydt.datetime.now(ZoneInfo("America/Chicago")).date().isoformat()
 
-    try:
-        aid = int(aid_raw)
-    except (TypeError, ValueError):
-        return jsonify({"ok": False, "error": "bad athlete_id"}), 400
 
-    record = Attendance.query.filter_by(athlete_id=aid, date=today).first()
+def get_roll_record(athlete_id, day):
+    """Return the attendance row for (athlete, day), adding a Present one if missing."""
+    record = Attendance.query.filter_by(athlete_id=athlete_id, date=day).first()
     if not record:
-        # If missing, create a Present row (matches your GET auto-create behavior)
-        record = Attendance(athlete_id=aid, date=today, status="Present", notes=None)
+        # matches the GET auto-create, so a first tap means Absent
+        record = Attendance(athlete_id=athlete_id, date=day, status="Present", notes=None)
         db.session.add(record)
+    return record
 
-    record.notes = note or None
-    db.session.commit()
-    return ("", 204)  # No Content
 
+# ---------- Implicit-Present storage ----------
 
-@app.route("/attendance_leaders", methods=["GET"])
-@login_required
-def attendance_leaders():
+from sqlalchemy import event, insert
+
+@event.listens_for(db.session, "before_flush")
+def _drop_plain_present_rows(session, flush_context, instances):
     """
-    Ranks athletes by number of Present days in an optional date range and/or team.
-    - Default: coach sees their own team; admin sees all unless team chosen.
-    - Shows athletes with 0 present days too.
+    In implicit-Present mode a Present row without a note carries no
+    information, so it is never written (new) or is removed (existing).
     """
-    # Inputs
-    since = (request.args.get("since") or "").strip()   # YYYY-MM-DD
-    until = (request.args.get("until") or "").strip()
-    limit = request.args.get("limit", type=int) or 50
+    if not implicit_present():
+        return
+    for obj in list(session.new) + list(session.dirty):
+        if not isinstance(obj, Attendance):
+            continue
+        if obj.status == "Present" and not obj.notes:
+            if obj in session.new:
+                session.expunge(obj)
+                # still a mark for _hold_marked_days: roll taken on a planned day
+                session.info.setdefault("present_marks", []).append((obj.athlete_id, obj.date))
+            else:
+                session.delete(obj)
+
+
+@event.listens_for(db.session, "before_flush")
+def _hold_marked_days(session, flush_context, instances):
+    """A day that gets a row goes on the athlete's team calendar as held."""
+    marked = [(obj.athlete_id, obj.date) for obj in session.new if isinstance(obj, Attendance)]
+    if implicit_present():
+        marked += [(obj.athlete_id, obj.date) for obj in session.dirty
+                   if isinstance(obj, Attendance) and obj not in session.deleted]
+        marked += session.info.pop("present_marks", [])
+    if not marked:
+        return
 
-    raw_team = request.args.get("team_id")
-    try:
-        selected_team_id = int(raw_team) if raw_team else None
-    except (TypeError, ValueError):
-        selected_team_id = None
+    conn = session.connection()
+    for day in {d for _, d in marked}:
+        ids = {aid for aid, d in marked if d == day}
+        src = (
+            select(Athlete.team_id, literal(day, PracticeDay.date.type))
+            .where(Athlete.id.in_(ids), Athlete.team_id.isnot(None))
+            .distinct()
+        )
+        if implicit_present():
+            # a new practice day is an implicit Present for the whole team, so
+            # only a planned one is held; routes refuse marks off the calendar
+            # (see off_calendar), anything else stays that athlete's own row
+            src = src.where(exists().where(PracticeDay.team_id == Athlete.team_id,
+                                           PracticeDay.date == day, PracticeDay.status == "planned"))
+        held = hold_practice_days(conn, src)
+        if implicit_present():
+            session.info.setdefault("new_practice_days", []).extend(held)
+
+
+def off_calendar(pairs):
+    """
+    The (athlete_id, date) pairs whose athlete's team has no practice, held
+    or planned, that day. Implicit-Present mode won't take marks on those:
+    holding the day would put the whole team down as Present.
+    """
+    pairs = set(pairs)
+    if not pairs:
+        return set()
+    on = db.session.query(Athlete.id, PracticeDay.date)\
+        .join(PracticeDay, PracticeDay.team_id == Athlete.team_id)\
+        .filter(tuple_(Athlete.id, PracticeDay.date).in_(pairs),
+                PracticeDay.status.in_(["held", "planned"]))
+    return pairs - {tuple(r) for r in on}
 
-    # Default to coach’s team if not admin and none chosen
-    if selected_team_id is None and getattr(current_user, "username", "") != "admin":
-        selected_team_id = current_user.team_id
 
-    # Build present-count expression (works with LEFT OUTER JOIN)
-    present_count = func.coalesce(
-        func.sum(
-            case((Attendance.status == "Present", 1), else_=0)
-        ),
-        0
-    ).label("present_days")
+def practice_day_join(since="", until=""):
+    """
+    Join condition from Athlete to the practice days that count for them:
+    their team's calendar, from active_since on, inside the optional range.
+    """
+    cond = and_(
+        PracticeDay.team_id == Athlete.team_id,
+        PracticeDay.status == "held",
+        or_(Athlete.active_since.is_(None), PracticeDay.date >= Athlete.active_since),
+    )
+    if since:
+        cond = and_(cond, PracticeDay.date >= since)
+    if until:
+        cond = and_(cond, PracticeDay.date <= until)
+    return cond
 
-    # Base query: include all athletes (even with no rows in Attendance)
-    q = (
-        db.session.query(
-            Athlete.id,
-            Athlete.first_name,
-            Athlete.last_name,
-            Team.name.label("team_name"),
-            present_count
+
+def compact_attendance():
+    """
+    Move existing data to implicit-Present storage: put every day that has
+    rows on its team's practice calendar, record when each athlete's rows
+    start, then delete the Present rows that have no note.
+    """
+    with db.engine.begin() as conn:
+        first_day = (
+            select(func.min(Attendance.date))
+            .where(Attendance.athlete_id == Athlete.id)
+            .scalar_subquery()
         )
-        .join(Team, Team.id == Athlete.team_id, isouter=True)
-        .outerjoin(
-            Attendance,
-            and_(
-                Attendance.athlete_id == Athlete.id,
-                (Attendance.status.in_(("Present", "Absent")))  # only real attendance rows
-            )
+        conn.execute(
+            Athlete.__table__.update()
+            .where(Athlete.active_since.is_(None))
+            .values(active_since=first_day)
         )
-    )
+        hold_practice_days(conn, marked_days())
+        deleted = conn.execute(
+            Attendance.__table__.delete().where(
+                Attendance.status == "Present",
+                func.coalesce(Attendance.notes, "") == "",
+            )
+        ).rowcount
+    print(f"Compacted attendance: removed {deleted} plain Present row(s).")
+    return deleted
 
-    # Filters
-    if selected_team_id:
-        q = q.filter(Athlete.team_id == selected_team_id)
-    if since:
-        q = q.filter(Attendance.date >= since)
-    if until:
-        q = q.filter(Attendance.date <= until)
 
-    # Group & order
-    q = (
-        q.group_by(Athlete.id, Athlete.first_name, Athlete.last_name, Team.name)
-         .order_by(present_count.desc(), Athlete.last_name, Athlete.first_name)
+def marked_days():
+    """(team_id, date) for every day that has a row, to fill the calendar from."""
+    return (
+        select(Athlete.team_id, Attendance.date)
+        .join(Athlete, Athlete.id == Attendance.athlete_id)
+        .where(Athlete.team_id.isnot(None))
+        .distinct()
     )
 
-    leaders = q.limit(limit).all()
 
-    # Also compute how many practice days exist in this range (for context/percent)
-    distinct_days_q = db.session.query(func.count(func.distinct(Attendance.date)))
-    if since:
-        distinct_days_q = distinct_days_q.filter(Attendance.date >= since)
-    if until:
-        distinct_days_q = distinct_days_q.filter(Attendance.date <= until)
-    # If a team is selected, restrict to that team’s athletes’ attendance
-    if selected_team_id:
-        distinct_days_q = (
-            distinct_days_q
-            .join(Athlete, Athlete.id == Attendance.athlete_id)
-            .filter(Athlete.team_id == selected_team_id)
-        )
-    total_days = distinct_days_q.scalar() or 0
+def ensure_practice_days():
+    # First boot with the calendar: put every day that already has rows on it.
+    if PracticeDay.query.first() is not None or Attendance.query.first() is None:
+        return
+    with db.engine.begin() as conn:
+        n = len(hold_practice_days(conn, marked_days()))
+    print(f"Filled the practice calendar with {n} team day(s).")
 
-    teams = db.session.query(Team.id, Team.name).order_by(Team.name).all()
 
-    return render_template(
-        "leaders.html",
-        leaders=leaders,
-        teams=teams,
-        selected_team_id=selected_team_id,
-        since=since,
-        until=until,
-        total_days=total_days,
-        limit=limit
+@app.cli.command("compact-attendance")
+def compact_attendance_command():
+    """Switch existing data to implicit-Present storage (run once)."""
+    compact_attendance()
+    print("Set IMPLICIT_PRESENT=1 and VACUUM the database to reclaim the space.")
+
+
+# ---------- Change tracking for delta exports ----------
+#
+# Every write to an athlete, attendance row, coach or held practice day
+# stamps the rows it touched with change_seq; deletes leave a Tombstone with
+# the same stamp. While the transaction runs the stamp is PENDING_CHANGE_SEQ;
+# right before COMMIT it takes the next value of one counter row and swaps
+# it in. The counter row is locked from then until the commit, so it is
+# held for the commit alone, not the whole transaction, and stamps still
+# become visible in order: once a reader sees N as the counter, every stamp
+# <= N is committed, and "changed after N" is a watermark a sync client can
+# resume from.
+
+from sqlalchemy.engine import Engine
+
+CHANGE_TRACKED = (Athlete, Attendance, Coach, PracticeDay)
+PENDING_CHANGE_SEQ = -1  # rows written by a transaction that hasn't committed (only it sees them)
+
+
+def next_change_seq(conn, *models):
+    """
+    The change stamp for the caller's transaction, to write into `models`
+    (every tracked table when none are named); see _number_changes.
+    """
+    conn.info.setdefault("change_seq_pending", set()).update(models or (*CHANGE_TRACKED, Tombstone))
+    return PENDING_CHANGE_SEQ
+
+
+@event.listens_for(Engine, "commit")
+def _number_changes(conn):
+    """Just before COMMIT: give this transaction's pending stamps the next counter value."""
+    models = conn.info.pop("change_seq_pending", None)
+    if not models:
+        return
+    stmt = dialect_insert(ChangeSeq).values(id=1, seq=1).on_conflict_do_update(
+        index_elements=["id"], set_={"seq": ChangeSeq.seq + 1})
+    seq = conn.execute(stmt.returning(ChangeSeq.seq)).scalar_one()
+    for model in models:
+        conn.execute(model.__table__.update()
+                     .where(model.change_seq == PENDING_CHANGE_SEQ).values(change_seq=seq))
+    for ev in conn.info.pop("change_seq_events", ()):
+        ev["seq"] = seq
+
+
+@event.listens_for(Engine, "rollback")
+def _drop_pending_changes(conn):
+    conn.info.pop("change_seq_pending", None)
+    conn.info.pop("change_seq_events", None)
+
+
+def stamp_events(conn, events):
+    """Give these roll events (dicts) the caller's change stamp as "seq" once it commits."""
+    conn.info.setdefault("change_seq_events", []).extend(events)
+    return events
+
+
+def current_change_seq():
+    """The newest committed stamp: the watermark to hand a sync client."""
+    return db.session.query(ChangeSeq.seq).filter_by(id=1).scalar() or 0
+
+
+def stamp_changes(conn, model, *where):
+    """Stamp the rows a bulk statement just wrote."""
+    conn.execute(model.__table__.update().where(*where).values(change_seq=next_change_seq(conn, model)))
+
+
+def tombstone_roll(conn, athlete_ids, day=None):
+    """
+    Tombstones for the attendance export rows these athletes have now
+    (optionally one day): call before the rows go away or change team.
+    """
+    if implicit_present():
+        keys = select(Athlete.id, PracticeDay.date, Athlete.team_id)\
+            .select_from(Athlete).join(PracticeDay, practice_day_join())
+        if day:
+            keys = keys.where(PracticeDay.date == day)
+    else:
+        keys = select(Attendance.athlete_id, Attendance.date, Athlete.team_id)\
+            .join(Athlete, Athlete.id == Attendance.athlete_id)
+        if day:
+            keys = keys.where(Attendance.date == day)
+    keys = keys.where(Athlete.id.in_(set(athlete_ids)))
+    seq, now = next_change_seq(conn, Tombstone), now_ms()
+    conn.execute(insert(Tombstone).from_select(
+        ["athlete_id", "date", "team_id", "table_name", "change_seq", "deleted_at"],
+        keys.add_columns(literal("attendance"), literal(seq, db.BigInteger), literal(now, db.BigInteger)),
+    ))
+
+
+def tombstone_athletes(conn, athlete_ids):
+    """
+    Tombstones for these athletes and their attendance rows under their
+    current team: call before they are deleted or move to another team.
+    """
+    tombstone_roll(conn, athlete_ids)
+    seq, now = next_change_seq(conn, Tombstone), now_ms()
+    conn.execute(insert(Tombstone).from_select(
+        ["row_id", "team_id", "table_name", "change_seq", "deleted_at"],
+        select(Athlete.id, Athlete.team_id, literal("athlete"),
+               literal(seq, db.BigInteger), literal(now, db.BigInteger))
+        .where(Athlete.id.in_(set(athlete_ids))),
+    ))
+
+
+@event.listens_for(db.session, "before_flush")
+def _stamp_changes(session, flush_context, instances):
+    """Stamp ORM writes and leave tombstones for ORM deletes."""
+    changed = [obj for obj in session.new if isinstance(obj, CHANGE_TRACKED)]
+    changed += [obj for obj in session.dirty
+                if isinstance(obj, CHANGE_TRACKED) and obj not in session.deleted
+                and session.is_modified(obj)]
+    deleted = [obj for obj in session.deleted if isinstance(obj, (Athlete, Attendance, Coach))]
+    if not changed and not deleted:
+        return
+
+    conn = session.connection()
+    seq = next_change_seq(conn, *{type(obj) for obj in changed}, *([Tombstone] if deleted else []))
+    now = now_ms()
+    for obj in changed:
+        obj.change_seq = seq
+    for obj in deleted:
+        if isinstance(obj, Attendance):
+            team_id = conn.execute(select(Athlete.team_id).where(Athlete.id == obj.athlete_id)).scalar()
+            session.add(Tombstone(table_name="attendance", athlete_id=obj.athlete_id, date=obj.date,
+                                  team_id=team_id, change_seq=seq, deleted_at=now))
+        else:
+            session.add(Tombstone(table_name=obj.__tablename__, row_id=obj.id,
+                                  team_id=obj.team_id, change_seq=seq, deleted_at=now))
+
+
+# ---------- Per-athlete season counters ----------
+#
+# athlete_season holds present/absent counts, last absence and the current
+# streak per athlete and season, so leaders and flagged read one row per
+# athlete. athlete_day_index holds running Present/Absent totals per practice
+# day, so any since/until count is two lookups per athlete.
+#
+# Any write that touches an athlete's roll calls roll_changed() inside the
+# same transaction: ORM writes through the flush hook below, bulk statements
+# by calling it themselves. A change on one day is applied as differences
+# (refresh_roll_day); `flask rebuild-stats` recomputes everything.
+
+from sqlalchemy import bindparam
+
+SEASON_START_MONTH = int(os.getenv("SEASON_START_MONTH", "7"))  # XC seasons start in summer
+
+
+def season_of(day):
+    """Season (its starting year) for an ISO day."""
+    d = pydt.date.fromisoformat(day)
+    return d.year if d.month >= SEASON_START_MONTH else d.year - 1
+
+
+def season_bounds(season):
+    """[first day, first day of the next season) as ISO strings."""
+    return (pydt.date(season, SEASON_START_MONTH, 1).isoformat(),
+            pydt.date(season + 1, SEASON_START_MONTH, 1).isoformat())
+
+
+def roll_rows(athlete_ids, since="", until=""):
+    """
+    (athlete_id, date, status) for these athletes ordered by athlete and day,
+    with the implicit Present days filled in under implicit-Present storage.
+    `until` is exclusive here; athlete_ids=None means everyone.
+    """
+    if implicit_present():
+        q = (
+            select(Athlete.id, PracticeDay.date,
+                   func.coalesce(Attendance.status, "Present"))
+            .select_from(Athlete)
+            .join(PracticeDay, practice_day_join(since))
+            .outerjoin(Attendance, and_(Attendance.athlete_id == Athlete.id,
+                                        Attendance.date == PracticeDay.date))
+            .order_by(Athlete.id, PracticeDay.date)
+        )
+        if athlete_ids is not None:
+            q = q.where(Athlete.id.in_(athlete_ids))
+        if until:
+            q = q.where(PracticeDay.date < until)
+        return q
+    q = (
+        select(Attendance.athlete_id, Attendance.date, Attendance.status)
+        .order_by(Attendance.athlete_id, Attendance.date)
+    )
+    if athlete_ids is not None:
+        q = q.where(Attendance.athlete_id.in_(athlete_ids))
+    if since:
+        q = q.where(Attendance.date >= since)
+    if until:
+        q = q.where(Attendance.date < until)
+    return q
+
+
+# Flag thresholds. Changing them takes effect as each athlete's roll changes;
+# run `flask rebuild-stats` to re-evaluate everyone at once.
+FLAG_RULES = {
+    "total": int(os.getenv("FLAG_TOTAL_ABSENCES", "5")),          # absences this season
+    "recent": int(os.getenv("FLAG_RECENT_ABSENCES", "3")),        # ... of the last K practices
+    "consecutive": int(os.getenv("FLAG_CONSECUTIVE_ABSENCES", "3")),
+}
+FLAG_RECENT_PRACTICES = int(os.getenv("FLAG_RECENT_PRACTICES", "5"))  # K
+
+
+def _season_counters(rows):
+    """Fold ordered (athlete_id, date, status) rows into athlete_season dicts."""
+    stats = {}
+    for aid, day, status in rows:
+        key = (aid, season_of(day))
+        st = stats.get(key)
+        if st is None:
+            st = stats[key] = {"athlete_id": aid, "season": key[1], "present_days": 0,
+                               "absent_days": 0, "last_absence": None, "current_streak": 0}
+        if status == "Absent":
+            st["absent_days"] += 1
+            st["last_absence"] = day
+            st["current_streak"] = 0
+        elif status == "Present":
+            st["present_days"] += 1
+            st["current_streak"] += 1
+    return list(stats.values())
+
+
+def _flag_values(rows):
+    """
+    Fold ordered (athlete_id, date, status) rows into athlete_flag dicts for
+    every FLAG_RULES rule met at the end of each athlete's season.
+    """
+    state = {}
+    for aid, day, status in rows:
+        if status not in ("Present", "Absent"):
+            continue
+        key = (aid, season_of(day))
+        st = state.get(key)
+        if st is None:
+            st = state[key] = {"total": 0, "consecutive": 0,
+                               "recent": deque(maxlen=FLAG_RECENT_PRACTICES)}
+        absent = status == "Absent"
+        st["total"] += absent
+        st["consecutive"] = st["consecutive"] + 1 if absent else 0
+        st["recent"].append(absent)
+
+    flags = []
+    for (aid, season), st in state.items():
+        values = {"total": st["total"], "recent": sum(st["recent"]),
+                  "consecutive": st["consecutive"]}
+        for rule, value in values.items():
+            if value and value >= FLAG_RULES[rule]:
+                flags.append({"athlete_id": aid, "season": season, "rule": rule, "value": value})
+    return flags
+
+
+def _write_flags(conn, athlete_ids, seasons, flags):
+    """
+    Bring these athletes' flags (all seasons, or the given ones) to `flags`,
+    keeping when each still-met flag was first raised. Writes only what changed.
+    """
+    tbl = AthleteFlag.__table__
+    scope = [tbl.c.athlete_id.in_(athlete_ids)]
+    if seasons:
+        scope.append(tbl.c.season.in_(seasons))
+    have = {
+        (aid, season, rule): (fid, value) for fid, aid, season, rule, value in conn.execute(
+            select(tbl.c.id, tbl.c.athlete_id, tbl.c.season, tbl.c.rule, tbl.c.value).where(*scope))
+    }
+    now = now_ms()
+    added, moved = [], []
+    for f in flags:
+        old = have.pop((f["athlete_id"], f["season"], f["rule"]), None)
+        if old is None:
+            added.append({**f, "raised_at": now})
+        elif old[1] != f["value"]:
+            moved.append({"b_id": old[0], "b_value": f["value"]})
+    if have:
+        conn.execute(tbl.delete().where(tbl.c.id.in_([fid for fid, _ in have.values()])))
+    if moved:
+        conn.execute(tbl.update().where(tbl.c.id == bindparam("b_id")).values(value=bindparam("b_value")),
+                     moved)
+    if added:
+        conn.execute(insert(tbl), added)
+
+
+def refresh_season_stats(conn, athlete_ids, seasons=None, chunk=500):
+    """
+    Recompute athlete_season and athlete_flag for these athletes (all
+    seasons, or just the given ones) on `conn`, so it commits or rolls back
+    with the caller.
+    """
+    tbl = AthleteSeason.__table__
+    athlete_ids = sorted(set(athlete_ids))
+    for i in range(0, len(athlete_ids), chunk):
+        ids = athlete_ids[i:i + chunk]
+        if seasons:
+            roll = []
+            for season in seasons:
+                roll += conn.execute(roll_rows(ids, *season_bounds(season))).all()
+            conn.execute(tbl.delete().where(tbl.c.athlete_id.in_(ids),
+                                            tbl.c.season.in_(seasons)))
+        else:
+            roll = conn.execute(roll_rows(ids)).all()
+            conn.execute(tbl.delete().where(tbl.c.athlete_id.in_(ids)))
+        rows = _season_counters(roll)
+        if rows:
+            conn.execute(insert(tbl), rows)
+        _write_flags(conn, ids, seasons, _flag_values(roll))
+
+
+def _totals_before(conn, athlete_ids, day):
+    """{athlete_id: [present_cum, absent_cum]} from each athlete's last index row before `day`."""
+    tbl = AthleteDayIndex.__table__
+    last = (
+        select(tbl.c.athlete_id, func.max(tbl.c.day).label("day"))
+        .where(tbl.c.athlete_id.in_(athlete_ids), tbl.c.day < day)
+        .group_by(tbl.c.athlete_id)
+        .subquery()
     )
+    return {
+        aid: [p, a] for aid, p, a in conn.execute(
+            select(tbl.c.athlete_id, tbl.c.present_cum, tbl.c.absent_cum)
+            .join(last, and_(last.c.athlete_id == tbl.c.athlete_id, last.c.day == tbl.c.day))
+        )
+    }
+
+
+def refresh_day_index(conn, athlete_ids, since="", chunk=500):
+    """
+    Recompute athlete_day_index for these athletes from `since` on. Rows
+    before `since` are untouched and seed the running totals, so editing a
+    past day only rewrites that athlete's days after it.
+    """
+    tbl = AthleteDayIndex.__table__
+    athlete_ids = sorted(set(athlete_ids))
+    for i in range(0, len(athlete_ids), chunk):
+        ids = athlete_ids[i:i + chunk]
+        base = {}
+        if since:
+            base = _totals_before(conn, ids, since)
+            conn.execute(tbl.delete().where(tbl.c.athlete_id.in_(ids), tbl.c.day >= since))
+        else:
+            conn.execute(tbl.delete().where(tbl.c.athlete_id.in_(ids)))
+
+        rows = []
+        for aid, day, status in conn.execute(roll_rows(ids, since)):
+            cum = base.setdefault(aid, [0, 0])
+            if status == "Present":
+                cum[0] += 1
+            elif status == "Absent":
+                cum[1] += 1
+            rows.append({"athlete_id": aid, "day": day,
+                         "present_cum": cum[0], "absent_cum": cum[1]})
+        if rows:
+            conn.execute(insert(tbl), rows)
+
+
+def refresh_roll_day(conn, athlete_ids, day, chunk=500):
+    """
+    Update the derived tables after these athletes' roll changed on `day`
+    alone, without recomputing anything. athlete_day_index still holds the
+    old marks, so comparing them with the day's roll gives +1/-1 for the
+    season counters and for the running totals from `day` on. Last
+    absence, streak and flags come from the season's index rows, read once.
+    """
+    tbl = AthleteDayIndex.__table__
+    season = season_of(day)
+    start, end = season_bounds(season)
+    next_day = (pydt.date.fromisoformat(day) + timedelta(days=1)).isoformat()
+    athlete_ids = sorted(set(athlete_ids))
+    for i in range(0, len(athlete_ids), chunk):
+        ids = athlete_ids[i:i + chunk]
+        now_marked = {aid: status for aid, _, status in conn.execute(roll_rows(ids, day, next_day))}
+
+        # the season's marks as recorded, read back off the running totals
+        base = _totals_before(conn, ids, start)
+        totals, marks, before_day = dict(base), {}, {}
+        for aid, d, p, a in conn.execute(
+                select(tbl.c.athlete_id, tbl.c.day, tbl.c.present_cum, tbl.c.absent_cum)
+                .where(tbl.c.athlete_id.in_(ids), tbl.c.day >= start, tbl.c.day < end)
+                .order_by(tbl.c.athlete_id, tbl.c.day)):
+            bp, ba = totals.get(aid, (0, 0))
+            marks.setdefault(aid, {})[d] = "Present" if p > bp else "Absent" if a > ba else None
+            if d < day:
+                before_day[aid] = (p, a)
+            totals[aid] = (p, a)
+
+        added, removed, shifts, changed = [], [], [], []
+        for aid in ids:
+            days = marks.setdefault(aid, {})
+            had, has = day in days, aid in now_marked
+            old, new = days.get(day), now_marked.get(aid)
+            if had == has and old == new:
+                continue
+            changed.append(aid)
+            if has and not had:
+                p, a = before_day.get(aid) or base.get(aid, (0, 0))
+                added.append({"athlete_id": aid, "day": day, "present_cum": p, "absent_cum": a})
+            elif had and not has:
+                removed.append(aid)
+            dp = (new == "Present") - (old == "Present")
+            da = (new == "Absent") - (old == "Absent")
+            if dp or da:
+                shifts.append({"b_id": aid, "b_dp": dp, "b_da": da})
+            if has:
+                days[day] = new
+            else:
+                del days[day]
+        if not changed:
+            continue
+
+        if removed:
+            conn.execute(tbl.delete().where(tbl.c.athlete_id.in_(removed), tbl.c.day == day))
+        if added:
+            conn.execute(insert(tbl), added)
+        if shifts:
+            conn.execute(
+                tbl.update().where(tbl.c.athlete_id == bindparam("b_id"), tbl.c.day >= day)
+                .values(present_cum=tbl.c.present_cum + bindparam("b_dp"),
+                        absent_cum=tbl.c.absent_cum + bindparam("b_da")),
+                shifts,
+            )
+
+        roll = [(aid, d, status) for aid in changed for d, status in sorted(marks[aid].items())]
+        deltas = {s["b_id"]: s for s in shifts}
+        rows = []
+        for st in _season_counters(roll):
+            delta = deltas.get(st["athlete_id"], {"b_dp": 0, "b_da": 0})
+            rows.append({**st, "b_dp": delta["b_dp"], "b_da": delta["b_da"]})
+        if rows:
+            stmt = dialect_insert(AthleteSeason)
+            conn.execute(stmt.on_conflict_do_update(
+                index_elements=["athlete_id", "season"],
+                set_={"present_days": AthleteSeason.present_days + bindparam("b_dp"),
+                      "absent_days": AthleteSeason.absent_days + bindparam("b_da"),
+                      "last_absence": stmt.excluded.last_absence,
+                      "current_streak": stmt.excluded.current_streak},
+            ), rows)
+        emptied = set(changed) - {r["athlete_id"] for r in rows}
+        if emptied:
+            conn.execute(AthleteSeason.__table__.delete().where(
+                AthleteSeason.athlete_id.in_(emptied), AthleteSeason.season == season))
+        _write_flags(conn, changed, [season], _flag_values(roll))
+
+
+def range_counts(since="", until=""):
+    """
+    (present_days, absent_days) column expressions for the Athlete in the
+    enclosing query, over an inclusive since/until range. Each is the running
+    total at the last indexed day <= until minus the one before since:
+    a couple of primary-key lookups per athlete, however long the range.
+    """
+    def total_at(col, bound, op):
+        q = select(col).where(AthleteDayIndex.athlete_id == Athlete.id)
+        if bound:
+            q = q.where(op(AthleteDayIndex.day, bound))
+        return func.coalesce(
+            q.order_by(AthleteDayIndex.day.desc()).limit(1).correlate(Athlete).scalar_subquery(), 0)
+
+    counts = []
+    for col in (AthleteDayIndex.present_cum, AthleteDayIndex.absent_cum):
+        hi = total_at(col, until, lambda c, b: c <= b)
+        lo = total_at(col, since, lambda c, b: c < b) if since else 0
+        counts.append(hi - lo)
+    return counts
+
+
+def roll_changed(conn, athlete_ids, day=None):
+    """
+    These athletes' roll changed on `day` (None: anywhere). Brings the
+    derived tables up to date on `conn`, inside the caller's transaction:
+    by difference for one day, by recomputing when it could be any day.
+    """
+    if not athlete_ids:
+        return
+    if day:
+        refresh_roll_day(conn, athlete_ids, day)
+    else:
+        refresh_season_stats(conn, athlete_ids)
+        refresh_day_index(conn, athlete_ids)
+    bump_roll_version(conn, conn.execute(
+        select(Athlete.team_id).where(Athlete.id.in_(set(athlete_ids))).distinct()
+    ).scalars().all())
+
+
+def team_roll_changed(conn, team_ids, day):
+    """A practice day was added for these teams (an implicit Present for everyone)."""
+    ids = conn.execute(select(Athlete.id).where(Athlete.team_id.in_(set(team_ids)))).scalars().all()
+    roll_changed(conn, ids, day)
+
+
+@event.listens_for(db.session, "after_flush")
+def _refresh_summaries_after_flush(session, flush_context):
+    by_day = {}
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        if isinstance(obj, Attendance):
+            by_day.setdefault(obj.date, set()).add(obj.athlete_id)
+    new_days = session.info.pop("new_practice_days", [])
+    if not by_day and not new_days:
+        return
+    conn = session.connection()
+    for team_id, day in new_days:
+        team_roll_changed(conn, [team_id], day)
+    for day, ids in by_day.items():
+        roll_changed(conn, ids, day)
 
 
+def rebuild_roll_summaries(chunk=500):
+    """Recompute athlete_season, athlete_flag and athlete_day_index for everyone from the roll."""
+    with db.engine.begin() as conn:
+        conn.execute(AthleteSeason.__table__.delete())
+        conn.execute(AthleteDayIndex.__table__.delete())
+        ids = conn.execute(select(Athlete.id)).scalars().all()
+        for i in range(0, len(ids), chunk):
+            roll_changed(conn, ids[i:i + chunk])
+    roll_matrix.invalidate()
+    print(f"Rebuilt roll summaries for {len(ids)} athlete(s).")
+
+
+def ensure_roll_summaries():
+    # First boot after adding a summary table: fill it once from the roll.
+    if Attendance.query.first() is None and PracticeDay.query.first() is None:
+        return
+    if AthleteSeason.query.first() is None or AthleteDayIndex.query.first() is None:
+        rebuild_roll_summaries()
+    elif AthleteFlag.query.first() is None and AthleteSeason.query.filter(
+            AthleteSeason.absent_days >= FLAG_RULES["total"]).first() is not None:
+        rebuild_roll_summaries()  # flags were added after the counters
 
 
+@app.cli.command("rebuild-stats")
+def rebuild_stats_command():
+    """Recompute the per-athlete season counters and day index from scratch."""
+    rebuild_roll_summaries()
 
-@app.route("/history", methods=["GET", "POST"])
-@login_required
-def history():
-    # All known dates (or today if none yet)
-    all_dates = [d[0] for d in db.session.query(Attendance.date)
-                 .distinct().order_by(Attendance.date.desc()).all()] or [datetime.datetime.today().isoformat()]
 
-    # Pull inputs from POST (form) or GET (link)
-    selected_date = (request.form.get("selected_date")
-                     or request.args.get("selected_date")
-                     or all_dates[0])
+# ---------- Conditional GET for pages built from the roll ----------
 
-    raw_team = request.form.get("team_id") or request.args.get("team_id")
+def bump_roll_version(conn, team_ids):
+    """Mark these teams' roll as changed (inside the caller's transaction)."""
+    rows = [{"team_id": t or 0, "version": 1} for t in sorted({t or 0 for t in team_ids})]
+    if not rows:
+        return
+    stmt = dialect_insert(RollVersion)
+    conn.execute(
+        stmt.on_conflict_do_update(index_elements=["team_id"],
+                                   set_={"version": RollVersion.version + 1}),
+        rows,
+    )
+
+
+def roll_etag(team_id=None):
+    """
+    ETag for this GET: the page, its arguments, the user, today's date and
+    the data version it reads (one team's, or every team's when None).
+    """
+    if team_id:
+        version = db.session.query(RollVersion.version).filter_by(team_id=team_id).scalar() or 0
+    else:
+        # the sum only grows, so any team's bump changes it
+        version = db.session.query(func.coalesce(func.sum(RollVersion.version), 0)).scalar()
+    raw = "|".join(str(p) for p in (request.endpoint, request.query_string.decode(),
+                                    current_user.get_id(), central_today(), version))
+    return hashlib.sha1(raw.encode()).hexdigest()[:24]
+
+
+def not_modified(etag):
+    """A 304 if the browser already has this version of the page, else None."""
+    if request.method == "GET" and request.if_none_match.contains(etag):
+        return tagged(Response(status=304), etag)
+    return None
+
+
+def tagged(resp, etag):
+    resp = make_response(resp)
+    resp.set_etag(etag)
+    resp.headers["Cache-Control"] = "private, no-cache"  # revalidate every time
+    return resp
+
+
+@app.route("/attendance", methods=["GET", "POST"])
+@login_required
+def attendance():
+    central = ZoneInfo("America/Chicago")
+    today = datetime.datetime.now(central).date().isoformat()
+
+    # Get team_id from querystring or form; normalize to int or None
+    raw_team_id = request.args.get("team_id") or request.form.get("team_id")
     try:
-        selected_team_id = int(raw_team) if raw_team else None
+        selected_team_id = int(raw_team_id) if raw_team_id else None
     except (TypeError, ValueError):
         selected_team_id = None
 
-    # Default to coach's team if nothing chosen
-    if selected_team_id is None and getattr(current_user, "team_id", None):
-        selected_team_id = current_user.team_id
+    # ---------- POST: toggle or save note (no unwanted flipping) ----------
+    if request.method == "POST":
+        athlete_id = request.form.get("athlete_id")
+        note = (request.form.get("note") or "").strip()
+        action = (request.form.get("action") or "toggle").strip()  # "toggle" or "save_note"
 
-    # Build query: everyone for the day, with left join to attendance
-    query = (
-        db.session.query(
-            Athlete.first_name,        # [0]
-            Athlete.last_name,         # [1]
-            Attendance.status,         # [2]
-            Attendance.notes           # [3]
-        )
-        .outerjoin(
-            Attendance,
-            (Attendance.athlete_id == Athlete.id) & (Attendance.date == selected_date)
-        )
-    )
+        aid = None
+        try:
+            aid = int(athlete_id) if athlete_id else None
+        except (TypeError, ValueError):
+            aid = None
+
+        if aid:
+            # should rarely need to create because you auto-create on GET, but be safe
+            record = get_roll_record(aid, today)
+            record.updated_at = now_ms()
+
+            if action == "toggle":
+                record.status = "Absent" if record.status == "Present" else "Present"
+                # also capture any note typed alongside the toggle
+                if note != (record.notes or ""):
+                    record.notes = note
+            elif action == "save_note":
+                # ONLY update the note; keep current status
+                if note != (record.notes or ""):
+                    record.notes = note
+
+            db.session.commit()
+
+        # Keep current team filter and jump back to the same athlete row
+        return redirect(url_for("attendance",
+                                team_id=selected_team_id,
+                                _anchor=f"athlete-{aid or ''}"))
+    # ----------------------------------------------------------------------
+
+    # ===== Auto-create Present rows on GET so green = saved in DB =====
+    materialize_roll(today, selected_team_id)
+    # =================================================================
+
+    # GET: fetch athletes (filtered if team selected)
     if selected_team_id:
-        query = query.filter(Athlete.team_id == selected_team_id)
+        athletes = (Athlete.query
+                    .filter_by(team_id=selected_team_id)
+                    .order_by(Athlete.last_name, Athlete.first_name)
+                    .all())
+    else:
+        athletes = (Athlete.query
+                    .order_by(Athlete.last_name, Athlete.first_name)
+                    .all())
 
-    history_data = query.order_by(Athlete.last_name, Athlete.first_name).all()
+    # Attendance & notes for today (TEAM-FILTER AWARE)
+    today_records = (
+        Attendance.query
+        .join(Athlete, Attendance.athlete_id == Athlete.id)
+        .filter(
+            Attendance.date == today,
+            (Athlete.team_id == selected_team_id) if selected_team_id else True
+        )
+        .all()
+    )
+    attendance_data = {r.athlete_id: r.status for r in today_records}
+    notes_data = {r.athlete_id: r.notes for r in today_records}
 
-    # Counts for Present / Absent / Unmarked
-    present_count = sum(1 for _, _, s, _ in history_data if s == "Present")
-    absent_count  = sum(1 for _, _, s, _ in history_data if s == "Absent")
-    unmarked_count = sum(1 for _, _, s, _ in history_data if s not in ("Present", "Absent"))
+    if implicit_present():
+        # only exceptions are stored, so count against the practice calendar
+        counts = roll_counts(today, selected_team_id)
+        present_count = counts["present"]
+        absent_count = counts["absent"]
+        unmarked_count = counts["unmarked"]
+    else:
+        present_count = sum(1 for s in attendance_data.values() if s == "Present")
+        absent_count = sum(1 for s in attendance_data.values() if s == "Absent")
+        unmarked_count = max(0, len(athletes) - len(attendance_data))
 
-    # IMPORTANT: pass teams as (id, name) tuples to match team[0]/team[1] in your template
-    teams = db.session.query(Team.id, Team.name).order_by(Team.name).all()
+    teams = Team.query.order_by(Team.name).all()
 
     return render_template(
-        "history.html",
-        dates=all_dates,
-        selected_date=selected_date,
+        "attendance.html",
+        athletes=athletes,
+        attendance=attendance_data,
+        notes=notes_data,
         teams=teams,
         selected_team_id=selected_team_id,
-        history_data=history_data,
+        date=today,
         present_count=present_count,
         absent_count=absent_count,
         unmarked_count=unmarked_count,
+        sync_max_ops=SYNC_MAX_OPS,
     )
 
-@app.route("/forgot", methods=["GET", "POST"])
-def forgot():
-    if request.method == "POST":
-        username = (request.form.get("username") or "").strip()
-        user = Coach.query.filter_by(username=username).first()
+from flask import jsonify, Response
+from zoneinfo import ZoneInfo
+import datetime as pydt  # (avoid name clash if you use `import datetime` elsewhere)
 
-        # Always respond the same (don’t leak which usernames exist)
-        if not user:
-            flash("If that user exists, we sent a reset link.", "success")
-            return redirect(url_for("login"))
+@app.route("/attendance/note", methods=["POST"])
+@login_required
+def attendance_note():
+    """AJAX: save today's note for an athlete without changing status."""
+    central = ZoneInfo("America/Chicago")
+    today = pydt.datetime.now(central).date().isoformat()
 
-        s = get_serializer()
-        token = s.dumps({"uid": user.id})
-        reset_url = url_for("reset_password_token", token=token, _external=True)
+    # Support JSON or form-encoded
+    data = request.get_json(silent=True) or request.form
+    aid_raw = (data.get("athlete_id") or "").strip()
+    note = (data.get("note") or "").strip()
 
-        # Try email if you wired it; otherwise log to console/Render logs
-        try:
-            from app import send_email_via_sendgrid  # if you added the helper earlier
-            ok, err = send_email_via_sendgrid(
-                getattr(user, "email", None),
-                "HP XC Password Reset",
-                f"Click to reset your password: <a href='{reset_url}'>{reset_url}</a>"
-            )
-        except Exception:
-            ok, err = (False, "missing_helper")
+    try:
+        aid = int(aid_raw)
+    except (TypeError, ValueError):
+        return jsonify({"ok": False, "error": "bad athlete_id"}), 400
 
-        if ok:
-            flash("We emailed you a reset link.", "success")
-        else:
-            print("🔐 Password reset link (fallback):", reset_url)
-            flash("Reset link created. Email not configured—link logged in server.", "success")
+    record = get_roll_record(aid, today)
+    record.notes = note or None
+    record.updated_at = now_ms()
+    db.session.commit()
+    return ("", 204)  # No Content
 
-        return redirect(url_for("login"))
 
-    return render_template("forgot.html")
+def _roll_count_query(day):
+    """(athletes, present, absent) for one day; callers filter or group it."""
+    cancelled = aliased(PracticeDay)
+    practicing = ~exists().where(
+        cancelled.team_id == Athlete.team_id,
+        cancelled.date == day,
+        cancelled.status == "cancelled",
+    )
+    if implicit_present():
+        # no row + a practice day for the athlete's team => Present
+        return (
+            db.session.query(
+                func.count(Athlete.id),
+                func.sum(case(
+                    (and_(PracticeDay.id.isnot(None),
+                          func.coalesce(Attendance.status, "Present") == "Present"), 1),
+                    else_=0)),
+                func.sum(case((Attendance.status == "Absent", 1), else_=0)),
+            )
+            .outerjoin(PracticeDay, and_(practice_day_join(), PracticeDay.date == day))
+            .outerjoin(
+                Attendance,
+                and_(Attendance.athlete_id == Athlete.id, Attendance.date == day)
+            )
+            .filter(practicing)
+        )
+
+    return (
+        db.session.query(
+            func.count(Athlete.id),
+            func.sum(case((Attendance.status == "Present", 1), else_=0)),
+            func.sum(case((Attendance.status == "Absent", 1), else_=0)),
+        )
+        .outerjoin(
+            Attendance,
+            and_(Attendance.athlete_id == Athlete.id, Attendance.date == day)
+        )
+        .filter(practicing)
+    )
+
+
+def _counts(total, present, absent):
+    present = present or 0
+    absent = absent or 0
+    return {
+        "present": present,
+        "absent": absent,
+        "unmarked": max(0, (total or 0) - present - absent),
+    }
+
+
+def roll_counts(day, team_id=None):
+    """
+    Present / Absent / Unmarked counts for one day in a single aggregate query.
+    Athletes whose team cancelled practice that day aren't counted at all.
+    """
+    q = _roll_count_query(day)
+    if team_id:
+        q = q.filter(Athlete.team_id == team_id)
+    return _counts(*q.one())
+
+
+def roll_counts_by_team(day):
+    """roll_counts for every team in one grouped query; the None key is all teams."""
+    rows = _roll_count_query(day).add_columns(Athlete.team_id).group_by(Athlete.team_id).all()
+    by_team = {team_id: _counts(total, present, absent) for total, present, absent, team_id in rows}
+    by_team[None] = _counts(*(sum(r[i] or 0 for r in rows) for i in range(3)))
+    return by_team
+
+
+def committed_roll_counts(day, team_id=None):
+    """
+    roll_counts for the response to a change this request just committed:
+    the counts its live events already carry (see _collect_roll_events),
+    or a fresh query when nothing changed.
+    """
+    counts = db.session.info.get("roll_counts", {}).get((team_id or None, day))
+    return counts if counts is not None else roll_counts(day, team_id)
+
+
+@app.route("/attendance/toggle", methods=["POST"])
+@login_required
+def attendance_toggle():
+    """AJAX: flip today's status for an athlete and return the new counts."""
+    central = ZoneInfo("America/Chicago")
+    today = pydt.datetime.now(central).date().isoformat()
+
+    # Support JSON or form-encoded
+    data = request.get_json(silent=True) or request.form
+    aid_raw = str(data.get("athlete_id") or "").strip()
+    team_raw = str(data.get("team_id") or "").strip()
+
+    try:
+        aid = int(aid_raw)
+    except (TypeError, ValueError):
+        return jsonify({"ok": False, "error": "bad athlete_id"}), 400
+    try:
+        team_id = int(team_raw) if team_raw else None
+    except (TypeError, ValueError):
+        team_id = None
+
+    # Optional idempotency key: a retried tap whose first attempt did land
+    # must not flip the status back.
+    key = str(data.get("key") or "").strip()[:64] or None
+    # A conflict is the same key landing from another request first, or
+    # another coach adding today's row first; start over once, which then
+    # sees that key or row (as /attendance/sync does).
+    for attempt in range(2):
+        try:
+            # before get_roll_record: this lookup's autoflush would drop its
+            # new Present row (implicit-Present mode) before the flip below
+            if key and db.session.get(SyncOp, key):
+                record = Attendance.query.filter_by(athlete_id=aid, date=today).first()
+                status = record.status if record else "Present"  # no row: implicit Present
+                break
+            record = get_roll_record(aid, today)
+            record.status = status = "Absent" if record.status == "Present" else "Present"
+            record.updated_at = now_ms()
+            if key:
+                db.session.add(SyncOp(key=key, applied_at=record.updated_at))
+            db.session.commit()
+            break
+        except IntegrityError:
+            db.session.rollback()
+            if attempt:
+                return jsonify({"ok": False, "error": "conflict, retry"}), 409
+
+    return jsonify({
+        "ok": True,
+        "athlete_id": aid,
+        "status": status,
+        "counts": committed_roll_counts(today, team_id),
+    })
+
+
+from sqlalchemy import tuple_
+
+SYNC_OPS = ("toggle", "set_status", "set_note")
+SYNC_KEY_TTL_MS = 14 * 24 * 3600 * 1000  # forget idempotency keys after two weeks
+SYNC_MAX_OPS = 500  # ops per /attendance/sync request; the page sends bigger queues in batches
+
+
+def _parse_sync_op(raw, today):
+    """Validate one queued operation; returns (op, error)."""
+    if not isinstance(raw, dict):
+        return None, "not an object"
+    key = str(raw.get("key") or "").strip()
+    if not key or len(key) > 64:
+        return None, "bad key"
+    kind = raw.get("op")
+    if kind not in SYNC_OPS:
+        return None, "bad op"
+    try:
+        aid = int(raw.get("athlete_id"))
+        ts = int(raw.get("ts"))
+    except (TypeError, ValueError):
+        return None, "bad athlete_id or ts"
+    day = str(raw.get("date") or today).strip()
+    try:
+        day = pydt.date.fromisoformat(day).isoformat()
+    except ValueError:
+        return None, "bad date"
+    status = raw.get("status")
+    if kind == "set_status" and status not in ("Present", "Absent"):
+        return None, "bad status"
+    note = (str(raw.get("note") or "")).strip()[:255]
+    return {"key": key, "op": kind, "athlete_id": aid, "date": day,
+            "ts": ts, "status": status, "note": note, "force": raw.get("force") is True}, None
+
+
+def _apply_sync_ops(ops):
+    """
+    Apply validated ops in ts order, last-write-wins per (athlete_id, date);
+    ts must already be on the server's clock (see attendance_sync). An op
+    older than the record's last write is a conflict: not applied and its
+    key not used up, so the client can send it again with "force".
+    Returns (applied_keys, skipped_keys, conflicts, touched_records). Does not commit.
+    """
+    keys = {op["key"] for op in ops}
+    seen = {k for (k,) in db.session.query(SyncOp.key).filter(SyncOp.key.in_(keys))}
+
+    pairs = {(op["athlete_id"], op["date"]) for op in ops}
+    records = {
+        (r.athlete_id, r.date): r
+        for r in Attendance.query.filter(
+            tuple_(Attendance.athlete_id, Attendance.date).in_(pairs)
+        )
+    } if pairs else {}
+
+    applied, skipped, conflicts = [], [], []
+    stamp = now_ms()
+    for op in sorted(ops, key=lambda o: o["ts"]):
+        if op["key"] in seen:
+            skipped.append(op["key"])
+            continue
+        seen.add(op["key"])
+
+        pair = (op["athlete_id"], op["date"])
+        rec = records.get(pair)
+        if rec is not None and rec.updated_at and op["ts"] < rec.updated_at and not op["force"]:
+            conflicts.append(op)  # something newer already won
+            continue
+        db.session.add(SyncOp(key=op["key"], applied_at=stamp))
+        if rec is None:
+            rec = Attendance(athlete_id=pair[0], date=pair[1], status="Present", notes=None)
+            db.session.add(rec)
+            records[pair] = rec
+
+        if op["op"] == "toggle":
+            rec.status = "Absent" if rec.status == "Present" else "Present"
+        elif op["op"] == "set_status":
+            rec.status = op["status"]
+        else:
+            rec.notes = op["note"] or None
+        rec.updated_at = max(op["ts"], rec.updated_at or 0) if op["force"] else op["ts"]
+        applied.append(op["key"])
+
+    touched = [records[p] for p in pairs if p in records]
+    return applied, skipped, conflicts, touched
+
+
+@app.route("/attendance/sync", methods=["POST"])
+@login_required
+def attendance_sync():
+    """
+    AJAX: replay a queue of offline operations in one transaction.
+      {"team_id": 1, "ops": [{"key": "...", "op": "toggle", "athlete_id": 7,
+                               "date": "2025-09-02", "ts": 1725290000000}, ...]}
+    op is toggle | set_status (needs "status") | set_note (needs "note"); ts is
+    the client clock in ms, and "sent_at" (the client clock when it sent the
+    request) puts those on the server's clock, whatever the phone's is off by.
+    Keys already applied are skipped, so a replayed queue can't flip a status
+    twice. An op older than the record's last write comes back in
+    "conflicts" with the record as it stands; sending it again with
+    "force": true applies it anyway. At most SYNC_MAX_OPS ops per request
+    (413 above that). Under implicit-Present storage, ops for a day that isn't
+    on the athlete's team calendar are rejected (see off_calendar).
+    Returns the merged rows and today's counts.
+    """
+    central = ZoneInfo("America/Chicago")
+    today = pydt.datetime.now(central).date().isoformat()
+
+    data = request.get_json(silent=True) or {}
+    raw_ops = data.get("ops")
+    if not isinstance(raw_ops, list):
+        return jsonify({"ok": False, "error": "ops must be a list"}), 400
+    if len(raw_ops) > SYNC_MAX_OPS:
+        return jsonify({"ok": False, "error": f"at most {SYNC_MAX_OPS} ops per request",
+                        "max_ops": SYNC_MAX_OPS}), 413
+    received = now_ms()
+    try:
+        skew = received - int(data["sent_at"])  # how far behind the client's clock is
+    except (KeyError, TypeError, ValueError):
+        skew = 0
+    try:
+        team_id = int(data.get("team_id")) if data.get("team_id") else None
+    except (TypeError, ValueError):
+        team_id = None
+
+    ops, rejected = [], []
+    for raw in raw_ops:
+        op, err = _parse_sync_op(raw, today)
+        if err:
+            key = raw.get("key") if isinstance(raw, dict) else None
+            rejected.append({"key": key, "error": err})
+        else:
+            op["ts"] = min(op["ts"] + skew, received)  # server clock, never in the future
+            ops.append(op)
+    if implicit_present():
+        if any(op["date"] == today for op in ops):
+            materialize_roll(today, team_id)  # as the page these were queued on did
+        off = off_calendar((op["athlete_id"], op["date"]) for op in ops)
+        rejected += [{"key": op["key"], "error": "not a practice day"}
+                     for op in ops if (op["athlete_id"], op["date"]) in off]
+        ops = [op for op in ops if (op["athlete_id"], op["date"]) not in off]
+
+    # A concurrent replay of the same queue can race us to the SyncOp keys;
+    # on conflict start over, which then sees those keys as already applied.
+    for attempt in range(2):
+        try:
+            applied, skipped, conflicts, touched = _apply_sync_ops(ops)
+            SyncOp.query.filter(SyncOp.applied_at < now_ms() - SYNC_KEY_TTL_MS)\
+                .delete(synchronize_session=False)
+            db.session.commit()
+            break
+        except IntegrityError:
+            db.session.rollback()
+            if attempt:
+                return jsonify({"ok": False, "error": "conflict, retry"}), 409
+
+    current = {(r.athlete_id, r.date): r for r in touched}
+    return jsonify({
+        "ok": True,
+        "applied": applied,
+        "skipped": skipped,
+        "conflicts": [  # the op, and the record that beat it
+            {"key": op["key"], "op": op["op"], "athlete_id": op["athlete_id"], "date": op["date"],
+             "status": current[op["athlete_id"], op["date"]].status,
+             "note": current[op["athlete_id"], op["date"]].notes or ""}
+            for op in conflicts
+        ],
+        "rejected": rejected,
+        "records": [
+            {"athlete_id": r.athlete_id, "date": r.date, "status": r.status, "note": r.notes or ""}
+            for r in touched
+        ],
+        "counts": committed_roll_counts(today, team_id),
+    })
+
+
+# ---------- Live roll updates (Server-Sent Events) ----------
+#
+# Every committed change to an attendance row becomes an event
+# {athlete_id, team_id, date, status, note}. The session hooks below collect
+# them at flush time and hand them to the configured backend on commit; the
+# backend gets them to every worker's RollBroadcaster, which feeds the
+# /attendance/stream responses subscribed to that (team_id, date).
+#
+#   ROLL_EVENTS_BACKEND=memory  (default) single process, no extra moving parts
+#   ROLL_EVENTS_BACKEND=db      events go through the roll_event table and each
+#                               worker polls it; works with several gunicorn
+#                               workers and no extra services
+#
+# Streams hold a connection open, so run gunicorn with threaded workers
+# (see Procfile). Other fan-out transports (Redis, LISTEN/NOTIFY) plug in by
+# adding a class with stage/publish/start to ROLL_EVENT_BACKENDS.
+
+import json
+import queue
+import threading
+from sqlalchemy import insert
+from sqlalchemy import inspect as sa_inspect
+
+
+class RollEvent(db.Model):
+    """Roll changes waiting to be picked up by other workers (db backend only)."""
+    id = db.Column(db.Integer, primary_key=True)
+    created_at = db.Column(db.BigInteger, nullable=False)  # ms since epoch
+    payload = db.Column(db.Text, nullable=False)           # JSON event
+
+
+class RollBroadcaster:
+    """In-process fan-out of roll events to this worker's SSE streams."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subs = set()
+
+    def subscribe(self, team_id, day):
+        sub = (team_id, day, queue.Queue(maxsize=256))
+        with self._lock:
+            self._subs.add(sub)
+        return sub
+
+    def unsubscribe(self, sub):
+        with self._lock:
+            self._subs.discard(sub)
+
+    def publish(self, events):
+        with self._lock:
+            subs = list(self._subs)
+        for team_id, day, q in subs:
+            for ev in events:
+                if ev["date"] != day or (team_id and ev["team_id"] != team_id):
+                    continue
+                try:
+                    q.put_nowait(ev)
+                except queue.Full:
+                    pass  # a stalled client just misses updates until it reconnects
+
+
+class MemoryRollBackend:
+    """Single worker: events go straight to the local broadcaster."""
+
+    def __init__(self, broadcaster):
+        self.broadcaster = broadcaster
+
+    def start(self, engine):
+        pass
+
+    def stage(self, connection, events):
+        pass
+
+    def publish(self, events):
+        self.broadcaster.publish(events)
+
+
+class DatabaseRollBackend:
+    """
+    Several workers: events are written to roll_event inside the same
+    transaction as the change, and a thread per worker polls for new rows.
+    """
+    poll_seconds = 1.0
+    keep_ms = 10 * 60 * 1000
+
+    def __init__(self, broadcaster):
+        self.broadcaster = broadcaster
+        self._started = False
+        self._lock = threading.Lock()
+
+    def start(self, engine):
+        with self._lock:
+            if self._started:
+                return
+            self._started = True
+        t = threading.Thread(target=self._poll, args=(engine,), daemon=True)
+        t.start()
+
+    def stage(self, connection, events):
+        stamp = now_ms()
+        connection.execute(
+            insert(RollEvent.__table__),
+            [{"created_at": stamp, "payload": json.dumps(ev)} for ev in events],
+        )
+
+    def publish(self, events):
+        pass  # the poller delivers them, ours included
+
+    def _poll(self, engine):
+        tbl = RollEvent.__table__
+        with engine.connect() as conn:
+            last_id = conn.execute(select(func.coalesce(func.max(tbl.c.id), 0))).scalar()
+        last_prune = 0
+        while True:
+            time.sleep(self.poll_seconds)
+            try:
+                with engine.begin() as conn:
+                    rows = conn.execute(
+                        select(tbl.c.id, tbl.c.payload)
+                        .where(tbl.c.id > last_id)
+                        .order_by(tbl.c.id)
+                    ).all()
+                    if time.monotonic() - last_prune > 60:
+                        conn.execute(tbl.delete().where(tbl.c.created_at < now_ms() - self.keep_ms))
+                        last_prune = time.monotonic()
+            except Exception as e:
+                print("Roll event poll failed:", e)
+                continue
+            if rows:
+                last_id = rows[-1][0]
+                self.broadcaster.publish([json.loads(p) for _, p in rows])
+
+
+ROLL_EVENT_BACKENDS = {
+    "memory": MemoryRollBackend,
+    "db": DatabaseRollBackend,
+}
+
+roll_broadcaster = RollBroadcaster()
+roll_backend = ROLL_EVENT_BACKENDS[os.getenv("ROLL_EVENTS_BACKEND", "memory")](roll_broadcaster)
+
+
+@event.listens_for(db.session, "after_flush")
+def _collect_roll_events(session, flush_context):
+    changed = []
+    for obj in session.deleted:
+        # implicit-Present mode drops a row once it is a plain Present again
+        if isinstance(obj, Attendance):
+            changed.append(obj)
+    for obj in list(session.new) + list(session.dirty):
+        if not isinstance(obj, Attendance):
+            continue
+        state = sa_inspect(obj)
+        if obj in session.new or state.attrs.status.history.has_changes() \
+                or state.attrs.notes.history.has_changes():
+            changed.append(obj)
+    if not changed:
+        return
+
+    conn = session.connection()
+    ids = {obj.athlete_id for obj in changed}
+    teams = dict(conn.execute(
+        select(Athlete.id, Athlete.team_id).where(Athlete.id.in_(ids))
+    ).all())
+    events = [{
+        "athlete_id": obj.athlete_id,
+        "team_id": teams.get(obj.athlete_id),
+        "date": obj.date,
+        "status": "Present" if obj in session.deleted else obj.status,
+        "note": "" if obj in session.deleted else (obj.notes or ""),
+    } for obj in changed]
+    # the counts pages show, as of this flush: one grouped query per day
+    # gives the event's team and, summed, all teams
+    by_day = {day: roll_counts_by_team(day) for day in {ev["date"] for ev in events}}
+    for ev in events:
+        ev["counts"] = by_day[ev["date"]].get(ev["team_id"]) or _counts(0, 0, 0)
+        ev["counts_all"] = by_day[ev["date"]][None]
+    roll_backend.stage(conn, events)
+    session.info.setdefault("roll_events", []).extend(stamp_events(conn, events))
+    # kept past the commit for the toggle/sync response (committed_roll_counts)
+    session.info.setdefault("roll_counts_pending", {}).update(
+        ((team_id, day), counts) for day, by_team in by_day.items() for team_id, counts in by_team.items())
+
+
+@event.listens_for(db.session, "after_commit")
+def _publish_roll_events(session):
+    session.info["roll_counts"] = session.info.pop("roll_counts_pending", {})
+    events = session.info.pop("roll_events", None)
+    if events:
+        roll_backend.publish(events)
+        roll_matrix.apply(events)
+
+
+@event.listens_for(db.session, "after_rollback")
+def _drop_roll_events(session):
+    session.info.pop("roll_events", None)
+    session.info.pop("roll_counts_pending", None)
+
+
+ROLL_STREAM_MAX_SECONDS = 300  # EventSource reconnects on its own; frees the thread now and then
+
+@app.route("/attendance/stream")
+@login_required
+def attendance_stream():
+    """SSE: push today's status and note changes for a team (or all teams)."""
+    central = ZoneInfo("America/Chicago")
+    today = pydt.datetime.now(central).date().isoformat()
+
+    raw_team_id = request.args.get("team_id")
+    try:
+        team_id = int(raw_team_id) if raw_team_id else None
+    except (TypeError, ValueError):
+        team_id = None
+
+    roll_backend.start(db.engine)
+    sub = roll_broadcaster.subscribe(team_id, today)
+
+    def gen():
+        try:
+            yield "retry: 3000\n\n"
+            deadline = time.monotonic() + ROLL_STREAM_MAX_SECONDS
+            while time.monotonic() < deadline:
+                try:
+                    ev = sub[2].get(timeout=15)
+                except queue.Empty:
+                    yield ": keep-alive\n\n"
+                    continue
+                yield f"event: roll\ndata: {json.dumps(ev)}\n\n"
+        finally:
+            roll_broadcaster.unsubscribe(sub)
+
+    resp = Response(gen(), mimetype="text/event-stream")
+    resp.headers["Cache-Control"] = "no-cache"
+    resp.headers["X-Accel-Buffering"] = "no"  # don't let a proxy buffer the stream
+    return resp
+
+
+# ---------- Season status matrix (shared by all workers) ----------
+import re
+import numpy as np
+
+RollMatrixView = namedtuple(
+    "RollMatrixView", "season athlete_ids team_ids days planes generation seq built_seq row_of col_of")
+
+# file: magic | generation (u64, bumped by every patch) | seq (u64, newest change_seq
+# in it) | header length (u64) | JSON header (with built_seq) | planes
+ROLL_MATRIX_MAGIC = b"ROLLMAT3"
+POPCOUNT = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+
+class RollMatrix:
+    """
+    One file per season holding two bit planes, Present and Absent, of
+    athletes × practice days (unmarked is neither bit). Every worker maps it
+    read-only, so they all share the same pages; 500 athletes × 200 days is
+    about 25 KB. Built lazily from the roll, patched in place as marks are
+    committed, and dropped for a rebuild when the roster or calendar moves.
+
+    A matrix remembers the change_seq its build read the roll at (built_seq)
+    and the newest one patched in since (seq): a commit's marks that the
+    build already saw are not patched again, and one that arrives after a
+    newer patch has landed drops the matrix rather than overwrite it.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        self._views = {}  # season -> ((st_dev, st_ino), view)
+        self._streaks = {}  # season -> (view, generation, streak_stats())
+        self._lock = threading.Lock()
+
+    def _path(self, season):
+        return os.path.join(self.directory, f"roll-{season}.bin")
+
+    @contextmanager
+    def _file_lock(self, season):
+        # serializes build / patch / drop across workers
+        os.makedirs(self.directory, exist_ok=True)
+        with open(self._path(season) + ".lock", "a") as fh:
+            fcntl.flock(fh, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(fh, fcntl.LOCK_UN)
+
+    def _build(self, season):
+        since, until = season_bounds(season)
+        # a transaction of its own, begun now: the request's may have read
+        # the roll before a commit whose patch found no file to apply to
+        with db.engine.connect() as conn:
+            built_seq = conn.execute(select(ChangeSeq.seq).where(ChangeSeq.id == 1)).scalar() or 0
+            athletes = conn.execute(select(Athlete.id, Athlete.team_id).order_by(Athlete.id)).all()
+            rows = conn.execute(roll_rows(None, since, until)).all()
+        days = sorted({day for _, day, _ in rows})
+        row_of = {aid: i for i, (aid, _) in enumerate(athletes)}
+        col_of = {day: j for j, day in enumerate(days)}
+
+        bits = np.zeros((2, len(athletes), len(days)), dtype=bool)
+        for aid, day, status in rows:
+            i = row_of.get(aid)
+            if i is None:
+                continue
+            if status == "Present":
+                bits[0, i, col_of[day]] = True
+            elif status == "Absent":
+                bits[1, i, col_of[day]] = True
+
+        header = json.dumps({
+            "season": season,
+            "athlete_ids": [aid for aid, _ in athletes],
+            "team_ids": [tid for _, tid in athletes],
+            "days": days,
+            "built_seq": built_seq,
+        }).encode()
+        header += b" " * (-len(header) % 8)  # keep the planes 8-byte aligned
+        path = self._path(season)
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, "wb") as fh:
+            fh.write(ROLL_MATRIX_MAGIC)
+            fh.write((0).to_bytes(8, "little"))
+            fh.write(built_seq.to_bytes(8, "little"))
+            fh.write(len(header).to_bytes(8, "little"))
+            fh.write(header)
+            fh.write(np.packbits(bits, axis=-1).tobytes())
+        os.replace(tmp, path)
+
+    def _open(self, path, mode="r"):
+        with open(path, "rb") as fh:
+            if fh.read(8) != ROLL_MATRIX_MAGIC:
+                raise ValueError(f"{path} is not a roll matrix")
+            fh.seek(24)
+            size = int.from_bytes(fh.read(8), "little")
+            meta = json.loads(fh.read(size))
+        generation = np.memmap(path, dtype=np.uint64, mode=mode, offset=8, shape=(1,))
+        seq = np.memmap(path, dtype=np.uint64, mode=mode, offset=16, shape=(1,))
+        shape = (2, len(meta["athlete_ids"]), (len(meta["days"]) + 7) // 8)
+        if 0 in shape:
+            planes = np.zeros(shape, dtype=np.uint8)  # nothing to map
+        else:
+            planes = np.memmap(path, dtype=np.uint8, mode=mode, offset=32 + size, shape=shape)
+        return RollMatrixView(
+            meta["season"], meta["athlete_ids"], meta["team_ids"], meta["days"], planes, generation,
+            seq, meta["built_seq"],
+            {aid: i for i, aid in enumerate(meta["athlete_ids"])},
+            {day: j for j, day in enumerate(meta["days"])},
+        )
+
+    def load(self, season):
+        """The season's matrix, building it first if no worker has yet."""
+        path = self._path(season)
+        for _ in range(3):
+            if not os.path.exists(path):
+                with self._file_lock(season):
+                    if not os.path.exists(path):
+                        self._build(season)
+            try:
+                st = os.stat(path)
+                key = (st.st_dev, st.st_ino)
+                with self._lock:
+                    cached = self._views.get(season)
+                if cached and cached[0] == key:
+                    return cached[1]
+                view = self._open(path)
+            except FileNotFoundError:
+                continue  # dropped between the check and the open
+            except ValueError:
+                self.invalidate(season)  # left over from an older layout
+                continue
+            with self._lock:
+                self._views[season] = (key, view)
+            return view
+        raise RuntimeError(f"roll matrix for {season} keeps disappearing")
+
+    def apply(self, events):
+        """
+        Patch committed marks into the matrices already on disk. Events carry
+        their commit's change_seq ("seq", see stamp_events): marks the build
+        already read are skipped. A mark older than one already patched in,
+        or for an athlete or day the matrix doesn't have, drops it; the next
+        read rebuilds.
+        """
+        by_season = {}
+        for ev in events:
+            by_season.setdefault(season_of(ev["date"]), []).append(ev)
+        for season, evs in by_season.items():
+            path = self._path(season)
+            with self._file_lock(season):
+                # checked under the lock: a build in progress finishes first
+                if not os.path.exists(path):
+                    continue
+                try:
+                    view = self._open(path, mode="r+")
+                except (FileNotFoundError, ValueError):
+                    continue
+                evs = [ev for ev in evs if ev.get("seq") is None or ev["seq"] > view.built_seq]
+                if not evs:
+                    continue
+                newest = max((ev["seq"] for ev in evs if ev.get("seq") is not None), default=None)
+                cells = [(view.row_of.get(ev["athlete_id"]), view.col_of.get(ev["date"]), ev["status"])
+                         for ev in evs]
+                if any(i is None or j is None for i, j, _ in cells) \
+                        or (newest is not None and newest < int(view.seq[0])):
+                    os.unlink(path)
+                    continue
+                planes = view.planes
+                for i, j, status in cells:
+                    byte, mask = j >> 3, np.uint8(0x80 >> (j & 7))
+                    for plane, bit_status in ((0, "Present"), (1, "Absent")):
+                        if status == bit_status:
+                            planes[plane, i, byte] |= mask
+                        else:
+                            planes[plane, i, byte] &= ~mask
+                planes.flush()
+                if newest is not None:
+                    view.seq[0] = newest
+                    view.seq.flush()
+                view.generation[0] += 1
+                view.generation.flush()
+
+    def streaks(self, view):
+        """streak_stats() for a loaded matrix, recomputed only when it changed."""
+        season, generation = view.season, int(view.generation[0])
+        with self._lock:
+            cached = self._streaks.get(season)
+        if cached and cached[0] is view and cached[1] == generation:
+            return cached[2]
+        stats = streak_stats(view)
+        with self._lock:
+            self._streaks[season] = (view, generation, stats)
+        return stats
+
+    def invalidate(self, season=None):
+        """Drop a season's matrix (every season when None); rebuilt on next read."""
+        if season is None:
+            try:
+                names = os.listdir(self.directory)
+            except FileNotFoundError:
+                return
+            seasons = [int(m.group(1)) for m in map(re.compile(r"roll-(\d+)\.bin$").match, names) if m]
+        else:
+            seasons = [season]
+        for s in seasons:
+            with self._file_lock(s):
+                try:
+                    os.unlink(self._path(s))
+                except FileNotFoundError:
+                    pass
+
+
+roll_matrix = RollMatrix(os.getenv("ROLL_MATRIX_DIR") or os.path.join(app.instance_path, "roll-matrix"))
+
+
+def matrix_counts(view):
+    """(present, absent) days per matrix row: a popcount over each bit plane."""
+    counts = POPCOUNT[view.planes].sum(axis=-1, dtype=np.int64)
+    return counts[0], counts[1]
+
+
+def _run_lengths(hit, miss):
+    """
+    Per cell, how many `hit` days in a row end there. A `miss` day resets the
+    run; days that are neither (unmarked) are skipped over.
+    """
+    cum = np.cumsum(hit, axis=-1, dtype=np.int32)
+    last_miss = np.maximum.accumulate(np.where(miss, np.arange(hit.shape[-1]), -1), axis=-1)
+    before = np.take_along_axis(cum, np.maximum(last_miss, 0), axis=-1)
+    return cum - np.where(last_miss >= 0, before, 0)
+
+
+def streak_stats(view):
+    """
+    Current and longest Present and Absent runs for every matrix row at once,
+    over the season's practice days.
+    """
+    n, n_days = len(view.athlete_ids), len(view.days)
+    if not n_days:
+        zeros = np.zeros(n, dtype=np.int32)
+        return {"present_current": zeros, "present_longest": zeros,
+                "absent_current": zeros, "absent_longest": zeros}
+    present = np.unpackbits(view.planes[0], axis=-1, count=n_days).astype(bool)
+    absent = np.unpackbits(view.planes[1], axis=-1, count=n_days).astype(bool)
+    present_runs = _run_lengths(present, absent)
+    absent_runs = _run_lengths(absent, present)
+    return {
+        "present_current": present_runs[:, -1],
+        "present_longest": present_runs.max(axis=-1),
+        "absent_current": absent_runs[:, -1],
+        "absent_longest": absent_runs.max(axis=-1),
+    }
+
+
+def matrix_team_totals(view, present, absent):
+    """[(team_id, athletes, present, absent)] summed per team with bincount."""
+    teams = np.array([t or 0 for t in view.team_ids], dtype=np.int64)
+    if not len(teams):
+        return []
+    keys, idx = np.unique(teams, return_inverse=True)
+    athletes = np.bincount(idx)
+    p = np.bincount(idx, weights=present)
+    a = np.bincount(idx, weights=absent)
+    return [(int(k) or None, int(athletes[i]), int(p[i]), int(a[i])) for i, k in enumerate(keys)]
+
+
+@app.route("/season_report", methods=["GET"])
+@login_required
+def season_report():
+    """
+    A season at a glance, read from the shared status matrix: team totals,
+    then each athlete's Present/Absent days, rate and current streak, with
+    anyone at or over the absence threshold flagged.
+    """
+    current = season_of(central_today())
+    season = request.args.get("season", type=int) or current
+    min_abs = request.args.get("min_absences", type=int)
+    if min_abs is None:
+        min_abs = 5
+
+    raw_team = request.args.get("team_id")
+    try:
+        selected_team_id = int(raw_team) if raw_team else None
+    except (TypeError, ValueError):
+        selected_team_id = None
+    if selected_team_id is None and getattr(current_user, "username", "") != "admin":
+        selected_team_id = current_user.team_id
+
+    view = roll_matrix.load(season)
+    present, absent = matrix_counts(view)
+    streaks = roll_matrix.streaks(view)["present_current"]
+
+    team_names = dict(db.session.query(Team.id, Team.name).all())
+    team_rows = [{
+        "name": team_names.get(tid, "—"),
+        "athletes": n,
+        "present": p,
+        "absent": a,
+        "rate": (p / (p + a) * 100) if p + a else None,
+    } for tid, n, p, a in matrix_team_totals(view, present, absent)]
+    team_rows.sort(key=lambda t: t["name"])
+
+    q = db.session.query(Athlete.id, Athlete.first_name, Athlete.last_name, Athlete.team_id)
+    if selected_team_id:
+        q = q.filter(Athlete.team_id == selected_team_id)
+    athletes = []
+    for aid, first, last, tid in q.all():
+        i = view.row_of.get(aid)
+        p, a, s = (int(present[i]), int(absent[i]), int(streaks[i])) if i is not None else (0, 0, 0)
+        athletes.append({
+            "first_name": first,
+            "last_name": last,
+            "team_name": team_names.get(tid, "—"),
+            "present": p,
+            "absent": a,
+            "rate": (p / (p + a) * 100) if p + a else None,
+            "streak": s,
+            "flagged": a >= min_abs,
+        })
+    athletes.sort(key=lambda r: (-r["present"], r["last_name"], r["first_name"]))
+
+    first_day = min(filter(None, [
+        db.session.query(func.min(Attendance.date)).scalar(),
+        db.session.query(func.min(PracticeDay.date)).filter(PracticeDay.status == "held").scalar(),
+    ]), default=None)
+    seasons = list(range(current, (season_of(first_day) if first_day else current) - 1, -1))
+    if season not in seasons:
+        seasons.append(season)
+
+    return render_template(
+        "season_report.html",
+        season=season,
+        seasons=seasons,
+        teams=sorted(team_names.items(), key=lambda t: t[1]),
+        selected_team_id=selected_team_id,
+        min_absences=min_abs,
+        total_days=len(view.days),
+        team_rows=team_rows,
+        athletes=athletes,
+    )
+
+
+def _range_leaders(team_id, since, until, limit):
+    """attendance_leaders() for a since/until range, from the day index."""
+    present, _ = range_counts(since, until)
+    present_count = present.label("present_days")
+    q = (
+        db.session.query(
+            Athlete.id,
+            Athlete.first_name,
+            Athlete.last_name,
+            Team.name.label("team_name"),
+            present_count
+        )
+        .join(Team, Team.id == Athlete.team_id, isouter=True)
+    )
+    if team_id:
+        q = q.filter(Athlete.team_id == team_id)
+    return (
+        q.order_by(present_count.desc(), Athlete.last_name, Athlete.first_name)
+         .limit(limit)
+         .all()
+    )
+
+
+def _season_stats_leaders(team_id, limit):
+    """attendance_leaders() over all time, read from the athlete_season counters."""
+    present_count = func.coalesce(func.sum(AthleteSeason.present_days), 0).label("present_days")
+    q = (
+        db.session.query(
+            Athlete.id,
+            Athlete.first_name,
+            Athlete.last_name,
+            Team.name.label("team_name"),
+            present_count
+        )
+        .join(Team, Team.id == Athlete.team_id, isouter=True)
+        .outerjoin(AthleteSeason, AthleteSeason.athlete_id == Athlete.id)
+    )
+    if team_id:
+        q = q.filter(Athlete.team_id == team_id)
+    return (
+        q.group_by(Athlete.id, Athlete.first_name, Athlete.last_name, Team.name)
+         .order_by(present_count.desc(), Athlete.last_name, Athlete.first_name)
+         .limit(limit)
+         .all()
+    )
+
+
+def _tracked_days(team_id, since, until):
+    """How many practice days a range has, for the leaders percentages."""
+    days_q = db.session.query(func.count(func.distinct(PracticeDay.date)))\
+        .filter(PracticeDay.status == "held")
+    if since:
+        days_q = days_q.filter(PracticeDay.date >= since)
+    if until:
+        days_q = days_q.filter(PracticeDay.date <= until)
+    if team_id:
+        days_q = days_q.filter(PracticeDay.team_id == team_id)
+    return days_q.scalar() or 0
+
+
+@app.route("/attendance_leaders", methods=["GET"])
+@login_required
+def attendance_leaders():
+    """
+    Ranks athletes by number of Present days in an optional date range and/or team.
+    - Default: coach sees their own team; admin sees all unless team chosen.
+    - Shows athletes with 0 present days too.
+    - rank_by=streak ranks by current Present streak in the season of `until`.
+    """
+    # Inputs
+    since = parse_day(request.args.get("since"))   # YYYY-MM-DD
+    until = parse_day(request.args.get("until"))
+    limit = request.args.get("limit", type=int) or 50
+    rank_by = "streak" if request.args.get("rank_by") == "streak" else "present"
+
+    raw_team = request.args.get("team_id")
+    try:
+        selected_team_id = int(raw_team) if raw_team else None
+    except (TypeError, ValueError):
+        selected_team_id = None
+
+    # Default to coach’s team if not admin and none chosen
+    if selected_team_id is None and getattr(current_user, "username", "") != "admin":
+        selected_team_id = current_user.team_id
+
+    etag = roll_etag(selected_team_id)
+    cached = not_modified(etag)
+    if cached:
+        return cached
+
+    # ranking by streak needs everyone's counts, then re-sorts
+    query_limit = None if rank_by == "streak" else limit
+    if not since and not until:
+        # whole history: one counters row per athlete and season
+        leaders = _season_stats_leaders(selected_team_id, query_limit)
+    else:
+        # any range: two day-index lookups per athlete
+        leaders = _range_leaders(selected_team_id, since, until, query_limit)
+
+    # Streaks come from the season's status matrix, all athletes at once
+    streak_season = season_of(until or central_today())
+    view = roll_matrix.load(streak_season)
+    runs = roll_matrix.streaks(view)
+    streaks = {}
+    for a in leaders:
+        i = view.row_of.get(a.id)
+        streaks[a.id] = (int(runs["present_current"][i]), int(runs["present_longest"][i])) \
+            if i is not None else (0, 0)
+    if rank_by == "streak":
+        leaders = sorted(leaders, key=lambda a: (-streaks[a.id][0], -streaks[a.id][1],
+                                                 a.last_name, a.first_name))[:limit]
+
+    # Also compute how many practice days exist in this range (for context/percent)
+    total_days = _tracked_days(selected_team_id, since, until)
+
+    teams = db.session.query(Team.id, Team.name).order_by(Team.name).all()
+
+    return tagged(render_template(
+        "leaders.html",
+        leaders=leaders,
+        teams=teams,
+        selected_team_id=selected_team_id,
+        since=since,
+        until=until,
+        total_days=total_days,
+        limit=limit,
+        rank_by=rank_by,
+        streaks=streaks,
+        streak_season=streak_season,
+    ), etag)
+
+
+
+
+
+# ---------- Practice calendar ----------
+
+def plan_practice_days(team_id, days):
+    """Put days on a team's schedule as planned; days already there are left alone."""
+    if not days:
+        return 0
+    rows = db.session.execute(
+        dialect_insert(PracticeDay)
+        .on_conflict_do_nothing(index_elements=["team_id", "date"])
+        .returning(PracticeDay.id),
+        [{"team_id": team_id, "date": d, "status": "planned"} for d in days],
+    ).all()
+    if rows:
+        bump_roll_version(db.session.connection(), [team_id])  # the calendar page reads these
+    db.session.commit()
+    return len(rows)
+
+
+def cancel_practice_day(team_id, day):
+    """
+    Call off a team's practice on `day`. Refused (False) once anyone on the
+    team has an Absent or a note for that day; the automatic Present rows
+    the roll page created are removed.
+    """
+    team_athletes = select(Athlete.id).where(Athlete.team_id == team_id)
+    marked = db.session.query(exists().where(
+        Attendance.athlete_id.in_(team_athletes),
+        Attendance.date == day,
+        or_(Attendance.status != "Present", func.coalesce(Attendance.notes, "") != ""),
+    )).scalar()
+    if marked:
+        return False
+
+    conn = db.session.connection()
+    tombstone_roll(conn, conn.execute(team_athletes).scalars().all(), day)
+    conn.execute(Attendance.__table__.delete().where(
+        Attendance.athlete_id.in_(team_athletes), Attendance.date == day))
+    conn.execute(
+        dialect_insert(PracticeDay)
+        .values(team_id=team_id, date=day, status="cancelled")
+        .on_conflict_do_update(index_elements=["team_id", "date"], set_={"status": "cancelled"})
+    )
+    roll_changed(conn, conn.execute(team_athletes).scalars().all(), day)
+    db.session.commit()
+    roll_matrix.invalidate(season_of(day))
+    return True
+
+
+def unschedule_practice_day(team_id, day):
+    """Take a planned or cancelled day off the calendar (held days stay)."""
+    n = PracticeDay.query.filter(
+        PracticeDay.team_id == team_id,
+        PracticeDay.date == day,
+        PracticeDay.status.in_(["planned", "cancelled"]),
+    ).delete(synchronize_session=False)
+    if n:
+        bump_roll_version(db.session.connection(), [team_id])
+    db.session.commit()
+    return n
+
+
+@app.route("/practice_days", methods=["GET", "POST"])
+@login_required
+def practice_days():
+    """
+    A team's practice calendar for a season: plan days ahead (one date or
+    a weekly pattern over a range), cancel a day, or take one off again.
+    """
+    raw_team = request.values.get("team_id")
+    try:
+        team_id = int(raw_team) if raw_team else None
+    except (TypeError, ValueError):
+        team_id = None
+    if team_id is None:
+        team_id = getattr(current_user, "team_id", None)
+    if getattr(current_user, "username", "") != "admin" and current_user.team_id:
+        team_id = current_user.team_id  # coaches manage their own team
+    if team_id is None:
+        first = db.session.query(Team.id).order_by(Team.name).first()
+        team_id = first[0] if first else None
+
+    season = request.values.get("season", type=int) or season_of(central_today())
+
+    if request.method == "POST" and team_id:
+        action = request.form.get("action")
+        day = parse_day(request.form.get("date"))
+        if action == "plan" and day:
+            through = parse_day(request.form.get("through")) or day
+            weekdays = {int(w) for w in request.form.getlist("weekday") if w.isdigit()}
+            start = pydt.date.fromisoformat(day)
+            days = [(start + timedelta(n)).isoformat()
+                    for n in range((pydt.date.fromisoformat(through) - start).days + 1)]
+            if through != day and weekdays:
+                days = [d for d in days if pydt.date.fromisoformat(d).weekday() in weekdays]
+            n = plan_practice_days(team_id, days[:400])
+            flash(f"Planned {n} practice day(s).", "success")
+        elif action == "cancel" and day:
+            if cancel_practice_day(team_id, day):
+                flash(f"Practice on {day} cancelled.", "success")
+            else:
+                flash(f"{day} already has absences or notes; clear them before cancelling.", "error")
+        elif action == "remove" and day:
+            if unschedule_practice_day(team_id, day):
+                flash(f"{day} taken off the calendar.", "success")
+        else:
+            flash("Pick a date.", "error")
+        return redirect(url_for("practice_days", team_id=team_id, season=season))
+
+    since, until = season_bounds(season)
+    rows = (
+        db.session.query(PracticeDay.date, PracticeDay.status)
+        .filter(PracticeDay.team_id == team_id, PracticeDay.date >= since, PracticeDay.date < until)
+        .order_by(PracticeDay.date)
+        .all()
+    ) if team_id else []
+    days = [{"date": d, "status": st, "weekday": pydt.date.fromisoformat(d).strftime("%a")}
+            for d, st in rows]
+    counts = {st: sum(1 for d in days if d["status"] == st) for st in ("held", "planned", "cancelled")}
+
+    if getattr(current_user, "username", "") == "admin":
+        teams = Team.query.order_by(Team.name).all()
+    else:
+        teams = Team.query.filter(Team.id == current_user.team_id).all()
+
+    return render_template(
+        "practice_days.html",
+        days=days,
+        counts=counts,
+        teams=teams,
+        selected_team_id=team_id,
+        season=season,
+        today=central_today(),
+    )
+
+
+@app.route("/history", methods=["GET", "POST"])
+@login_required
+def history():
+    raw_team = request.form.get("team_id") or request.args.get("team_id")
+    try:
+        selected_team_id = int(raw_team) if raw_team else None
+    except (TypeError, ValueError):
+        selected_team_id = None
+
+    # Default to coach's team if nothing chosen
+    if selected_team_id is None and getattr(current_user, "team_id", None):
+        selected_team_id = current_user.team_id
+
+    # Nothing changed since the browser's copy: skip every query below
+    etag = roll_etag(selected_team_id)
+    cached = not_modified(etag)
+    if cached:
+        return cached
+
+    # Practice days held (the chosen team's, matching the ETag's scope; or today if none yet)
+    dates_q = db.session.query(PracticeDay.date).filter(PracticeDay.status == "held")
+    if selected_team_id:
+        dates_q = dates_q.filter(PracticeDay.team_id == selected_team_id)
+    all_dates = [d[0] for d in dates_q.distinct().order_by(PracticeDay.date.desc()).all()] \
+        or [central_today()]
+
+    # Pull inputs from POST (form) or GET (link)
+    selected_date = (parse_day(request.form.get("selected_date")
+                               or request.args.get("selected_date"))
+                     or all_dates[0])
+
+    # Build query: everyone for the day, with left join to attendance
+    query = (
+        db.session.query(
+            Athlete.first_name,        # [0]
+            Athlete.last_name,         # [1]
+            Attendance.status,         # [2]
+            Attendance.notes           # [3]
+        )
+        .outerjoin(
+            Attendance,
+            (Attendance.athlete_id == Athlete.id) & (Attendance.date == selected_date)
+        )
+    )
+    if implicit_present():
+        # no row on one of the team's practice days => Present
+        query = (
+            db.session.query(
+                Athlete.first_name,
+                Athlete.last_name,
+                func.coalesce(
+                    Attendance.status,
+                    case((PracticeDay.id.isnot(None), "Present"), else_=None)
+                ),
+                Attendance.notes
+            )
+            .outerjoin(
+                Attendance,
+                (Attendance.athlete_id == Athlete.id) & (Attendance.date == selected_date)
+            )
+            .outerjoin(
+                PracticeDay,
+                and_(practice_day_join(), PracticeDay.date == selected_date)
+            )
+        )
+    if selected_team_id:
+        query = query.filter(Athlete.team_id == selected_team_id)
+
+    history_data = query.order_by(Athlete.last_name, Athlete.first_name).all()
+
+    # Counts for Present / Absent / Unmarked
+    present_count = sum(1 for _, _, s, _ in history_data if s == "Present")
+    absent_count  = sum(1 for _, _, s, _ in history_data if s == "Absent")
+    unmarked_count = sum(1 for _, _, s, _ in history_data if s not in ("Present", "Absent"))
+
+    # IMPORTANT: pass teams as (id, name) tuples to match team[0]/team[1] in your template
+    teams = db.session.query(Team.id, Team.name).order_by(Team.name).all()
+
+    return tagged(render_template(
+        "history.html",
+        dates=all_dates,
+        selected_date=selected_date,
+        teams=teams,
+        selected_team_id=selected_team_id,
+        history_data=history_data,
+        present_count=present_count,
+        absent_count=absent_count,
+        unmarked_count=unmarked_count,
+    ), etag)
+
+GRID_MAX_DAYS = 92  # a quarter of columns at most
+
+@app.route("/attendance_grid", methods=["GET"])
+@login_required
+def attendance_grid():
+    """
+    Athletes × practice days for one team over a date range (the current
+    month by default), pivoted in one query per page of athletes. Pages are
+    keyset cursors on (last name, first name, id), so page 20 costs the same
+    as page 1.
+    """
+    raw_team = request.args.get("team_id")
+    try:
+        team_id = int(raw_team) if raw_team else None
+    except (TypeError, ValueError):
+        team_id = None
+    if team_id is None:
+        team_id = getattr(current_user, "team_id", None)
+    if team_id is None:
+        first = db.session.query(Team.id).order_by(Team.name).first()
+        team_id = first[0] if first else None
+
+    today = pydt.date.fromisoformat(central_today())
+    since = parse_day(request.args.get("since")) or today.replace(day=1).isoformat()
+    if not parse_day(request.args.get("until")):
+        start = pydt.date.fromisoformat(since)
+        next_month = (start.replace(day=28) + timedelta(days=4)).replace(day=1)
+        until = (next_month - timedelta(days=1)).isoformat()
+    else:
+        until = parse_day(request.args.get("until"))
+    if until < since:
+        since, until = until, since
+    limit = min(max(request.args.get("limit", type=int) or 50, 1), 200)
+
+    # the columns: the team's practice days in range
+    days = [d for (d,) in db.session.query(PracticeDay.date).filter(
+        PracticeDay.team_id == team_id,
+        PracticeDay.status == "held",
+        PracticeDay.date >= since,
+        PracticeDay.date <= until,
+    ).order_by(PracticeDay.date).limit(GRID_MAX_DAYS)]
+
+    # one status + one note column per day
+    cols = []
+    for i, d in enumerate(days):
+        status = func.max(case((Attendance.date == d, Attendance.status)))
+        if implicit_present():
+            on_roster = or_(Athlete.active_since.is_(None), Athlete.active_since <= d)
+            status = func.coalesce(status, case((on_roster, "Present")))
+        cols.append(status.label(f"s{i}"))
+        cols.append(func.max(case((Attendance.date == d, Attendance.notes))).label(f"n{i}"))
+
+    q = (
+        select(Athlete.id, Athlete.first_name, Athlete.last_name, *cols)
+        .outerjoin(Attendance, and_(
+            Attendance.athlete_id == Athlete.id,
+            Attendance.date >= since,
+            Attendance.date <= until,
+        ))
+        .where(Athlete.team_id == team_id)
+        .group_by(Athlete.id, Athlete.first_name, Athlete.last_name, Athlete.active_since)
+        .order_by(Athlete.last_name, Athlete.first_name, Athlete.id)
+        .limit(limit + 1)
+    )
+    after_id = request.args.get("after_id", type=int)
+    if after_id:
+        q = q.where(tuple_(Athlete.last_name, Athlete.first_name, Athlete.id) > tuple_(
+            literal(request.args.get("after_last", "")),
+            literal(request.args.get("after_first", "")),
+            literal(after_id),
+        ))
+    result = db.session.execute(q).all() if team_id else []
+
+    rows = [{
+        "id": r.id,
+        "name": f"{r.first_name} {r.last_name}",
+        "cells": [(r[3 + 2 * i], r[4 + 2 * i]) for i in range(len(days))],
+    } for r in result[:limit]]
+
+    next_args = None
+    if len(result) > limit:
+        last = result[limit - 1]
+        next_args = dict(team_id=team_id, since=since, until=until, limit=limit,
+                         after_last=last.last_name, after_first=last.first_name, after_id=last.id)
+
+    if getattr(current_user, "username", "") == "admin":
+        teams = Team.query.order_by(Team.name).all()
+    else:
+        teams = Team.query.filter(Team.id == current_user.team_id).all()
+
+    return render_template(
+        "attendance_grid.html",
+        teams=teams,
+        selected_team_id=team_id,
+        since=since,
+        until=until,
+        limit=limit,
+        days=[(d, pydt.date.fromisoformat(d).strftime("%a"), d[5:].replace("-", "/")) for d in days],
+        rows=rows,
+        next_args=next_args,
+        paged=bool(after_id),
+    )
+
+
+@app.route("/forgot", methods=["GET", "POST"])
+def forgot():
+    if request.method == "POST":
+        username = (request.form.get("username") or "").strip()
+        user = Coach.query.filter_by(username=username).first()
+
+        # Always respond the same (don’t leak which usernames exist)
+        if not user:
+            flash("If that user exists, we sent a reset link.", "success")
+            return redirect(url_for("login"))
+
+        s = get_serializer()
+        token = s.dumps({"uid": user.id})
+        reset_url = url_for("reset_password_token", token=token, _external=True)
+
+        # Try email if you wired it; otherwise log to console/Render logs
+        try:
+            from app import send_email_via_sendgrid  # if you added the helper earlier
+            ok, err = send_email_via_sendgrid(
+                getattr(user, "email", None),
+                "HP XC Password Reset",
+                f"Click to reset your password: <a href='{reset_url}'>{reset_url}</a>"
+            )
+        except Exception:
+            ok, err = (False, "missing_helper")
+
+        if ok:
+            flash("We emailed you a reset link.", "success")
+        else:
+            print("🔐 Password reset link (fallback):", reset_url)
+            flash("Reset link created. Email not configured—link logged in server.", "success")
+
+        return redirect(url_for("login"))
+
+    return render_template("forgot.html")
+
+
+@app.route("/reset/<token>", methods=["GET", "POST"])
+def reset_password_token(token):
+    s = get_serializer()
+    try:
+        data = s.loads(token, max_age=3600)  # 1 hour validity
+    except SignatureExpired:
+        flash("Reset link expired. Please try again.", "error")
+        return redirect(url_for("forgot"))
+    except BadSignature:
+        flash("Invalid reset link.", "error")
+        return redirect(url_for("forgot"))
+
+    user = Coach.query.get(data.get("uid"))
+    if not user:
+        flash("User not found.", "error")
+        return redirect(url_for("forgot"))
+
+    if request.method == "POST":
+        new_pw = (request.form.get("password") or "").strip()
+        confirm = (request.form.get("confirm") or "").strip()
+        if len(new_pw) < 8:
+            flash("Password must be at least 8 characters.", "error")
+            return redirect(request.url)
+        if new_pw != confirm:
+            flash("Passwords do not match.", "error")
+            return redirect(request.url)
+
+        user.password = generate_password_hash(new_pw)
+        db.session.commit()
+        flash("Password updated. You can log in now.", "success")
+        return redirect(url_for("login"))
+
+    return render_template("reset_password_token.html")
+
+
+
+@app.route("/add_coach", methods=["GET", "POST"])
+@login_required
+def add_coach():
+    teams = Team.query.order_by(Team.name).all()
+    message = None
+    if request.method == "POST":
+        name = request.form["name"]
+        username = request.form["username"]
+        password = request.form["password"]
+        team_id = request.form.get("team_id") or None
+        hashed_password = generate_password_hash(password)
+        try:
+            new_coach = Coach(name=name, username=username, password=hashed_password, team_id=int(team_id) if team_id else None)
+            db.session.add(new_coach)
+            db.session.commit()
+            message = "Coach added successfully."
+        except Exception as e:
+            db.session.rollback()
+            message = f"Error: {str(e)}"
+    return render_template("add_coach.html", teams=teams, message=message)
+
+import csv
+from io import TextIOWrapper
+
+from sqlalchemy import func
+from sqlalchemy.exc import IntegrityError, SQLAlchemyError
+
+IMPORT_CHUNK_ROWS = 500  # athletes per multi-row INSERT
+
+
+# CSV header (lower-cased, spaces as underscores) -> parse_roster_row field
+ROSTER_HEADERS = {
+    "first": "first_name", "firstname": "first_name",
+    "last": "last_name", "lastname": "last_name",
+    "team": "team_name", "team_name": "team_name",
+}
+
+
+def csv_rows(f, headers=ROSTER_HEADERS):
+    """
+    Rows of an uploaded CSV as dicts keyed by the field names in `headers`
+    (roster files: parse_roster_row's, for both the first_name/last_name/
+    team_name export format and the First,Last,Grade,Gender,Team sheet);
+    blank lines and repeats of the header line are skipped.
+    """
+    reader = csv.reader(f)
+    header = [h.strip() for h in next(reader, [])]
+    keys = [headers.get(h.lower().replace(" ", "_"), h.lower().replace(" ", "_")) for h in header]
+    for rec in reader:
+        if not rec or [c.strip() for c in rec] == header:
+            continue
+        yield dict(zip(keys, rec))
+
+
+def parse_roster_row(row, teams_by_name, teams_by_id):
+    """
+    (duplicate key, athlete values, team given but unknown) for a roster CSV
+    row; the key is (lower first, lower last, team_id), None without both names.
+    """
+    fn = (row.get("first_name") or "").strip()
+    ln = (row.get("last_name") or "").strip()
+    if not fn or not ln:
+        return None, None, False
+
+    # Resolve team; an unknown one imports with no team
+    team_val = (row.get("team_name") or row.get("team_id") or "").strip()
+    team = None
+    if team_val:
+        if team_val.isdigit():
+            team = teams_by_id.get(int(team_val))
+        else:
+            team = teams_by_name.get(team_val)
+    team_id = team.id if team else None
+
+    # Optional fields
+    grade_raw = (row.get("grade") or "").strip()
+    try:
+        grade = int(grade_raw) if grade_raw != "" else None
+    except ValueError:
+        grade = None
+    gender = (row.get("gender") or "").strip() or None
+
+    values = {"first_name": fn, "last_name": ln, "grade": grade, "gender": gender, "team_id": team_id}
+    return (fn.lower(), ln.lower(), team_id), values, bool(team_val and not team)
+
+
+class RosterImport:
+    """
+    Adds roster CSV rows as athletes in batches. Existing (first, last, team)
+    keys are read once up front, duplicates are dropped in memory, and each
+    batch is one multi-row INSERT ... ON CONFLICT DO NOTHING in a savepoint,
+    so a failing batch never takes earlier ones with it.
+    """
+    chunk_rows = IMPORT_CHUNK_ROWS
+
+    def __init__(self, check_duplicates=True):
+        all_teams = Team.query.all()
+        self.teams_by_name = {(t.name or "").strip(): t for t in all_teams}
+        self.teams_by_id = {int(t.id): t for t in all_teams}
+        self.existing = set()  # same key the ux_athlete_name_team index enforces
+        self.similar = DuplicateIndex() if check_duplicates else None  # near-miss names
+        for aid, fn, ln, team_id in db.session.query(
+                Athlete.id, Athlete.first_name, Athlete.last_name, Athlete.team_id):
+            self.existing.add((fn.lower(), ln.lower(), team_id))
+            if self.similar is not None:
+                self.similar.add(aid, fn, ln, team_id)
+        self.seen = set()  # in-file duplicate guard
+        self.pending = []
+        self.added = 0
+        self.possible_dupes = 0
+        self.skipped_missing_names = 0
+        self.skipped_unknown_team = 0
+        self.skipped_infile_dupes = 0
+        self.skipped_db_dupes = 0
+        self.failed = 0
+
+    def _parse(self, row):
+        return parse_roster_row(row, self.teams_by_name, self.teams_by_id)
+
+    def remember(self, row):
+        """A row an earlier run already handled: only its in-file duplicate key matters."""
+        key = self._parse(row)[0]
+        if key:
+            self.seen.add(key)
+
+    def add(self, row):
+        key, values, unknown_team = self._parse(row)
+        if key is None:
+            self.skipped_missing_names += 1
+            return
+        if unknown_team:
+            self.skipped_unknown_team += 1
+
+        if key in self.seen:
+            self.skipped_infile_dupes += 1
+            return
+        self.seen.add(key)
+        if key in self.existing:
+            self.skipped_db_dupes += 1
+            return
+
+        if self.similar is not None:
+            if self.similar.any_match(values["first_name"], values["last_name"]):
+                self.possible_dupes += 1
+            self.similar.add(("file", key), values["first_name"], values["last_name"], values["team_id"])
+        self.pending.append(values)
+        if len(self.pending) >= self.chunk_rows:
+            self.flush()
+
+    def flush(self):
+        rows, self.pending = self.pending, []
+        if not rows:
+            return
+        stamp = {"active_since": central_today(), "change_seq": next_change_seq(db.session.connection(), Athlete)}
+        added, failed = self._insert([{**r, **stamp} for r in rows])
+        # a conflict here is a name the case-folded preload missed (or a concurrent import)
+        self.skipped_db_dupes += len(rows) - added - failed
+        self.added += added
+        self.failed += failed
+
+    def _insert(self, rows):
+        """Insert one batch; (rows added, rows that failed)."""
+        stmt = dialect_insert(Athlete.__table__).on_conflict_do_nothing().returning(Athlete.id)
+        failed = 0
+        try:
+            with db.session.begin_nested():
+                added = len(db.session.connection().execute(stmt, rows).all())
+        except SQLAlchemyError:
+            # find the bad row(s) one at a time, keeping the rest
+            added = 0
+            for r in rows:
+                try:
+                    with db.session.begin_nested():
+                        added += len(db.session.connection().execute(stmt, [r]).all())
+                except SQLAlchemyError:
+                    failed += 1
+        return added, failed
+
+    def finish(self):
+        """Flush the last batch and mark the roster changed (caller commits)."""
+        self.flush()
+        if self.added:
+            bump_roll_version(db.session.connection(), [None, *self.teams_by_id])
+
+    COUNTS = ("added", "skipped_missing_names", "skipped_unknown_team",
+              "skipped_infile_dupes", "skipped_db_dupes", "failed", "possible_dupes")
+
+    def counts(self):
+        return {k: getattr(self, k) for k in self.COUNTS}
+
+    def restore(self, counts):
+        for k in self.COUNTS:
+            setattr(self, k, counts.get(k, 0))
+
+    def summary(self):
+        return self.describe(self.counts())
+
+    @staticmethod
+    def describe(counts):
+        c = {k: counts.get(k, 0) for k in RosterImport.COUNTS}
+        bits = [f"Imported {c['added']} athletes."]
+        if c["skipped_missing_names"]:
+            bits.append(f"Skipped {c['skipped_missing_names']} missing name(s).")
+        if c["skipped_unknown_team"]:
+            bits.append(f"{c['skipped_unknown_team']} row(s) had unknown team.")
+        if c["skipped_infile_dupes"]:
+            bits.append(f"Skipped {c['skipped_infile_dupes']} duplicate row(s) in file.")
+        if c["skipped_db_dupes"]:
+            bits.append(f"Skipped {c['skipped_db_dupes']} already on roster.")
+        if c["failed"]:
+            bits.append(f"{c['failed']} row(s) could not be added.")
+        if c["possible_dupes"]:
+            bits.append(f"{c['possible_dupes']} name(s) look like another athlete; check Possible duplicates.")
+        return " ".join(bits)
+
+
+@app.route("/import_csv", methods=["GET", "POST"])
+@login_required
+def import_csv():
+    """
+    POST spools a roster CSV (or .csv.gz) and queues it as a background
+    ImportJob (see ImportRunner), or with mode=preview shows what it would
+    add and change (see diff_roster); GET shows recent imports and their progress.
+    """
+    wants_json = request.accept_mimetypes.best_match(["text/html", "application/json"]) == "application/json"
+    if request.method == "POST":
+        try:
+            file = request.files.get("file")
+            if not file or not getattr(file, "filename", ""):
+                flash("No file uploaded.", "error")
+                return redirect(url_for("import_csv"))
+
+            if request.form.get("mode") == "preview":
+                token, diff = preview_roster_upload(file)
+                teams = dict(db.session.query(Team.id, Team.name).all())
+                return render_template("import_preview.html", token=token, diff=diff,
+                                       suspects=similar_to_adds(diff.adds),
+                                       teams=teams, filename=file.filename)
+
+            job = submit_import_job(file)
+            if wants_json:
+                return jsonify(import_job_json(job)), 202
+            flash(f"Importing {job.filename}; progress is below.", "success")
+            return redirect(url_for("import_csv"))
+
+        except Exception as e:
+            db.session.rollback()
+            print("❌ CSV import failed:", e)
+            flash(f"Import failed: {e}", "error")
+            return redirect(url_for("import_csv"))
+
+    jobs = [import_job_json(j) for j in ImportJob.query.order_by(ImportJob.created_at.desc()).limit(10)]
+    busy = any(j["status"] in ("queued", "running") for j in jobs)
+    return render_template("import_csv.html", jobs=jobs, busy=busy)
+
+
+import csv, io, zipfile, datetime
+from flask import Response, abort, stream_with_context
+from functools import wraps
+
+# If you don't already have this:
+def admin_required(f):
+    @wraps(f)
+    def w(*a, **kw):
+        if getattr(current_user, "username", "") != "admin":
+            abort(403)
+        return f(*a, **kw)
+    return w
+
+EXPORT_CHUNK_ROWS = 1000   # rows fetched per round trip and written per response chunk
+
+def _stream_rows(rows):
+    """Iterate a query in yield_per batches (server-side cursor where the driver has one)."""
+    if hasattr(rows, "yield_per"):
+        return rows.yield_per(EXPORT_CHUNK_ROWS)
+    return rows
+
+def _csv_chunks(rows, headers):
+    """Yield CSV text a batch of rows at a time, reusing one small buffer."""
+    si = io.StringIO()
+    w = csv.writer(si)
+    w.writerow(headers)
+    for i, r in enumerate(_stream_rows(rows), 1):
+        w.writerow(r)
+        if i % EXPORT_CHUNK_ROWS == 0:
+            yield si.getvalue()
+            si.seek(0)
+            si.truncate()
+    yield si.getvalue()
+
+def _csv_response(rows, headers, filename_base, version=None):
+    """Stream a CSV download; rows may be a query (fetched in batches) or a list."""
+    ts = datetime.datetime.now().strftime("%Y%m%d-%H%M%S")
+    # No Content-Length, so the body goes out with chunked transfer encoding.
+    resp = Response(stream_with_context(_csv_chunks(rows, headers)), mimetype="text/csv; charset=utf-8")
+    resp.headers["Content-Disposition"] = f"attachment; filename={filename_base}-{ts}.csv"
+    if version is not None:
+        resp.headers["X-Export-Version"] = str(version)
+    return resp
+
+def _implicit_present_export_query(team_id, since, until):
+    """Attendance export rows with the implicit Present days filled back in."""
+    q = (db.session.query(
+            Attendance.id,
+            Athlete.id.label("athlete_id"),
+            Athlete.first_name,
+            Athlete.last_name,
+            Athlete.team_id,
+            Team.name.label("team_name"),
+            PracticeDay.date,
+            func.coalesce(Attendance.status, "Present").label("status"),
+            Attendance.notes,
+        )
+        .select_from(Athlete)
+        .join(PracticeDay, practice_day_join(since, until))
+        .outerjoin(Attendance, and_(Attendance.athlete_id == Athlete.id,
+                                    Attendance.date == PracticeDay.date))
+        .join(Team, Team.id == Athlete.team_id, isouter=True)
+    )
+    if team_id:
+        q = q.filter(Athlete.team_id == team_id)
+    return q.order_by(PracticeDay.date.desc(), Athlete.last_name, Athlete.first_name)
+
+def _attendance_export_query(team_id, since, until):
+    """Attendance export rows, newest day first."""
+    if implicit_present():
+        return _implicit_present_export_query(team_id, since, until)
+    q = (db.session.query(
+            Attendance.id,
+            Attendance.athlete_id,
+            Athlete.first_name,
+            Athlete.last_name,
+            Athlete.team_id,
+            Team.name.label("team_name"),
+            Attendance.date,
+            Attendance.status,
+            Attendance.notes,
+        )
+        .join(Athlete, Athlete.id == Attendance.athlete_id)
+        .join(Team, Team.id == Athlete.team_id, isouter=True)
+    )
+    if team_id:
+        q = q.filter(Athlete.team_id == team_id)
+    if since:
+        q = q.filter(Attendance.date >= since)
+    if until:
+        q = q.filter(Attendance.date <= until)
+    return q.order_by(Attendance.date.desc(), Athlete.last_name, Athlete.first_name)
+
+EXPORT_COLUMNS = {
+    "teams": ["id","name"],
+    "athletes": ["id","first_name","last_name","grade","gender","team_id","team_name"],
+    "attendance": ["id","athlete_id","first_name","last_name","team_id","team_name","date","status","notes"],
+    "coaches": ["id","name","username","email","team_id","team_name"],  # no password hashes
+}
+
+def _export_query(table, team_id, since, until):
+    """Rows of one export table, in EXPORT_COLUMNS order."""
+    if table == "teams":
+        return db.session.query(Team.id, Team.name).order_by(Team.id)
+
+    if table == "athletes":
+        q = (db.session.query(
+                Athlete.id,
+                Athlete.first_name,
+                Athlete.last_name,
+                Athlete.grade,
+                Athlete.gender,
+                Athlete.team_id,
+                Team.name.label("team_name"),
+            )
+            .join(Team, Team.id == Athlete.team_id, isouter=True)
+            .order_by(Athlete.last_name, Athlete.first_name))
+        if team_id:
+            q = q.filter(Athlete.team_id == team_id)
+        return q
+
+    if table == "attendance":
+        return _attendance_export_query(team_id, since, until)
+
+    q = (db.session.query(
+            Coach.id, Coach.name, Coach.username, Coach.email, Coach.team_id, Team.name.label("team_name")
+        )
+        .join(Team, Team.id == Coach.team_id, isouter=True)
+        .order_by(Coach.name))
+    if team_id:
+        q = q.filter(Coach.team_id == team_id)
+    return q
+
+def _delta_rows(table, team_id, since, until, after, upto):
+    """
+    Export rows of `table` stamped in (after, upto], led by "upsert", then
+    the rows deleted in that window, led by "delete" with only their key
+    (id, or athlete_id + date for attendance) and team filled in. A deleted
+    key that is back in the export by now is left out.
+    """
+    def window(col):
+        return and_(col > after, col <= upto)
+
+    q = _export_query(table, team_id, since, until)
+    if table == "athletes":
+        q = q.filter(window(Athlete.change_seq))
+        current = select(Athlete.id).where(Athlete.id == Tombstone.row_id)
+        gone = db.session.query(Tombstone.row_id.label("id"), Tombstone.team_id)\
+            .filter(Tombstone.table_name == "athlete")
+    elif table == "coaches":
+        q = q.filter(window(Coach.change_seq))
+        current = select(Coach.id).where(Coach.id == Tombstone.row_id)
+        if team_id:
+            current = current.where(Coach.team_id == team_id)
+        gone = db.session.query(Tombstone.row_id.label("id"), Tombstone.team_id)\
+            .filter(Tombstone.table_name == "coach")
+    else:
+        # a rename or team move changes the athlete's columns on every row
+        changed = [window(Attendance.change_seq), window(Athlete.change_seq)]
+        if implicit_present():
+            current = select(Athlete.id).select_from(Athlete).join(PracticeDay, practice_day_join())\
+                .where(Athlete.id == Tombstone.athlete_id, PracticeDay.date == Tombstone.date)
+            # new practice days, and stored rows that went back to a plain Present
+            changed += [window(PracticeDay.change_seq),
+                        exists().where(Tombstone.table_name == "attendance",
+                                       Tombstone.athlete_id == Athlete.id,
+                                       Tombstone.date == PracticeDay.date,
+                                       window(Tombstone.change_seq))]
+        else:
+            current = select(Attendance.id).join(Athlete, Athlete.id == Attendance.athlete_id)\
+                .where(Attendance.athlete_id == Tombstone.athlete_id, Attendance.date == Tombstone.date)
+        q = q.filter(or_(*changed))
+        gone = db.session.query(Tombstone.athlete_id, Tombstone.date, Tombstone.team_id)\
+            .filter(Tombstone.table_name == "attendance")
+        if since:
+            gone = gone.filter(Tombstone.date >= since)
+        if until:
+            gone = gone.filter(Tombstone.date <= until)
+    if team_id:
+        if table != "coaches":
+            current = current.where(Athlete.team_id == team_id)
+        gone = gone.filter(Tombstone.team_id == team_id)
+    gone = gone.filter(window(Tombstone.change_seq), ~current.exists()).distinct()
+
+    for r in _stream_rows(q):
+        yield ("upsert", *r)
+    headers = EXPORT_COLUMNS[table]
+    for r in _stream_rows(gone):
+        yield ("delete", *(r._mapping.get(h) for h in headers))
+
+def _export_params(args):
+    """Export options from a query string or form; aborts 400 on bad ones."""
+    table = (args.get("table") or "all").lower()
+    if table != "all" and table not in EXPORT_COLUMNS:
+        abort(400)
+    after = None
+    if args.get("since_version", "") != "":
+        after = args.get("since_version", type=int)
+        if after is None or after < 0:
+            abort(400)
+    return {
+        "table": table,
+        "team_id": args.get("team_id", type=int),
+        "since": parse_day(args.get("since")),  # YYYY-MM-DD
+        "until": parse_day(args.get("until")),
+        "since_version": after,
+    }
+
+def _export_members(params, upto):
+    """(file base name, headers, rows) per CSV the export is made of."""
+    table, team_id, since, until, after = (params[k] for k in
+        ("table", "team_id", "since", "until", "since_version"))
+    suffix = "" if after is None else f"-delta-{after}-{upto}"
+
+    def member(name):
+        if after is None or name == "teams":
+            return name + suffix, EXPORT_COLUMNS[name], _export_query(name, team_id, since, until)
+        return (name + suffix, ["change", *EXPORT_COLUMNS[name]],
+                _delta_rows(name, team_id, since, until, after, upto))
+
+    return [member(name) for name in (EXPORT_COLUMNS if table == "all" else [table])]
+
+def _export_filename(params, upto, ts):
+    after = params["since_version"]
+    suffix = "" if after is None else f"-delta-{after}-{upto}"
+    if params["table"] == "all":
+        return f"export{suffix}-{ts}.zip"
+    return f"{params['table']}{suffix}-{ts}.csv"
+
+@app.route("/admin/export", methods=["GET"])
+@login_required
+@admin_required
+def export_data():
+    """
+    Export CSV of a selected table or a ZIP of all:
+      /admin/export?table=attendance&team_id=1&since=2025-08-01&until=2025-08-31
+      /admin/export?table=all
+      /admin/export?table=attendance&since_version=1234
+    tables: teams | athletes | attendance | coaches | all
+
+    X-Export-Version carries the data version the export is complete up to.
+    Passing it back as since_version returns only what changed after it, with
+    a leading change column (upsert | delete); teams always come in full.
+    Big exports are better run as a background job (/admin/export/jobs).
+    """
+    params = _export_params(request.args)
+    ts = datetime.datetime.now().strftime("%Y%m%d-%H%M%S")
+    upto = current_change_seq()  # read before any rows, so nothing newer is skipped next time
+    members = _export_members(params, upto)
+
+    if params["table"] != "all":
+        base, headers, rows = members[0]
+        return _csv_response(rows, headers, base, version=upto)
+
+    # ----- ALL: stream a ZIP with 4 CSVs -----
+    resp = Response(stream_with_context(_zip_chunks(members, ts)), mimetype="application/zip")
+    resp.headers["Content-Disposition"] = f"attachment; filename={_export_filename(params, upto, ts)}"
+    resp.headers["X-Export-Version"] = str(upto)
+    return resp
+
+class _ZipSink:
+    """Write-only file object for ZipFile; it has no tell/seek, so every member
+    is written with a data descriptor and the archive can go out as it is built."""
+
+    def __init__(self):
+        self._parts = []
+
+    def write(self, b):
+        self._parts.append(bytes(b))
+        return len(b)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        out = b"".join(self._parts)
+        self._parts.clear()
+        return out
+
+def _zip_chunks(members, ts):
+    """Yield a deflated ZIP of CSV members, one compressed batch of rows at a time."""
+    sink = _ZipSink()
+    with zipfile.ZipFile(sink, mode="w", compression=zipfile.ZIP_DEFLATED) as zf:
+        for base, headers, rows in members:
+            with zf.open(f"{base}-{ts}.csv", mode="w") as f:
+                for text in _csv_chunks(rows, headers):
+                    f.write(text.encode("utf-8"))
+                    chunk = sink.drain()
+                    if chunk:
+                        yield chunk
+            yield sink.drain()
+    yield sink.drain()  # central directory
+
+
+# ---------- Background export jobs ----------
+#
+# A full backup can take longer than the platform's request timeout and holds
+# one of very few request threads while it builds. POST /admin/export/jobs
+# queues the export instead; a worker thread in this process writes the file
+# under EXPORT_DIR, /admin/export/jobs/<id> reports progress and
+# /admin/export/jobs/<id>/download serves the result. A finished file is
+# handed out again for the same options until the data version changes.
+#
+# Job rows live in the database; files and progress live on this host's
+# disk, which every gunicorn worker here shares.
+
+import abc
+import uuid
+from flask import send_file
+
+EXPORT_DIR = os.getenv("EXPORT_DIR") or os.path.join(app.instance_path, "exports")
+EXPORT_WORKERS = int(os.getenv("EXPORT_WORKERS", "1"))
+EXPORT_JOB_TTL_MS = 7 * 24 * 3600 * 1000  # finished files older than this are removed
+EXPORT_STALL_MS = 10 * 60 * 1000  # a running job silent this long lost its worker
+
+
+class ExportJob(db.Model):
+    """A background export; the file is EXPORT_DIR/<id> once status is done."""
+    id = db.Column(db.String(32), primary_key=True)
+    params_key = db.Column(db.String(40), nullable=False, index=True)  # see export_job_key()
+    params = db.Column(db.Text, nullable=False)  # JSON, see _export_params()
+    data_version = db.Column(db.String(16), nullable=False)  # see export_data_version()
+    export_version = db.Column(db.BigInteger)  # change_seq the file is complete up to
+    status = db.Column(db.String(10), nullable=False)  # queued | running | done | failed
+    filename = db.Column(db.String(120), nullable=False)  # download name
+    rows_done = db.Column(db.Integer, nullable=False, default=0)
+    error = db.Column(db.String(255))
+    created_at = db.Column(db.BigInteger, nullable=False)  # ms since epoch
+    finished_at = db.Column(db.BigInteger)
+
+
+def export_data_version():
+    """What an export file depends on: the change counter plus the (untracked, tiny) team list."""
+    teams = db.session.query(Team.id, Team.name).order_by(Team.id).all()
+    raw = repr((current_change_seq(), [tuple(t) for t in teams]))
+    return hashlib.sha1(raw.encode()).hexdigest()[:16]
+
+
+def export_job_key(params):
+    raw = json.dumps([params, implicit_present()], sort_keys=True)
+    return hashlib.sha1(raw.encode()).hexdigest()
+
+
+class JobRunner(abc.ABC):
+    """
+    Worker threads in this process that run queued jobs of one model (a row
+    with id and status, files under `directory`). Several processes can
+    share the table: a job runs wherever it is claimed first.
+    """
+    model = None
+
+    def __init__(self, directory, workers=1):
+        self.directory = directory
+        self.workers = workers
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._started = False
+
+    def path(self, job_id, suffix=""):
+        return os.path.join(self.directory, job_id + suffix)
+
+    def start(self):
+        """Start this process's workers (once) and queue the jobs left waiting by a restart."""
+        with self._lock:
+            if self._started:
+                return
+            os.makedirs(self.directory, exist_ok=True)
+            for _ in range(self.workers):
+                threading.Thread(target=self._work, daemon=True).start()
+            self._started = True
+            for (queued_id,) in db.session.query(self.model.id).filter_by(status="queued")\
+                    .order_by(self.model.created_at):
+                self._queue.put(queued_id)
+
+    def submit(self, job_id):
+        self.start()  # normally already done at boot (start_job_runners)
+        self._queue.put(job_id)  # a second put of a requeued job finds it claimed
+
+    def _work(self):
+        while True:
+            job_id = self._queue.get()
+            with app.app_context():
+                try:
+                    self._build(job_id)
+                except Exception as e:
+                    print(f"{self.model.__name__} {job_id} failed:", e)
+                finally:
+                    db.session.remove()
+
+    def progress(self, job):
+        """(rows done so far, ms since epoch of the last report) for a running job."""
+        try:
+            with open(self.path(job.id, ".progress")) as f:
+                return int(f.read() or 0), int(os.stat(f.fileno()).st_mtime * 1000)
+        except (OSError, ValueError):
+            return job.rows_done, job.created_at
+
+    def _report(self, job_id, rows):
+        tmp = self.path(job_id, ".progress.tmp")
+        with open(tmp, "w") as f:
+            f.write(str(rows))
+        os.replace(tmp, self.path(job_id, ".progress"))
+
+    def _claim(self, job_id):
+        """queued -> running, unless the job is gone or another worker has it."""
+        claimed = self.model.query.filter_by(id=job_id, status="queued")\
+            .update({"status": "running"}, synchronize_session=False)
+        db.session.commit()
+        return bool(claimed)
+
+    @abc.abstractmethod
+    def _build(self, job_id):
+        """Claim the job (see _claim) and run it to done or failed."""
+
+
+class ExportRunner(JobRunner):
+    """Builds queued export jobs to EXPORT_DIR/<id>."""
+    model = ExportJob
+
+    def _build(self, job_id):
+        if not self._claim(job_id):
+            return
+        self._report(job_id, 0)
+
+        job = db.session.get(ExportJob, job_id)
+        ts = datetime.datetime.fromtimestamp(job.created_at / 1000).strftime("%Y%m%d-%H%M%S")
+        rows = [0]
+        tmp = self.path(job_id, ".tmp")
+        try:
+            params = json.loads(job.params)
+            version = export_data_version()
+            upto = current_change_seq()
+            members = [(base, headers, self._counted(member_rows, rows))
+                       for base, headers, member_rows in _export_members(params, upto)]
+            if params["table"] == "all":
+                chunks = _zip_chunks(members, ts)
+            else:
+                chunks = (text.encode("utf-8") for text in _csv_chunks(members[0][2], members[0][1]))
+            reported = time.monotonic()
+            with open(tmp, "wb") as f:
+                for chunk in chunks:
+                    f.write(chunk)
+                    if time.monotonic() - reported > 1:
+                        self._report(job_id, rows[0])
+                        reported = time.monotonic()
+            os.replace(tmp, self.path(job_id))
+            db.session.rollback()  # end the long read before writing the job row
+            job.status, job.data_version, job.export_version = "done", version, upto
+            job.filename = _export_filename(params, upto, ts)
+        except Exception as e:
+            db.session.rollback()
+            job.status, job.error = "failed", str(e)[:255]
+            if os.path.exists(tmp):
+                os.unlink(tmp)
+        job.rows_done, job.finished_at = rows[0], now_ms()
+        db.session.commit()
+        if os.path.exists(self.path(job_id, ".progress")):
+            os.unlink(self.path(job_id, ".progress"))
+        if job.status == "done":
+            self.prune(keep=job)
+
+    @staticmethod
+    def _counted(member_rows, rows):
+        for r in _stream_rows(member_rows):
+            rows[0] += 1
+            yield r
+
+    def prune(self, keep):
+        """Drop files this one supersedes (same options) and ones past EXPORT_JOB_TTL_MS."""
+        old = ExportJob.query.filter(
+            ExportJob.id != keep.id,
+            ExportJob.status.in_(["done", "failed"]),
+            or_(ExportJob.params_key == keep.params_key,
+                ExportJob.created_at < now_ms() - EXPORT_JOB_TTL_MS),
+        ).all()
+        for job in old:
+            if os.path.exists(self.path(job.id)):
+                os.unlink(self.path(job.id))
+            db.session.delete(job)
+        db.session.commit()
+
+    def state(self, job):
+        """The job's status, with a running job whose worker went away (or a lost file) as failed."""
+        if job.status == "running" and now_ms() - self.progress(job)[1] > EXPORT_STALL_MS:
+            return "failed"
+        if job.status == "done" and not os.path.exists(self.path(job.id)):
+            return "failed"
+        return job.status
+
+
+export_runner = ExportRunner(EXPORT_DIR, EXPORT_WORKERS)
+
+
+def submit_export_job(params):
+    """The job that builds `params` at today's data version, reusing a live or finished one."""
+    key, version = export_job_key(params), export_data_version()
+    for job in (ExportJob.query.filter_by(params_key=key, data_version=version)
+                .order_by(ExportJob.created_at.desc())):
+        if export_runner.state(job) != "failed":
+            return job
+
+    now = now_ms()
+    job = ExportJob(
+        id=uuid.uuid4().hex,
+        params_key=key,
+        params=json.dumps(params),
+        data_version=version,
+        status="queued",
+        filename=_export_filename(params, current_change_seq(),
+                                  datetime.datetime.fromtimestamp(now / 1000).strftime("%Y%m%d-%H%M%S")),
+        created_at=now,
+    )
+    db.session.add(job)
+    db.session.commit()
+    export_runner.submit(job.id)
+    return job
+
+
+def export_job_json(job):
+    status = export_runner.state(job)
+    rows = export_runner.progress(job)[0] if status == "running" else job.rows_done
+    return {
+        "id": job.id,
+        "status": status,
+        "params": json.loads(job.params),
+        "rows_done": rows,
+        "export_version": job.export_version,
+        "error": job.error if job.status == "failed" else ("worker stopped" if status == "failed" else None),
+        "created_at": job.created_at,
+        "finished_at": job.finished_at,
+        "status_url": url_for("export_job_status", job_id=job.id),
+        "download_url": url_for("export_job_download", job_id=job.id) if status == "done" else None,
+    }
+
+
+@app.route("/admin/export/jobs", methods=["GET", "POST"])
+@login_required
+@admin_required
+def export_jobs():
+    """
+    POST queues an export (same options as /admin/export) and answers 202
+    with the job as JSON, or redirects back here from the form. GET lists
+    recent jobs.
+    """
+    wants_json = request.accept_mimetypes.best_match(["text/html", "application/json"]) == "application/json"
+    if request.method == "POST":
+        job = submit_export_job(_export_params(request.values))
+        if wants_json:
+            return jsonify(export_job_json(job)), 202
+        flash("Export queued." if job.status == "queued" else "Export already built or in progress.", "success")
+        return redirect(url_for("export_jobs"))
+
+    jobs = [export_job_json(j) for j in ExportJob.query.order_by(ExportJob.created_at.desc()).limit(20)]
+    if wants_json:
+        return jsonify({"jobs": jobs})
+    teams = db.session.query(Team.id, Team.name).order_by(Team.name).all()
+    busy = any(j["status"] in ("queued", "running") for j in jobs)
+    return render_template("export_jobs.html", jobs=jobs, teams=teams, busy=busy,
+                           tables=["all", *EXPORT_COLUMNS])
+
+
+@app.route("/admin/export/jobs/<job_id>", methods=["GET"])
+@login_required
+@admin_required
+def export_job_status(job_id):
+    job = db.session.get(ExportJob, job_id) or abort(404)
+    return jsonify(export_job_json(job))
+
+
+@app.route("/admin/export/jobs/<job_id>/download", methods=["GET"])
+@login_required
+@admin_required
+def export_job_download(job_id):
+    job = db.session.get(ExportJob, job_id) or abort(404)
+    if export_runner.state(job) != "done":
+        abort(404)
+    resp = send_file(export_runner.path(job.id), as_attachment=True, download_name=job.filename,
+                     mimetype="application/zip" if job.filename.endswith(".zip") else "text/csv; charset=utf-8")
+    resp.headers["X-Export-Version"] = str(job.export_version)
+    return resp
+
+
+# ---------- Background roster imports ----------
+#
+# import_csv spools the upload (plain or gzip) to IMPORT_DIR/<id> and queues
+# an ImportJob. A worker thread reads it as a stream and commits every
+# IMPORT_CHUNK_ROWS rows together with the job's row count and tallies, so a
+# job that fails or loses its worker resumes after the last committed chunk.
+
+import gzip
+
+IMPORT_DIR = os.getenv("IMPORT_DIR") or os.path.join(app.instance_path, "imports")
+IMPORT_STALL_MS = 5 * 60 * 1000  # a running import with no chunk committed this long lost its worker
+
+
+def open_roster_file(path):
+    """A spooled upload as text, decompressed on the fly when it is gzip."""
+    with open(path, "rb") as f:
+        gz = f.read(2) == b"\x1f\x8b"
+    return TextIOWrapper(gzip.open(path) if gz else open(path, "rb"), encoding="utf-8", newline="")
+
+
+class ImportJob(db.Model):
+    """A roster upload being imported; the spooled file is IMPORT_DIR/<id> until it is done."""
+    id = db.Column(db.String(32), primary_key=True)
+    filename = db.Column(db.String(255), nullable=False)  # as uploaded
+    status = db.Column(db.String(10), nullable=False)  # queued | running | done | failed
+    rows_done = db.Column(db.Integer, nullable=False, default=0)  # CSV rows committed
+    counts = db.Column(db.Text, nullable=False, default="{}")  # JSON, see RosterImport.COUNTS
+    error = db.Column(db.String(255))
+    created_at = db.Column(db.BigInteger, nullable=False)  # ms since epoch
+    updated_at = db.Column(db.BigInteger, nullable=False)  # last committed chunk
+    finished_at = db.Column(db.BigInteger)
+
+
+class ImportRunner(JobRunner):
+    """Imports queued roster uploads chunk by chunk."""
+    model = ImportJob
+
+    def _build(self, job_id):
+        if not self._claim(job_id):
+            return
+        job = db.session.get(ImportJob, job_id)
+        done = job.rows_done
+        try:
+            batch = RosterImport()
+            batch.restore(json.loads(job.counts))
+            with open_roster_file(self.path(job_id)) as f:
+                n = 0
+                for n, row in enumerate(csv_rows(f), 1):
+                    if n <= done:
+                        batch.remember(row)  # committed by an earlier run
+                        continue
+                    batch.add(row)
+                    if n % IMPORT_CHUNK_ROWS == 0:
+                        self._commit(job, batch, n)
+                self._commit(job, batch, max(n, done))
+            job.status, job.finished_at = "done", now_ms()
+            db.session.commit()
+            os.unlink(self.path(job_id))
+        except Exception as e:
+            db.session.rollback()  # back to the last committed chunk
+            job.status, job.error, job.finished_at = "failed", str(e)[:255], now_ms()
+            db.session.commit()
+
+    def _commit(self, job, batch, rows_done):
+        added = batch.added
+        batch.finish()
+        job.rows_done, job.counts, job.updated_at = rows_done, json.dumps(batch.counts()), now_ms()
+        db.session.commit()
+        if batch.added > added:
+            roll_matrix.invalidate(season_of(central_today()))
+
+    def state(self, job):
+        """The job's status, with a running job whose worker went away as failed."""
+        if job.status == "running" and now_ms() - job.updated_at > IMPORT_STALL_MS:
+            return "failed"
+        return job.status
+
+
+import_runner = ImportRunner(IMPORT_DIR)
+
+
+def submit_import_job(file):
+    """Spool an uploaded roster file to disk and queue its import."""
+    now = now_ms()
+    job = ImportJob(id=uuid.uuid4().hex, filename=(file.filename or "upload.csv")[:255],
+                    status="queued", rows_done=0, counts="{}", created_at=now, updated_at=now)
+    os.makedirs(IMPORT_DIR, exist_ok=True)
+    file.save(import_runner.path(job.id))
+    db.session.add(job)
+    db.session.commit()
+    import_runner.submit(job.id)
+    return job
+
+
+def import_job_json(job):
+    status = import_runner.state(job)
+    counts = json.loads(job.counts)
+    return {
+        "id": job.id,
+        "filename": job.filename,
+        "status": status,
+        "rows_done": job.rows_done,
+        "counts": {k: counts.get(k, 0) for k in RosterImport.COUNTS},
+        "summary": RosterImport.describe(counts),
+        "error": job.error if job.status == "failed" else ("worker stopped" if status == "failed" else None),
+        "created_at": job.created_at,
+        "finished_at": job.finished_at,
+        "status_url": url_for("import_job_status", job_id=job.id),
+        "resume_url": url_for("import_job_resume", job_id=job.id) if status == "failed" else None,
+    }
+
+
+@app.route("/import_csv/jobs/<job_id>", methods=["GET"])
+@login_required
+def import_job_status(job_id):
+    job = db.session.get(ImportJob, job_id) or abort(404)
+    return jsonify(import_job_json(job))
+
+
+@app.route("/import_csv/jobs/<job_id>/resume", methods=["POST"])
+@login_required
+def import_job_resume(job_id):
+    """Queue a failed (or abandoned) import again; it picks up after the last committed chunk."""
+    job = db.session.get(ImportJob, job_id) or abort(404)
+    if import_runner.state(job) != "failed" or not os.path.exists(import_runner.path(job.id)):
+        abort(409)
+    requeued = ImportJob.query.filter_by(id=job.id, status=job.status)\
+        .update({"status": "queued", "error": None, "updated_at": now_ms()}, synchronize_session=False)
+    db.session.commit()
+    if requeued:
+        import_runner.submit(job.id)
+    if request.accept_mimetypes.best_match(["text/html", "application/json"]) == "application/json":
+        return jsonify(import_job_json(db.session.get(ImportJob, job.id))), 202
+    flash("Import resumed.", "success")
+    return redirect(url_for("import_csv"))
+
+
+# ---------- Roster import preview ----------
+#
+# A preview diffs the upload against the current roster without writing
+# anything: the roster is read once into a dict keyed by normalized name,
+# and each file row is looked up in it (a hash join). Applying re-runs the
+# diff against the roster as it is then and writes it in one transaction:
+# one multi-row INSERT for the adds and one executemany UPDATE for the rest.
+
+from collections import defaultdict
+from sqlalchemy import bindparam
+
+RosterDiff = namedtuple("RosterDiff", "adds updates missing skipped")
+PREVIEW_TTL_SECONDS = 24 * 3600  # abandoned preview uploads are removed after this
+
+
+def roster_name_key(first, last):
+    return (" ".join(first.split()).lower(), " ".join(last.split()).lower())
+
 
+def diff_roster(rows):
+    """
+    Compare roster CSV rows with the athletes table.
+      adds     athlete values for names not on the roster
+      updates  (athlete row, {column: new value}) for grade, gender or team changes
+      missing  athletes on the teams the file covers that it doesn't list
+      skipped  {"missing_names": n, "unknown_team": n, "infile_dupes": n}
+    A row matches the athlete with its name on its team first; failing that,
+    a single unmatched athlete with the name elsewhere (a team change). Blank
+    cells and unknown teams leave the athlete's value alone.
+    """
+    teams = Team.query.all()
+    teams_by_name = {(t.name or "").strip(): t for t in teams}
+    teams_by_id = {int(t.id): t for t in teams}
+    by_name = defaultdict(list)
+    roster = db.session.query(Athlete.id, Athlete.first_name, Athlete.last_name,
+                              Athlete.grade, Athlete.gender, Athlete.team_id).all()
+    for a in roster:
+        by_name[roster_name_key(a.first_name, a.last_name)].append(a)
+
+    skipped = {"missing_names": 0, "unknown_team": 0, "infile_dupes": 0}
+    parsed, seen, covered = [], set(), set()
+    for row in rows:
+        key, values, unknown_team = parse_roster_row(row, teams_by_name, teams_by_id)
+        if key is None:
+            skipped["missing_names"] += 1
+            continue
+        if unknown_team:
+            skipped["unknown_team"] += 1
+        name = roster_name_key(values["first_name"], values["last_name"])
+        if (name, values["team_id"]) in seen:
+            skipped["infile_dupes"] += 1
+            continue
+        seen.add((name, values["team_id"]))
+        if values["team_id"] is not None:
+            covered.add(values["team_id"])
+        parsed.append((name, values))
+
+    matched, hits = set(), [None] * len(parsed)
+    # exact (name, team) matches first, so a name-only match never steals one
+    for i, (name, values) in enumerate(parsed):
+        if values["team_id"] is None:
+            continue
+        for a in by_name.get(name, ()):
+            if a.team_id == values["team_id"] and a.id not in matched:
+                hits[i] = a
+                matched.add(a.id)
+                break
+    for i, (name, values) in enumerate(parsed):
+        if hits[i] is None:
+            free = [a for a in by_name.get(name, ()) if a.id not in matched]
+            if len(free) == 1 or (free and values["team_id"] is None):
+                hits[i] = free[0]
+                matched.add(free[0].id)
+
+    adds, updates = [], []
+    for (name, values), a in zip(parsed, hits):
+        if a is None:
+            adds.append(values)
+            continue
+        changes = {col: values[col] for col in ("grade", "gender", "team_id")
+                   if values[col] is not None and values[col] != getattr(a, col)}
+        if changes:
+            updates.append((a, changes))
+    missing = [a for a in roster if a.id not in matched and a.team_id in covered]
+    return RosterDiff(adds, updates, missing, skipped)
+
+
+def apply_roster_diff(diff):
+    """Write a diff's adds and updates in the session's transaction (caller commits)."""
+    conn = db.session.connection()
+    seq, today = next_change_seq(conn, Athlete), central_today()
+    added = 0
+    if diff.adds:
+        added = len(conn.execute(
+            dialect_insert(Athlete.__table__).on_conflict_do_nothing().returning(Athlete.id),
+            [{**v, "active_since": today, "change_seq": seq} for v in diff.adds],
+        ).all())
+
+    moved = [a.id for a, changes in diff.updates if "team_id" in changes]
+    if moved:
+        tombstone_athletes(conn, moved)  # gone from the old team's export
+    if diff.updates:
+        # one statement shape for all rows: unchanged columns keep their value
+        conn.execute(
+            Athlete.__table__.update().where(Athlete.id == bindparam("b_id")).values(
+                grade=bindparam("b_grade"), gender=bindparam("b_gender"),
+                team_id=bindparam("b_team_id"), change_seq=seq),
+            [{"b_id": a.id, **{f"b_{col}": changes.get(col, getattr(a, col))
+                               for col in ("grade", "gender", "team_id")}}
+             for a, changes in diff.updates],
+        )
+    if moved and implicit_present():
+        roll_changed(conn, moved)  # implicit Present days come from the new team's calendar now
+    if added or diff.updates:
+        bump_roll_version(conn, [None, *(t for (t,) in db.session.query(Team.id))])
+    return added, len(diff.updates)
 
-@app.route("/reset/<token>", methods=["GET", "POST"])
-def reset_password_token(token):
-    s = get_serializer()
-    try:
-        data = s.loads(token, max_age=3600)  # 1 hour validity
-    except SignatureExpired:
-        flash("Reset link expired. Please try again.", "error")
-        return redirect(url_for("forgot"))
-    except BadSignature:
-        flash("Invalid reset link.", "error")
-        return redirect(url_for("forgot"))
 
-    user = Coach.query.get(data.get("uid"))
-    if not user:
-        flash("User not found.", "error")
-        return redirect(url_for("forgot"))
+def _prune_previews():
+    if not os.path.isdir(IMPORT_DIR):
+        return
+    for name in os.listdir(IMPORT_DIR):
+        path = os.path.join(IMPORT_DIR, name)
+        if name.endswith(".preview") and time.time() - os.path.getmtime(path) > PREVIEW_TTL_SECONDS:
+            os.unlink(path)
 
-    if request.method == "POST":
-        new_pw = (request.form.get("password") or "").strip()
-        confirm = (request.form.get("confirm") or "").strip()
-        if len(new_pw) < 8:
-            flash("Password must be at least 8 characters.", "error")
-            return redirect(request.url)
-        if new_pw != confirm:
-            flash("Passwords do not match.", "error")
-            return redirect(request.url)
 
-        user.password = generate_password_hash(new_pw)
-        db.session.commit()
-        flash("Password updated. You can log in now.", "success")
-        return redirect(url_for("login"))
+def _preview_path(token):
+    if not re.fullmatch(r"[0-9a-f]{32}", token or ""):
+        abort(404)
+    return os.path.join(IMPORT_DIR, token + ".preview")
 
-    return render_template("reset_password_token.html")
 
+def preview_roster_upload(file):
+    """Spool an upload for a later apply and diff it; returns (token, diff)."""
+    _prune_previews()
+    os.makedirs(IMPORT_DIR, exist_ok=True)
+    token = uuid.uuid4().hex
+    file.save(_preview_path(token))
+    with open_roster_file(_preview_path(token)) as f:
+        return token, diff_roster(csv_rows(f))
 
 
-@app.route("/add_coach", methods=["GET", "POST"])
+@app.route("/import_csv/apply", methods=["POST"])
 @login_required
-def add_coach():
-    teams = Team.query.order_by(Team.name).all()
-    message = None
-    if request.method == "POST":
-        name = request.form["name"]
-        username = request.form["username"]
-        password = request.form["password"]
-        team_id = request.form.get("team_id") or None
-        hashed_password = generate_password_hash(password)
-        try:
-            new_coach = Coach(name=name, username=username, password=hashed_password, team_id=int(team_id) if team_id else None)
-            db.session.add(new_coach)
-            db.session.commit()
-            message = "Coach added successfully."
-        except Exception as e:
-            db.session.rollback()
-            message = f"Error: {str(e)}"
-    return render_template("add_coach.html", teams=teams, message=message)
+def import_csv_apply():
+    """Apply a previewed upload, diffed again against the roster as it is now."""
+    path = _preview_path(request.form.get("token"))
+    if not os.path.exists(path):
+        flash("That preview has expired; upload the file again.", "error")
+        return redirect(url_for("import_csv"))
+    try:
+        with open_roster_file(path) as f:
+            diff = diff_roster(csv_rows(f))
+        added, updated = apply_roster_diff(diff)
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        flash(f"Import failed: {e}", "error")
+        return redirect(url_for("import_csv"))
+    os.unlink(path)
+    if added or updated:
+        roll_matrix.invalidate()
+    flash(f"Added {added} and updated {updated} athlete(s); "
+          f"{len(diff.missing)} on the file's teams were not in the file and were left alone.", "success")
+    return redirect(url_for("manage_roster"))
 
-import csv
-from io import TextIOWrapper
 
-from sqlalchemy import func
-from sqlalchemy.exc import IntegrityError
+# ---------- Bulk loaders (flask load ...) ----------
+#
+# Command-line loads of large files straight into the app's tables. They
+# reuse the web import's parsing and in-memory dedupe but write much bigger
+# batches: COPY into a temp table then one INSERT ... SELECT on Postgres,
+# a single executemany on SQLite. The whole file is one transaction.
 
-@app.route("/import_csv", methods=["GET", "POST"])
-@login_required
-def import_csv():
-    if request.method == "POST":
-        try:
-            file = request.files.get("file")
-            if not file or not getattr(file, "filename", ""):
-                flash("No file uploaded.", "error")
-                return redirect(url_for("import_csv"))
+import click
 
-            f = TextIOWrapper(file.stream, encoding="utf-8", newline="")
-            reader = csv.DictReader(f)
+LOAD_CHUNK_ROWS = 10000  # rows per COPY / executemany
 
-            # Team lookups
-            all_teams = Team.query.all()
-            teams_by_name = { (t.name or "").strip(): t for t in all_teams }
-            teams_by_id   = { int(t.id): t for t in all_teams }
 
-            added = 0
-            skipped_missing_names = 0
-            skipped_unknown_team  = 0
-            skipped_infile_dupes  = 0
-            skipped_db_dupes      = 0
-
-            # in-file duplicate guard: per-team uniqueness (first+last+team)
-            seen = set()  # keys like ("ava","jones", team_id or None)
-
-            for row in reader:
-                fn = (row.get("first_name") or "").strip()
-                ln = (row.get("last_name")  or "").strip()
-                if not fn or not ln:
-                    skipped_missing_names += 1
-                    continue
+class BulkRosterLoad(RosterImport):
+    """RosterImport with COPY (Postgres) or executemany (SQLite) batches."""
+    COLUMNS = ("first_name", "last_name", "grade", "gender", "team_id", "active_since", "change_seq")
 
-                # Resolve team
-                team_val = (row.get("team_name") or row.get("team_id") or "").strip()
-                team = None
-                if team_val:
-                    if team_val.isdigit():
-                        team = teams_by_id.get(int(team_val))
-                    else:
-                        team = teams_by_name.get(team_val)
-                team_id = team.id if team else None
-                if team_val and not team:
-                    skipped_unknown_team += 1
-                    # still import with team_id=None? choose to proceed without team:
-                    # comment next two lines if you want to *skip* entirely instead.
-                    # continue  # uncomment to skip rows with unknown team
-                    # (fallthrough keeps team_id=None)
-
-                # Optional fields
-                grade_raw = (row.get("grade") or "").strip()
-                try:
-                    grade = int(grade_raw) if grade_raw != "" else None
-                except ValueError:
-                    grade = None
-                gender = (row.get("gender") or "").strip() or None
-
-                key = (fn.lower(), ln.lower(), team_id)
-                if key in seen:
-                    skipped_infile_dupes += 1
-                    continue
-                seen.add(key)
+    def __init__(self, chunk_rows=LOAD_CHUNK_ROWS, check_duplicates=True):
+        super().__init__(check_duplicates)
+        self.chunk_rows = chunk_rows
 
-                # DB-level duplicate check (case-insensitive, per team)
-                exists = (
-                    db.session.query(Athlete.id)
-                    .filter(
-                        func.lower(Athlete.first_name) == fn.lower(),
-                        func.lower(Athlete.last_name)  == ln.lower(),
-                        Athlete.team_id == team_id
-                    )
-                    .first()
-                )
-                if exists:
-                    skipped_db_dupes += 1
-                    continue
+    def _insert(self, rows):
+        conn = db.session.connection()
+        try:
+            with db.session.begin_nested():
+                if conn.dialect.name == "postgresql":
+                    return self._copy(conn, rows), 0
+                # no RETURNING, so the driver runs it as one executemany
+                stmt = dialect_insert(Athlete.__table__).on_conflict_do_nothing()
+                return conn.execute(stmt, rows).rowcount, 0
+        except (SQLAlchemyError, conn.dialect.dbapi.Error):
+            return super()._insert(rows)  # row by row, to find the bad ones
+
+    def _copy(self, conn, rows):
+        cols = ", ".join(self.COLUMNS)
+        buf = io.StringIO()
+        out = csv.writer(buf)
+        for r in rows:
+            out.writerow(["" if r[c] is None else r[c] for c in self.COLUMNS])
+        buf.seek(0)
+        conn.exec_driver_sql(
+            f"CREATE TEMP TABLE IF NOT EXISTS athlete_load AS SELECT {cols} FROM athlete WITH NO DATA")
+        conn.exec_driver_sql("TRUNCATE athlete_load")
+        # empty unquoted fields are NULL in COPY's csv format
+        conn.connection.cursor().copy_expert(f"COPY athlete_load ({cols}) FROM STDIN WITH (FORMAT csv)", buf)
+        return conn.exec_driver_sql(
+            f"INSERT INTO athlete ({cols}) SELECT {cols} FROM athlete_load ON CONFLICT DO NOTHING").rowcount
+
+
+def create_missing_teams(names):
+    """Add any of these team names not in the team table yet; the number added."""
+    have = {(n or "").strip() for (n,) in db.session.query(Team.name)}
+    new = sorted({n for n in names if n and not n.isdigit() and n not in have})
+    if new:
+        db.session.execute(dialect_insert(Team.__table__).on_conflict_do_nothing(), [{"name": n} for n in new])
+    return len(new)
+
+
+@app.cli.group("load")
+def load_group():
+    """Bulk-load CSV files (plain or .gz) into the database."""
+
+
+@load_group.command("roster")
+@click.argument("path", type=click.Path(exists=True, dir_okay=False))
+@click.option("--create-teams", is_flag=True, help="Add teams the file names that don't exist yet.")
+@click.option("--batch", default=LOAD_CHUNK_ROWS, show_default=True, help="Rows per COPY / executemany.")
+@click.option("--duplicate-check/--no-duplicate-check", default=True, show_default=True,
+              help="Count names that look like another athlete (see find-duplicates).")
+def load_roster_command(path, create_teams, batch, duplicate_check):
+    """
+    Add the athletes in a roster CSV, skipping ones already on the roster.
+    Takes First,Last,Grade,Gender,Team or first_name,last_name,grade,gender,team_name.
+    """
+    started = time.perf_counter()
+    if create_teams:
+        with open_roster_file(path) as f:
+            n = create_missing_teams((row.get("team_name") or "").strip() for row in csv_rows(f))
+        if n:
+            print(f"Added {n} team(s).")
+    load = BulkRosterLoad(chunk_rows=batch, check_duplicates=duplicate_check)
+    with open_roster_file(path) as f:
+        for row in csv_rows(f):
+            load.add(row)
+    load.finish()
+    db.session.commit()
+    if load.added:
+        roll_matrix.invalidate(season_of(central_today()))
+    print(f"{load.summary()} ({time.perf_counter() - started:.2f}s)")
+
+
+# ---------- Attendance backfill ----------
+#
+# Past seasons kept in spreadsheets come in as athlete,date,status,notes
+# rows, from /import_attendance (a background BackfillJob) or `flask load
+# attendance`. Names resolve through one preloaded name -> athlete map,
+# rows are upserted on the (athlete_id, date) unique index a batch at a
+# time, and the derived tables
+# are refreshed once at the end for the athletes touched. Names that match
+# no one, or athletes on several teams with no team column to pick one,
+# are reported rather than guessed.
+
+from collections import Counter
+from functools import lru_cache
+
+BACKFILL_CHUNK_ROWS = 5000  # (athlete, day) keys per upsert
+
+# CSV header (lower-cased, spaces as underscores) -> AttendanceBackfill field
+BACKFILL_HEADERS = {
+    "athlete": "athlete", "name": "athlete", "athlete_name": "athlete",
+    "first": "first_name", "firstname": "first_name",
+    "last": "last_name", "lastname": "last_name",
+    "team": "team_name", "day": "date", "note": "notes",
+}
+BACKFILL_STATUSES = {"present": "Present", "p": "Present", "absent": "Absent", "a": "Absent"}
+BACKFILL_DATE_FORMATS = ("%m/%d/%Y", "%m/%d/%y", "%Y/%m/%d")
+
+
+def backfill_name_key(name):
+    """'Jon  Smith' and 'Smith, Jon' both -> 'jon smith'."""
+    if "," in name:
+        last, first = name.split(",", 1)
+        name = f"{first} {last}"
+    return " ".join(name.split()).lower()
+
+
+@lru_cache(maxsize=4096)  # a season file repeats each date hundreds of times
+def parse_backfill_day(value):
+    """YYYY-MM-DD or a spreadsheet's M/D/YYYY as ISO; "" when it is neither."""
+    day = parse_day(value)
+    if day:
+        return day
+    for fmt in BACKFILL_DATE_FORMATS:
+        try:
+            return pydt.datetime.strptime((value or "").strip(), fmt).date().isoformat()
+        except ValueError:
+            pass
+    return ""
 
-                # Add and flush so we can catch a unique-index violation early
-                try:
-                    db.session.add(Athlete(
-                        first_name=fn,
-                        last_name=ln,
-                        grade=grade,
-                        gender=gender,
-                        team_id=team_id
-                    ))
-                    db.session.flush()
-                    added += 1
-                except IntegrityError:
-                    db.session.rollback()
-                    skipped_db_dupes += 1
-                    # keep going
 
-            db.session.commit()
+class AttendanceBackfill:
+    """
+    Upserts attendance CSV rows in batches; a later row for the same athlete
+    and day wins. Call finish() once at the end (the caller commits).
+    """
 
-            bits = [f"Imported {added} athletes."]
-            if skipped_missing_names:
-                bits.append(f"Skipped {skipped_missing_names} missing name(s).")
-            if skipped_unknown_team:
-                bits.append(f"{skipped_unknown_team} row(s) had unknown team.")
-            if skipped_infile_dupes:
-                bits.append(f"Skipped {skipped_infile_dupes} duplicate row(s) in file.")
-            if skipped_db_dupes:
-                bits.append(f"Skipped {skipped_db_dupes} already on roster.")
-            flash(" ".join(bits), "success")
-            return redirect(url_for("attendance"))
+    def __init__(self, chunk_rows=BACKFILL_CHUNK_ROWS):
+        self.chunk_rows = chunk_rows
+        self.names = {}  # name key -> [(athlete id, team id)]
+        self.team_of = {}
+        for aid, fn, ln, team_id in db.session.query(
+                Athlete.id, Athlete.first_name, Athlete.last_name, Athlete.team_id):
+            self.names.setdefault(backfill_name_key(f"{fn} {ln}"), []).append((aid, team_id))
+            self.team_of[aid] = team_id
+        self.teams_by_name = {(name or "").strip().lower(): tid for tid, name in db.session.query(Team.id, Team.name)}
+        self.pending = {}  # (athlete id, day) -> (status, notes)
+        self.first_day = {}  # athlete id -> earliest day in the file
+        self.team_days = set()  # (team id, day) to put on the calendar
+        self.unmatched_names = Counter()
+        self.ambiguous_names = Counter()
+        self.rows = self.written = self.cleared = self.unmatched = self.ambiguous = self.bad = 0
+
+    def _match(self, row):
+        name = (row.get("athlete") or f"{row.get('first_name') or ''} {row.get('last_name') or ''}").strip()
+        matches = self.names.get(backfill_name_key(name), [])
+        team = (row.get("team_name") or "").strip().lower()
+        if team and len(matches) > 1:
+            matches = [m for m in matches if m[1] == self.teams_by_name.get(team)]
+        return name, matches
+
+    def add(self, row):
+        self.rows += 1
+        name, matches = self._match(row)
+        day = parse_backfill_day(row.get("date"))
+        status = BACKFILL_STATUSES.get((row.get("status") or "").strip().lower())
+        if not name or not day or not status:
+            self.bad += 1
+        elif not matches:
+            self.unmatched += 1
+            self.unmatched_names[name] += 1
+        elif len(matches) > 1:
+            self.ambiguous += 1
+            self.ambiguous_names[name] += 1
+        else:
+            notes = (row.get("notes") or "").strip()[:255] or None
+            self.pending[(matches[0][0], day)] = (status, notes)
+            if len(self.pending) >= self.chunk_rows:
+                self.flush()
+
+    def flush(self):
+        pending, self.pending = self.pending, {}
+        if not pending:
+            return
+        conn = db.session.connection()
+        seq, now = next_change_seq(conn, Attendance, Tombstone), now_ms()
+        rows, plain = [], []
+        for (aid, day), (status, notes) in pending.items():
+            self.first_day[aid] = min(day, self.first_day.get(aid, day))
+            if self.team_of[aid] is not None:
+                self.team_days.add((self.team_of[aid], day))
+            if implicit_present() and status == "Present" and not notes:
+                plain.append((aid, day))  # the practice day says it; no row
+            else:
+                rows.append({"athlete_id": aid, "date": day, "status": status, "notes": notes,
+                             "updated_at": now, "change_seq": seq})
+        if rows:
+            stmt = dialect_insert(Attendance.__table__)
+            conn.execute(stmt.on_conflict_do_update(
+                index_elements=["athlete_id", "date"],
+                set_={c: stmt.excluded[c] for c in ("status", "notes", "updated_at", "change_seq")},
+            ), rows)
+            self.written += len(rows)
+        if plain:
+            self.cleared += self._clear(conn, plain, seq, now)
+
+    def _clear(self, conn, keys, seq, now):
+        """Delete the rows stored at these keys, leaving tombstones; how many there were."""
+        where = tuple_(Attendance.athlete_id, Attendance.date).in_(keys)
+        found = conn.execute(select(Attendance.athlete_id, Attendance.date).where(where)).all()
+        if found:
+            conn.execute(insert(Tombstone), [
+                {"table_name": "attendance", "athlete_id": aid, "date": day, "team_id": self.team_of[aid],
+                 "change_seq": seq, "deleted_at": now}
+                for aid, day in found
+            ])
+            conn.execute(Attendance.__table__.delete().where(where))
+        return len(found)
+
+    def finish(self):
+        """Flush the last batch, then calendar, active_since and the derived tables."""
+        self.flush()
+        if not self.first_day:
+            return
+        conn = db.session.connection()
+
+        # history from before an athlete joined the roster counts for them
+        day = bindparam("b_day", type_=Athlete.active_since.type)
+        conn.execute(
+            Athlete.__table__.update()
+            .where(Athlete.id == bindparam("b_id"), Athlete.active_since > day)
+            .values(active_since=day, change_seq=next_change_seq(conn, Athlete)),
+            [{"b_id": aid, "b_day": d} for aid, d in self.first_day.items()],
+        )
 
+        by_day = {}
+        for team_id, d in self.team_days:
+            by_day.setdefault(d, set()).add(team_id)
+        new_teams = set()
+        for d, teams in by_day.items():
+            held = hold_practice_days(conn, select(Team.id, literal(d, PracticeDay.date.type))
+                                      .where(Team.id.in_(teams)))
+            new_teams.update(t for t, _ in held)
+
+        ids = set(self.first_day)
+        if implicit_present() and new_teams:
+            # a new practice day is an implicit Present for the whole team
+            ids.update(conn.execute(select(Athlete.id).where(Athlete.team_id.in_(new_teams))).scalars())
+        roll_changed(conn, ids)
+
+    def summary(self):
+        bits = [f"Wrote {self.written} attendance row(s) from {self.rows} line(s)."]
+        if self.cleared:
+            bits.append(f"Cleared {self.cleared} stored row(s) now implied Present.")
+        if self.unmatched:
+            bits.append(f"{self.unmatched} row(s) named no athlete on the roster.")
+        if self.ambiguous:
+            bits.append(f"{self.ambiguous} row(s) matched athletes on several teams (add a team column).")
+        if self.bad:
+            bits.append(f"Skipped {self.bad} row(s) missing a name, a date or a Present/Absent status.")
+        return " ".join(bits)
+
+    def unresolved(self):
+        """(name, rows, reason) for every name that wasn't matched, most rows first."""
+        out = [(n, c, "no such athlete") for n, c in self.unmatched_names.items()]
+        out += [(n, c, "on several teams") for n, c in self.ambiguous_names.items()]
+        return sorted(out, key=lambda u: (-u[1], u[0].lower()))
+
+
+def load_attendance_file(path, chunk_rows=BACKFILL_CHUNK_ROWS, report=None):
+    """
+    Backfill from a CSV (or .csv.gz) on disk; returns the AttendanceBackfill.
+    report(rows), if given, hears the line count about once a second. Caller commits.
+    """
+    load = AttendanceBackfill(chunk_rows)
+    reported = time.monotonic()
+    with open_roster_file(path) as f:
+        for row in csv_rows(f, BACKFILL_HEADERS):
+            load.add(row)
+            if report and time.monotonic() - reported > 1:
+                report(load.rows)
+                reported = time.monotonic()
+    if report:
+        report(load.rows)
+    load.finish()
+    return load
+
+
+class BackfillJob(db.Model):
+    """An uploaded attendance backfill; the spooled file is IMPORT_DIR/<id> until it has run."""
+    id = db.Column(db.String(32), primary_key=True)
+    filename = db.Column(db.String(255), nullable=False)  # as uploaded
+    status = db.Column(db.String(10), nullable=False)  # queued | running | done | failed
+    rows_done = db.Column(db.Integer, nullable=False, default=0)  # CSV lines read
+    summary = db.Column(db.Text)  # AttendanceBackfill.summary()
+    unresolved = db.Column(db.Text, nullable=False, default="[]")  # JSON, AttendanceBackfill.unresolved()
+    error = db.Column(db.String(255))
+    created_at = db.Column(db.BigInteger, nullable=False)  # ms since epoch
+    finished_at = db.Column(db.BigInteger)
+
+
+class BackfillRunner(JobRunner):
+    """
+    Runs queued attendance backfills. Each file goes in as one transaction,
+    so a failed job leaves the roll as it was and the file can simply be
+    uploaded again.
+    """
+    model = BackfillJob
+
+    def _build(self, job_id):
+        if not self._claim(job_id):
+            return
+        self._report(job_id, 0)
+        job = db.session.get(BackfillJob, job_id)
+        try:
+            load = load_attendance_file(self.path(job_id), report=lambda rows: self._report(job_id, rows))
+            job.status, job.rows_done = "done", load.rows
+            job.summary, job.unresolved = load.summary(), json.dumps(load.unresolved())
+            job.finished_at = now_ms()
+            db.session.commit()  # the backfill and its job row together
+            roll_matrix.invalidate()
         except Exception as e:
             db.session.rollback()
-            print("❌ CSV import failed:", e)
-            flash(f"Import failed: {e}", "error")
-            return redirect(url_for("import_csv"))
+            job.status, job.error, job.finished_at = "failed", str(e)[:255], now_ms()
+            db.session.commit()
+        for suffix in ("", ".progress"):
+            if os.path.exists(self.path(job_id, suffix)):
+                os.unlink(self.path(job_id, suffix))
 
-    return render_template("import_csv.html")
+    def state(self, job):
+        """The job's status, with a running job whose worker went away as failed."""
+        if job.status == "running" and now_ms() - self.progress(job)[1] > IMPORT_STALL_MS:
+            return "failed"
+        return job.status
 
 
-import csv, io, zipfile, datetime
-from flask import Response, abort
-from functools import wraps
+backfill_runner = BackfillRunner(IMPORT_DIR)
 
-# If you don't already have this:
-def admin_required(f):
-    @wraps(f)
-    def w(*a, **kw):
-        if getattr(current_user, "username", "") != "admin":
-            abort(403)
-        return f(*a, **kw)
-    return w
 
-def _csv_response(rows, headers, filename_base):
-    si = io.StringIO()
-    w = csv.writer(si)
-    w.writerow(headers)
-    for r in rows:
-        w.writerow(r)
-    out = si.getvalue()
-    ts = datetime.datetime.now().strftime("%Y%m%d-%H%M%S")
-    resp = Response(out, mimetype="text/csv; charset=utf-8")
-    resp.headers["Content-Disposition"] = f"attachment; filename={filename_base}-{ts}.csv"
-    return resp
+def start_job_runners():
+    """Boot: start every background job runner, picking up jobs queued before a restart."""
+    for runner in (export_runner, import_runner, backfill_runner):
+        runner.start()
 
-@app.route("/admin/export", methods=["GET"])
+
+def submit_backfill_job(file):
+    """Spool an uploaded attendance file to disk and queue its backfill."""
+    job = BackfillJob(id=uuid.uuid4().hex, filename=(file.filename or "attendance.csv")[:255],
+                      status="queued", rows_done=0, unresolved="[]", created_at=now_ms())
+    os.makedirs(IMPORT_DIR, exist_ok=True)
+    file.save(backfill_runner.path(job.id))
+    db.session.add(job)
+    db.session.commit()
+    backfill_runner.submit(job.id)
+    return job
+
+
+def backfill_job_json(job):
+    status = backfill_runner.state(job)
+    return {
+        "id": job.id,
+        "filename": job.filename,
+        "status": status,
+        "rows_done": backfill_runner.progress(job)[0] if status == "running" else job.rows_done,
+        "summary": job.summary,
+        "unresolved": json.loads(job.unresolved),
+        "error": job.error if job.status == "failed" else ("worker stopped" if status == "failed" else None),
+        "created_at": job.created_at,
+        "finished_at": job.finished_at,
+        "status_url": url_for("backfill_job_status", job_id=job.id),
+    }
+
+
+@app.route("/import_attendance", methods=["GET", "POST"])
 @login_required
-@admin_required
-def export_data():
+def import_attendance():
     """
-    Export CSV of a selected table or a ZIP of all:
-      /admin/export?table=attendance&team_id=1&since=2025-08-01&until=2025-08-31
-      /admin/export?table=all
-    tables: teams | athletes | attendance | coaches | all
+    POST spools an athlete,date,status,notes CSV and queues it as a
+    background BackfillJob (see BackfillRunner); GET shows recent backfills.
     """
-    table = (request.args.get("table") or "all").lower()
-    team_id = request.args.get("team_id", type=int)
-    since = (request.args.get("since") or "").strip()  # YYYY-MM-DD
-    until = (request.args.get("until") or "").strip()
+    wants_json = request.accept_mimetypes.best_match(["text/html", "application/json"]) == "application/json"
+    if request.method == "POST":
+        file = request.files.get("file")
+        if not file or not getattr(file, "filename", ""):
+            flash("No file uploaded.", "error")
+            return redirect(url_for("import_attendance"))
+        job = submit_backfill_job(file)
+        if wants_json:
+            return jsonify(backfill_job_json(job)), 202
+        flash(f"Importing {job.filename}; progress is below.", "success")
+        return redirect(url_for("import_attendance"))
+
+    jobs = [backfill_job_json(j) for j in BackfillJob.query.order_by(BackfillJob.created_at.desc()).limit(10)]
+    busy = any(j["status"] in ("queued", "running") for j in jobs)
+    return render_template("import_attendance.html", jobs=jobs, busy=busy)
+
+
+@app.route("/import_attendance/jobs/<job_id>", methods=["GET"])
+@login_required
+def backfill_job_status(job_id):
+    job = db.session.get(BackfillJob, job_id) or abort(404)
+    return jsonify(backfill_job_json(job))
 
-    ts = datetime.datetime.now().strftime("%Y%m%d-%H%M%S")
 
-    # ----- TEAMS -----
-    if table == "teams":
-        rows = db.session.query(Team.id, Team.name).order_by(Team.id).all()
-        return _csv_response(rows, ["id", "name"], "teams")
+@load_group.command("attendance")
+@click.argument("path", type=click.Path(exists=True, dir_okay=False))
+@click.option("--batch", default=BACKFILL_CHUNK_ROWS, show_default=True, help="Rows per upsert.")
+def load_attendance_command(path, batch):
+    """
+    Backfill attendance from an athlete,date,status,notes CSV (an optional
+    team column tells same-named athletes apart). Unmatched names are listed.
+    """
+    started = time.perf_counter()
+    load = load_attendance_file(path, batch)
+    db.session.commit()
+    roll_matrix.invalidate()
+    print(f"{load.summary()} ({time.perf_counter() - started:.2f}s)")
+    for name, rows, reason in load.unresolved():
+        print(f"  {name}: {rows} row(s), {reason}")
+
+
+# ---------- Duplicate athletes ----------
+#
+# The roster only refuses an exact (case-insensitive) repeat of a name on a
+# team, so "Jon Smith" and "Jonathan Smith" become two athletes with the
+# roll split between them. DuplicateIndex finds likely pairs without
+# scoring everyone against everyone: each name goes into two buckets,
+# Soundex(last) + first initial and Soundex(first) + last initial, and only
+# names sharing a bucket are compared (Jaro-Winkler on each part). Buckets
+# are kept sorted by name, so one that data with a very coarse key blows up
+# is compared only between near neighbours in that order. Imports and
+# manual adds warn about matches; /roster/duplicates and
+# `flask find-duplicates` list every likely pair. Nothing is merged for you.
+
+import bisect
+
+DUPLICATE_SCORE = 0.9  # name similarity (0-1) that counts as a likely duplicate
+DUPLICATE_BUCKET_MAX = 500  # compare every pair in a bucket up to this size...
+DUPLICATE_WINDOW = 25  # ...and past it, each name with this many neighbours either side
+
+_SOUNDEX_CODES = {c: str(d) for d, letters in enumerate(
+    ("aeiouyhw", "bfpv", "cgjkqsxz", "dt", "l", "mn", "r")) for c in letters}
+
+
+def soundex(word):
+    """Four-character Soundex ("Smith", "Smyth" -> "s530"); "" without letters."""
+    letters = [c for c in word.lower() if c in _SOUNDEX_CODES]
+    if not letters:
+        return ""
+    out, prev = letters[0], _SOUNDEX_CODES[letters[0]]
+    for c in letters[1:]:
+        code = _SOUNDEX_CODES[c]
+        if code != "0" and code != prev:
+            out += code
+        if c not in "hw":  # h and w don't separate letters with the same code
+            prev = code
+    return (out + "000")[:4]
+
+
+@lru_cache(maxsize=1 << 16)  # rosters repeat first and last names a lot
+def jaro_winkler(a, b):
+    if a == b:
+        return 1.0
+    if not a or not b:
+        return 0.0
+    window = max(len(a), len(b)) // 2 - 1
+    used = [False] * len(b)
+    hits_a = []
+    for i, c in enumerate(a):
+        end = i + window + 1
+        j = b.find(c, max(0, i - window), end)
+        while j != -1 and used[j]:
+            j = b.find(c, j + 1, end)
+        if j != -1:
+            used[j] = True
+            hits_a.append(c)
+    if not hits_a:
+        return 0.0
+    hits_b = [c for c, u in zip(b, used) if u]
+    m = len(hits_a)
+    transpositions = sum(x != y for x, y in zip(hits_a, hits_b)) / 2
+    jaro = (m / len(a) + m / len(b) + (m - transpositions) / m) / 3
+    prefix = 0
+    for x, y in zip(a[:4], b[:4]):
+        if x != y:
+            break
+        prefix += 1
+    return jaro + prefix * 0.1 * (1 - jaro)
+
+
+def name_similarity(first_a, last_a, first_b, last_b, floor=0.0):
+    """
+    0-1 for two normalized names, the mean of the first- and last-name
+    scores; a first name that starts the other (Jon, Jonathan) counts as
+    close. 0.0 as soon as the last names alone rule out reaching `floor`.
+    """
+    last = jaro_winkler(last_a, last_b)
+    if round((1 + last) / 2, 3) < floor:
+        return 0.0
+    first = jaro_winkler(first_a, first_b)
+    short, long_ = sorted((first_a, first_b), key=len)
+    if len(short) >= 2 and long_.startswith(short):
+        first = max(first, 0.95)
+    return round((first + last) / 2, 3)
+
+
+class DuplicateIndex:
+    """Names in blocking buckets, each under a caller-chosen unique ref (e.g. athlete id)."""
+
+    def __init__(self, min_score=DUPLICATE_SCORE):
+        self.min_score = min_score
+        self.buckets = defaultdict(list)
+
+    @staticmethod
+    def _keys(first, last):
+        return {("last", soundex(last), first[:1]), ("first", soundex(first), last[:1])}
+
+    @staticmethod
+    def _order(entry):
+        return entry[2], entry[1]  # last, first
+
+    def add(self, ref, first, last, team_id=None):
+        first, last = roster_name_key(first, last)
+        for k in self._keys(first, last):
+            bisect.insort(self.buckets[k], (ref, first, last, team_id), key=self._order)
+
+    def _near(self, bucket, first, last):
+        if len(bucket) <= DUPLICATE_BUCKET_MAX:
+            return bucket
+        i = bisect.bisect_left(bucket, (last, first), key=self._order)
+        return bucket[max(0, i - DUPLICATE_WINDOW):i + DUPLICATE_WINDOW]
+
+    def _scored(self, first, last):
+        first, last = roster_name_key(first, last)
+        seen = set()
+        for k in self._keys(first, last):
+            for ref, f, l, team_id in self._near(self.buckets.get(k, []), first, last):
+                if ref in seen:
+                    continue
+                seen.add(ref)
+                score = name_similarity(first, last, f, l, self.min_score)
+                if score >= self.min_score:
+                    yield ref, team_id, score
+
+    def matches(self, first, last):
+        """(ref, team_id, score) for indexed names that look like this one, best first."""
+        return sorted(self._scored(first, last), key=lambda m: -m[2])
+
+    def any_match(self, first, last):
+        return next(self._scored(first, last), None) is not None
+
+    def pairs(self):
+        """(ref, ref, score) for every likely duplicate pair, best first."""
+        seen, out = set(), []
+        for bucket in self.buckets.values():
+            window = len(bucket) if len(bucket) <= DUPLICATE_BUCKET_MAX else DUPLICATE_WINDOW
+            for i, (ref_a, first_a, last_a, _) in enumerate(bucket):
+                for ref_b, first_b, last_b, _ in bucket[i + 1:i + 1 + window]:
+                    if (ref_a, ref_b) in seen:
+                        continue  # shares the other bucket too
+                    seen.add((ref_a, ref_b))
+                    score = name_similarity(first_a, last_a, first_b, last_b, self.min_score)
+                    if score >= self.min_score:
+                        out.append((ref_a, ref_b, score))
+        return sorted(out, key=lambda p: -p[2])
+
+
+def _roster_for_duplicates():
+    """Athlete rows (with team_name) by id, and a DuplicateIndex over them."""
+    rows = {a.id: a for a in db.session.query(
+        Athlete.id, Athlete.first_name, Athlete.last_name, Athlete.team_id, Team.name.label("team_name"),
+    ).outerjoin(Team, Team.id == Athlete.team_id)}
+    index = DuplicateIndex()
+    for a in rows.values():
+        index.add(a.id, a.first_name, a.last_name, a.team_id)
+    return rows, index
+
+
+def similar_athletes(first, last, exclude_id=None):
+    """(athlete row, score) for athletes whose name looks like this one, best first."""
+    rows, index = _roster_for_duplicates()
+    return [(rows[aid], score) for aid, _, score in index.matches(first, last) if aid != exclude_id]
+
+
+def roster_duplicates(min_score=DUPLICATE_SCORE):
+    """(athlete row, athlete row, score) for likely duplicate pairs on the roster, best first."""
+    rows, index = _roster_for_duplicates()
+    index.min_score = min_score
+    return [(rows[a], rows[b], score) for a, b, score in index.pairs()]
+
+
+def similar_to_adds(adds):
+    """For each athlete a roster diff would add, the closest one already on the roster (row, score) or None."""
+    rows, index = _roster_for_duplicates()
+    out = []
+    for values in adds:
+        m = index.matches(values["first_name"], values["last_name"])
+        out.append((rows[m[0][0]], m[0][2]) if m else None)
+    return out
+
+
+@app.route("/roster/duplicates", methods=["GET"])
+@login_required
+def roster_duplicates_page():
+    """Likely duplicate athletes across the whole roster."""
+    try:
+        min_score = min(max(float(request.args.get("min_score") or DUPLICATE_SCORE), 0.5), 1.0)
+    except ValueError:
+        min_score = DUPLICATE_SCORE
+    pairs = roster_duplicates(min_score)
+    return render_template("roster_duplicates.html", pairs=pairs, min_score=min_score)
 
-    # ----- ATHLETES -----
-    if table == "athletes":
-        q = (db.session.query(
-                Athlete.id,
-                Athlete.first_name,
-                Athlete.last_name,
-                Athlete.grade,
-                Athlete.gender,
-                Athlete.team_id,
-                Team.name.label("team_name"),
-            )
-            .join(Team, Team.id == Athlete.team_id, isouter=True)
-            .order_by(Athlete.last_name, Athlete.first_name))
-        if team_id:
-            q = q.filter(Athlete.team_id == team_id)
-        rows = q.all()
-        return _csv_response(
-            rows,
-            ["id","first_name","last_name","grade","gender","team_id","team_name"],
-            "athletes"
-        )
 
-    # ----- ATTENDANCE -----
-    if table == "attendance":
-        q = (db.session.query(
-                Attendance.id,
-                Attendance.athlete_id,
-                Athlete.first_name,
-                Athlete.last_name,
-                Athlete.team_id,
-                Team.name.label("team_name"),
-                Attendance.date,
-                Attendance.status,
-                Attendance.notes,
-            )
-            .join(Athlete, Athlete.id == Attendance.athlete_id)
-            .join(Team, Team.id == Athlete.team_id, isouter=True)
+@app.cli.command("find-duplicates")
+@click.option("--min-score", default=DUPLICATE_SCORE, show_default=True, help="Similarity (0-1) to report.")
+def find_duplicates_command(min_score):
+    """List athletes whose names look like the same person entered twice."""
+    started = time.perf_counter()
+    pairs = roster_duplicates(min_score)
+    for a, b, score in pairs:
+        print(f"{score:.3f}  {a.first_name} {a.last_name} ({a.team_name or 'no team'}, #{a.id})"
+              f"  ~  {b.first_name} {b.last_name} ({b.team_name or 'no team'}, #{b.id})")
+    print(f"{len(pairs)} likely duplicate pair(s) ({time.perf_counter() - started:.2f}s)")
+
+
+from datetime import date
+from sqlalchemy import func, and_
+
+def rolling_absences_query(absences, practices, team_id=None, as_of=""):
+    """
+    (athlete_id, absent) for athletes absent at least `absences` times in
+    their last `practices` practice days of the season, up to `as_of`.
+    ROW_NUMBER() numbers each athlete's days newest first; in explicit mode
+    the window is read from ix_attendance_athlete_date_status alone, and only
+    one season of it, however many seasons are stored.
+    """
+    as_of = as_of or central_today()
+    since = season_bounds(season_of(as_of))[0]
+    if implicit_present():
+        # every held practice day counts, Present unless a row says otherwise
+        athlete_id, day = Athlete.id, PracticeDay.date
+        status = func.coalesce(Attendance.status, "Present")
+        marks = (
+            select(athlete_id.label("athlete_id"), status.label("status"),
+                   func.row_number().over(partition_by=athlete_id, order_by=day.desc()).label("rn"))
+            .select_from(Athlete)
+            .join(PracticeDay, practice_day_join(since, as_of))
+            .outerjoin(Attendance, and_(Attendance.athlete_id == Athlete.id,
+                                        Attendance.date == PracticeDay.date))
         )
         if team_id:
-            q = q.filter(Athlete.team_id == team_id)
-        if since:
-            q = q.filter(Attendance.date >= since)
-        if until:
-            q = q.filter(Attendance.date <= until)
-        q = q.order_by(Attendance.date.desc(), Athlete.last_name, Athlete.first_name)
-        rows = q.all()
-        return _csv_response(
-            rows,
-            ["id","athlete_id","first_name","last_name","team_id","team_name","date","status","notes"],
-            "attendance"
+            marks = marks.where(Athlete.team_id == team_id)
+    else:
+        athlete_id, day = Attendance.athlete_id, Attendance.date
+        marks = (
+            select(athlete_id.label("athlete_id"), Attendance.status.label("status"),
+                   func.row_number().over(partition_by=athlete_id, order_by=day.desc()).label("rn"))
+            .where(Attendance.status.in_(["Present", "Absent"]), day >= since, day <= as_of)
         )
-
-    # ----- COACHES (no password hashes) -----
-    if table == "coaches":
-        q = (db.session.query(
-                Coach.id, Coach.name, Coach.username, Coach.email, Coach.team_id, Team.name.label("team_name")
-            )
-            .join(Team, Team.id == Coach.team_id, isouter=True)
-            .order_by(Coach.name))
         if team_id:
-            q = q.filter(Coach.team_id == team_id)
-        rows = q.all()
-        return _csv_response(
-            rows,
-            ["id","name","username","email","team_id","team_name"],
-            "coaches"
-        )
+            marks = marks.where(athlete_id.in_(select(Athlete.id).where(Athlete.team_id == team_id)))
+    marks = marks.subquery()
+
+    absent = func.sum(case((marks.c.status == "Absent", 1), else_=0))
+    return (
+        select(marks.c.athlete_id, absent.label("absent"))
+        .where(marks.c.rn <= practices)
+        .group_by(marks.c.athlete_id)
+        .having(absent >= absences)
+    )
 
-    # ----- ALL: build a ZIP with 4 CSVs -----
-    if table == "all":
-        mem = io.BytesIO()
-        with zipfile.ZipFile(mem, mode="w", compression=zipfile.ZIP_DEFLATED) as zf:
-            # teams
-            teams = db.session.query(Team.id, Team.name).order_by(Team.id).all()
-            _add_csv_to_zip(zf, "teams", ["id","name"], teams, ts)
-
-            # athletes
-            aq = (db.session.query(
-                    Athlete.id, Athlete.first_name, Athlete.last_name,
-                    Athlete.grade, Athlete.gender, Athlete.team_id,
-                    Team.name.label("team_name"))
-                  .join(Team, Team.id == Athlete.team_id, isouter=True)
-                  .order_by(Athlete.last_name, Athlete.first_name))
-            if team_id:
-                aq = aq.filter(Athlete.team_id == team_id)
-            _add_csv_to_zip(zf, "athletes",
-                ["id","first_name","last_name","grade","gender","team_id","team_name"],
-                aq.all(), ts)
-
-            # attendance
-            atq = (db.session.query(
-                    Attendance.id, Attendance.athlete_id,
-                    Athlete.first_name, Athlete.last_name,
-                    Athlete.team_id, Team.name.label("team_name"),
-                    Attendance.date, Attendance.status, Attendance.notes)
-                   .join(Athlete, Athlete.id == Attendance.athlete_id)
-                   .join(Team, Team.id == Athlete.team_id, isouter=True))
-            if team_id:
-                atq = atq.filter(Athlete.team_id == team_id)
-            if since:
-                atq = atq.filter(Attendance.date >= since)
-            if until:
-                atq = atq.filter(Attendance.date <= until)
-            atq = atq.order_by(Attendance.date.desc(), Athlete.last_name, Athlete.first_name)
-            _add_csv_to_zip(zf, "attendance",
-                ["id","athlete_id","first_name","last_name","team_id","team_name","date","status","notes"],
-                atq.all(), ts)
-
-            # coaches
-            cq = (db.session.query(
-                    Coach.id, Coach.name, Coach.username, Coach.email, Coach.team_id, Team.name.label("team_name"))
-                  .join(Team, Team.id == Coach.team_id, isouter=True)
-                  .order_by(Coach.name))
-            if team_id:
-                cq = cq.filter(Coach.team_id == team_id)
-            _add_csv_to_zip(zf, "coaches",
-                ["id","name","username","email","team_id","team_name"],
-                cq.all(), ts)
-
-        mem.seek(0)
-        resp = Response(mem.read(), mimetype="application/zip")
-        resp.headers["Content-Disposition"] = f"attachment; filename=export-{ts}.zip"
-        return resp
-
-    abort(400)
-
-def _add_csv_to_zip(zf, base, headers, rows, ts):
-    si = io.StringIO()
-    w = csv.writer(si)
-    w.writerow(headers)
-    for r in rows:
-        w.writerow(r)
-    zf.writestr(f"{base}-{ts}.csv", si.getvalue())
 
+def rolling_absences(absences, practices, team_id=None, as_of="", conn=None):
+    return (conn or db.session).execute(
+        rolling_absences_query(absences, practices, team_id, as_of)).all()
 
 
-from datetime import date
-from sqlalchemy import func, and_
+def flag_label(rule, value):
+    """Human wording for one athlete_flag row."""
+    if rule == "recent":
+        return f"{value} of the last {FLAG_RECENT_PRACTICES} practices missed"
+    if rule == "consecutive":
+        return f"{value} absences in a row"
+    return f"{value} absences this season"
+
 
 @app.route("/flagged_athletes", methods=["GET", "POST"])
 @login_required
 def flagged_athletes():
+    """
+    Lists the athlete_flag rows for a season. Flags are evaluated whenever
+    an athlete's roll changes (see refresh_season_stats), so this is one
+    indexed lookup rather than an aggregate over every absence.
+    rule=rolling instead asks for any "N of the last K practices" window,
+    answered live by rolling_absences(); rule=range (or since / until /
+    min_absences without a rule) for at least min_absences absences between
+    two dates, from the day index (range_counts()).
+    """
     # ---- Inputs ----
-    # threshold: minimum absences to flag (default 5)
-    try:
-        min_abs = int(request.values.get("min_absences", 5))
-    except (TypeError, ValueError):
-        min_abs = 5
-
-    # date filters (optional). You’re using string dates (ISO) in Attendance.date, so keep them as strings.
-    since = (request.values.get("since") or "").strip()  # "YYYY-MM-DD" or ""
-    until = (request.values.get("until") or "").strip()
+    rule = request.values.get("rule") or ""
+    if rule not in FLAG_RULES and rule not in ("rolling", "range"):
+        rule = ""
+    since = parse_day(request.values.get("since"))  # "YYYY-MM-DD" or ""
+    until = parse_day(request.values.get("until"))
+    min_abs = request.values.get("min_absences", type=int)
+    if "rule" not in request.values and (since or until or min_abs is not None):
+        rule = "range"  # links from before the rule picker
+    min_abs = max(min_abs if min_abs is not None else 5, 1)
+    season = request.values.get("season", type=int) or season_of(central_today())
+    window_absences = max(request.values.get("absences", type=int) or 3, 1)
+    window_practices = max(request.values.get("practices", type=int) or 10, 1)
 
     # team filter: admin can pick; coaches default to their team
     raw_team_id = request.values.get("team_id")
@@ -954,42 +4885,93 @@ def flagged_athletes():
     if selected_team_id is None and getattr(current_user, "team_id", None):
         selected_team_id = current_user.team_id
 
+    etag = roll_etag(selected_team_id)
+    cached = not_modified(etag)
+    if cached:
+        return cached
+
     # ---- Query ----
-    q = (
-        db.session.query(
-            Attendance.athlete_id.label("athlete_id"),
-            func.count(Attendance.id).label("absence_count"),
+    if rule == "rolling":
+        # the season's last day, or today while it's still running
+        as_of = min(central_today(), (pydt.date.fromisoformat(season_bounds(season)[1])
+                                      - timedelta(days=1)).isoformat())
+        windows = rolling_absences(window_absences, window_practices, selected_team_id, as_of)
+        hits = {aid: n for aid, n in windows}
+        q = (
+            db.session.query(
+                Athlete.id,
+                Athlete.first_name,
+                Athlete.last_name,
+                Team.name.label("team_name"),
+                literal("rolling"),
+                literal(0),
+                literal(0),
+            )
+            .join(Team, Team.id == Athlete.team_id, isouter=True)
+            .filter(Athlete.id.in_(hits))
         )
-        .join(Athlete, Athlete.id == Attendance.athlete_id)
-        .filter(Attendance.status == "Absent")
-        .group_by(Attendance.athlete_id)
-        .having(func.count(Attendance.id) >= min_abs)
-    )
-
-    # Apply optional filters
-    if selected_team_id:
-        q = q.filter(Athlete.team_id == selected_team_id)
-    if since:
-        q = q.filter(Attendance.date >= since)
-    if until:
-        q = q.filter(Attendance.date <= until)
-
-    sub = q.subquery()
-
-    # Join to get names + team
-    flagged = (
-        db.session.query(
-            Athlete.id,
-            Athlete.first_name,
-            Athlete.last_name,
-            Team.name.label("team_name"),
-            sub.c.absence_count,
+    elif rule == "range":
+        # any since/until range: two day-index lookups per athlete
+        _, absent = range_counts(since, until)
+        q = (
+            db.session.query(
+                Athlete.id,
+                Athlete.first_name,
+                Athlete.last_name,
+                Team.name.label("team_name"),
+                literal("range"),
+                absent,
+                literal(0),
+            )
+            .join(Team, Team.id == Athlete.team_id, isouter=True)
+            .filter(absent >= min_abs)
         )
-        .join(sub, Athlete.id == sub.c.athlete_id)
-        .join(Team, Team.id == Athlete.team_id, isouter=True)
-        .order_by(sub.c.absence_count.desc(), Athlete.last_name, Athlete.first_name)
-        .all()
-    )
+        if selected_team_id:
+            q = q.filter(Athlete.team_id == selected_team_id)
+    else:
+        q = (
+            db.session.query(
+                Athlete.id,
+                Athlete.first_name,
+                Athlete.last_name,
+                Team.name.label("team_name"),
+                AthleteFlag.rule,
+                AthleteFlag.value,
+                AthleteFlag.raised_at,
+            )
+            .join(Athlete, Athlete.id == AthleteFlag.athlete_id)
+            .join(Team, Team.id == Athlete.team_id, isouter=True)
+            .filter(AthleteFlag.season == season)
+        )
+        if rule:
+            q = q.filter(AthleteFlag.rule == rule)
+        if selected_team_id:
+            q = q.filter(Athlete.team_id == selected_team_id)
+
+    # one entry per athlete with every rule they meet
+    central = ZoneInfo("America/Chicago")
+    by_athlete = {}
+    for aid, first_name, last_name, team_name, flag_rule, value, raised_at in q.all():
+        entry = by_athlete.setdefault(aid, {
+            "id": aid, "first_name": first_name, "last_name": last_name,
+            "team_name": team_name, "flags": [], "raised_at": 0,
+        })
+        if flag_rule == "rolling":
+            entry["flags"].append(f"{hits[aid]} of the last {window_practices} practices missed")
+        elif flag_rule == "range":
+            entry["absences"] = value
+            span = (f"{since} to {until}" if since and until else f"since {since}" if since
+                    else f"through {until}" if until else "in all")
+            entry["flags"].append(f"{value} absence{'' if value == 1 else 's'} {span}")
+        else:
+            entry["flags"].append(flag_label(flag_rule, value))
+        entry["raised_at"] = max(entry["raised_at"], raised_at)
+    flagged = sorted(by_athlete.values(),
+                     key=lambda e: (-len(e["flags"]), -e.get("absences", 0), -e["raised_at"],
+                                    e["last_name"], e["first_name"]))
+    for e in flagged:
+        e["raised_on"] = pydt.datetime.fromtimestamp(e["raised_at"] / 1000, central).date().isoformat() \
+            if e["raised_at"] else None
 
     # Teams list for dropdown (admin sees all; coaches see theirs)
     if getattr(current_user, "username", "") == "admin":
@@ -997,15 +4979,21 @@ def flagged_athletes():
     else:
         teams = Team.query.filter(Team.id == current_user.team_id).all()
 
-    return render_template(
+    return tagged(render_template(
         "flagged.html",
         flagged=flagged,
         teams=teams,
         selected_team_id=selected_team_id,
+        rule=rule,
+        season=season,
+        rules=FLAG_RULES,
+        recent_practices=FLAG_RECENT_PRACTICES,
+        window_absences=window_absences,
+        window_practices=window_practices,
         min_absences=min_abs,
         since=since,
         until=until,
-    )
+    ), etag)
 
 from sqlalchemy import func
 from sqlalchemy.exc import IntegrityError
@@ -1045,15 +5033,23 @@ def manage_roster():
                 return redirect(url_for("manage_roster"))
 
             try:
-                db.session.add(Athlete(
+                athlete = Athlete(
                     first_name=first_name,
                     last_name=last_name,
                     grade=grade_int,
                     gender=gender,
-                    team_id=team_id_int
-                ))
+                    team_id=team_id_int,
+                    active_since=central_today()
+                )
+                db.session.add(athlete)
+                bump_roll_version(db.session.connection(), [team_id_int])
                 db.session.commit()
+                roll_matrix.invalidate(season_of(central_today()))
                 flash(f"Added athlete {first_name} {last_name}.", "success")
+                # not blocked: a near-miss name may still be the same athlete
+                for a, _ in similar_athletes(first_name, last_name, exclude_id=athlete.id)[:3]:
+                    flash(f"{first_name} {last_name} looks like {a.first_name} {a.last_name} "
+                          f"({a.team_name or 'no team'}) already on the roster. Same athlete?", "warning")
             except IntegrityError:
                 db.session.rollback()
                 flash("Duplicate detected by database constraint.", "error")
@@ -1101,13 +5097,25 @@ def manage_roster():
                     flash(f"Edit blocked: {first_name} {last_name} already on this team.", "error")
                     return redirect(url_for("manage_roster"))
 
+                old_team_id = athlete.team_id
+                team_changed = old_team_id != team_id_int
+                if team_changed:
+                    # gone from the old team's export (delta syncs filtered by team)
+                    tombstone_athletes(db.session.connection(), [athlete.id])
                 athlete.first_name = first_name
                 athlete.last_name  = last_name
                 athlete.grade      = grade_int
                 athlete.gender     = gender
                 athlete.team_id    = team_id_int
 
+                if team_changed and implicit_present():
+                    # implicit Present days come from the new team's calendar now
+                    db.session.flush()
+                    roll_changed(db.session.connection(), [athlete.id])
+                bump_roll_version(db.session.connection(), [old_team_id, team_id_int])
                 db.session.commit()
+                if team_changed:
+                    roll_matrix.invalidate()
                 flash("Athlete updated.", "success")
             except IntegrityError:
                 db.session.rollback()
@@ -1120,9 +5128,16 @@ def manage_roster():
             athlete_id = request.form.get("athlete_id")
             if athlete_id:
                 try:
+                    team_ids = [t for (t,) in db.session.query(Athlete.team_id).filter_by(id=athlete_id)]
+                    bump_roll_version(db.session.connection(), team_ids)
+                    tombstone_athletes(db.session.connection(), [int(athlete_id)])
                     Attendance.query.filter_by(athlete_id=athlete_id).delete()
+                    AthleteSeason.query.filter_by(athlete_id=athlete_id).delete()
+                    AthleteFlag.query.filter_by(athlete_id=athlete_id).delete()
+                    AthleteDayIndex.query.filter_by(athlete_id=athlete_id).delete()
                     Athlete.query.filter_by(id=athlete_id).delete()
                     db.session.commit()
+                    roll_matrix.invalidate()
                     flash("Athlete removed.", "success")
                 except Exception as e:
                     db.session.rollback()
@@ -1164,7 +5179,7 @@ def manage_absences():
     delete_id = request.form.get("delete_id")
 
     # Optional add-absence inputs
-    add_date = (request.form.get("add_date") or "").strip()
+    add_date = parse_day(request.form.get("add_date"))
     add_note = (request.form.get("add_note") or "").strip()
     action = request.form.get("action")
 
@@ -1191,7 +5206,11 @@ def manage_absences():
 
 
     # Handle add (mark a date as Absent, upserting if a Present exists)
-    if action == "add_absence" and sid and add_date:
+    if action == "add_absence" and sid and add_date and implicit_present() \
+            and off_calendar([(sid, add_date)]):
+        flash(f"{add_date} isn't a practice day for this athlete's team; plan it on the calendar first.",
+              "error")
+    elif action == "add_absence" and sid and add_date:
         try:
             rec = Attendance.query.filter_by(athlete_id=sid, date=add_date).first()
             if rec:
@@ -1241,8 +5260,14 @@ def athlete_report():
         selected_id = None
 
     # Optional date range (ISO strings, matches your Attendance.date type)
-    since = (request.values.get("since") or "").strip()
-    until = (request.values.get("until") or "").strip()
+    since = parse_day(request.values.get("since"))
+    until = parse_day(request.values.get("until"))
+
+    # any athlete can be picked, so this page follows every team's version
+    etag = roll_etag()
+    cached = not_modified(etag)
+    if cached:
+        return cached
 
     # Limit athletes list to coach's team unless admin
     if getattr(current_user, "username", "") == "admin":
@@ -1267,14 +5292,24 @@ def athlete_report():
             q = q.filter(Attendance.date <= until)
         absences = q.order_by(Attendance.date.desc()).all()
 
-    return render_template(
+    # Present / Absent totals for the range, straight from the day index
+    present_days = absent_days = None
+    if selected_id:
+        present, absent = range_counts(since, until)
+        present_days, absent_days = (
+            db.session.query(present, absent).filter(Athlete.id == selected_id).one()
+        )
+
+    return tagged(render_template(
         "athlete_report.html",
         athletes=athletes,
         selected_id=selected_id,
         absences=absences,
         since=since,
         until=until,
-    )
+        present_days=present_days,
+        absent_days=absent_days,
+    ), etag)
 
 
 # Reset coach passwords
@@ -1336,35 +5371,57 @@ def seed_teams():
 
 
 if __name__ == "__main__":
-    with app.app_context():
+    with app.app_context(), schema_lock():
         db.create_all()
         ensure_athlete_columns()
+        ensure_attendance_columns()
+        ensure_practice_day_columns()
+        migrate_day_columns()
         ensure_attendance_unique_index()
+        ensure_attendance_range_index()
+        ensure_attendance_covering_index()
+        ensure_change_seq_columns()
         ensure_athlete_unique_index(per_team=True)   # <-- keep this
         print("✅ Tables created")
         seed_default_coach()
         seed_teams()
+        ensure_practice_days()
+        ensure_roll_summaries()
         if os.getenv("RENAME_TEAMS_ON_BOOT") == "1":
             rename_teams_to_coaches()
+        start_job_runners()
 
 
     app.run(debug=True)
 else:
-    with app.app_context():
+    with app.app_context(), schema_lock():
         try:
             db.create_all()
             ensure_athlete_columns()
+            ensure_attendance_columns()
+            ensure_practice_day_columns()
+            migrate_day_columns()
             ensure_attendance_unique_index()
+            ensure_attendance_range_index()
+            ensure_attendance_covering_index()
+            ensure_change_seq_columns()
             ensure_athlete_unique_index(per_team=True)   # <-- add this here too
             print("✅ Tables created")
             seed_default_coach()
             seed_teams()
+            ensure_practice_days()
+            ensure_roll_summaries()
             if os.getenv("RENAME_TEAMS_ON_BOOT") == "1":
                 rename_teams_to_coaches()
+            # web processes pick up queued jobs at boot; `flask <command>` runs don't claim them
+            if click.get_current_context(silent=True) is None:
+                start_job_runners()
 
 
         except Exception as e:
+            # don't serve a half-migrated schema
             print(f"❌ Error during db.create_all(): {e}")
+            raise
 
 
 
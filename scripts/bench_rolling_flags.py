@@ -0,0 +1,81 @@
+"""
+Time rolling_absences() on a throwaway SQLite roll, with and without the
+covering index ix_attendance_athlete_date_status.
+
+    python scripts/bench_rolling_flags.py --athletes 500 --seasons 3 --days 120
+"""
+import argparse
+import datetime as pydt
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+# app.py boots its schema on import: point it at a scratch database that
+# stores every mark (explicit mode) before importing it
+_tmp = tempfile.mkdtemp(prefix="bench-rolling-flags-")
+os.environ["DATABASE_URL"] = "sqlite:///" + os.path.join(_tmp, "bench.db")
+os.environ["ROLL_MATRIX_DIR"] = os.path.join(_tmp, "roll-matrix")
+os.environ["IMPLICIT_PRESENT"] = "0"
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import insert, text  # noqa: E402
+
+from app import (app, db, Athlete, Attendance, Team,  # noqa: E402
+                 rolling_absences, rolling_absences_query)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--athletes", type=int, default=500)
+    parser.add_argument("--seasons", type=int, default=3)
+    parser.add_argument("--days", type=int, default=120, help="Practice days per season.")
+    args = parser.parse_args()
+
+    random.seed(7)
+    start = pydt.date(pydt.date.today().year - args.seasons, 8, 1)
+    dates = [(start + pydt.timedelta(days=s * 365 + d)).isoformat()
+             for s in range(args.seasons) for d in range(args.days)]
+
+    with app.app_context():
+        engine = db.engine
+        with engine.begin() as conn:
+            conn.execute(text("DROP INDEX IF EXISTS ix_attendance_athlete_date_status"))
+            teams = conn.execute(db.select(Team.id).order_by(Team.id)).scalars().all()
+            conn.execute(insert(Athlete.__table__), [
+                {"id": a, "first_name": f"F{a}", "last_name": f"L{a}", "team_id": teams[a % len(teams)]}
+                for a in range(1, args.athletes + 1)])
+            for d in dates:
+                conn.execute(insert(Attendance.__table__), [
+                    {"athlete_id": a, "date": d,
+                     "status": "Absent" if random.random() < 0.08 else "Present"}
+                    for a in range(1, args.athletes + 1)])
+        print(f"{args.athletes} athletes x {len(dates)} days = {args.athletes * len(dates)} attendance rows")
+
+        def run(label):
+            with engine.connect() as conn:
+                times = []
+                for _ in range(5):
+                    t0 = time.perf_counter()
+                    flagged = rolling_absences(3, 10, as_of=dates[-1], conn=conn)
+                    times.append(time.perf_counter() - t0)
+                print(f"{label}: {statistics.median(times) * 1000:.1f} ms median, {len(flagged)} flagged")
+
+        run("without covering index")
+        with engine.begin() as conn:
+            conn.execute(text("CREATE INDEX ix_attendance_athlete_date_status "
+                              "ON attendance (athlete_id, date DESC, status)"))
+            conn.execute(text("ANALYZE"))
+        run("with covering index   ")
+        with engine.connect() as conn:
+            q = rolling_absences_query(3, 10, as_of=dates[-1])
+            sql = str(q.compile(engine, compile_kwargs={"literal_binds": True}))
+            plan = conn.execute(text("EXPLAIN QUERY PLAN " + sql)).all()
+        for row in plan:
+            print("  plan:", row[-1])
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+import os
+import sys
+import tempfile
+
+import pytest
+
+# app.py reads its settings and boots the schema at import time
+_tmp = tempfile.mkdtemp(prefix="attendance-tests-")
+os.environ["DATABASE_URL"] = "sqlite:///" + os.path.join(_tmp, "test.db")
+os.environ["ROLL_MATRIX_DIR"] = os.path.join(_tmp, "matrix")
+os.environ["EXPORT_DIR"] = os.path.join(_tmp, "exports")
+os.environ["IMPORT_DIR"] = os.path.join(_tmp, "imports")
+os.environ["SECRET_KEY"] = "test"
+os.environ.pop("IMPLICIT_PRESENT", None)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app as app_module  # noqa: E402
+from app import app, db, Athlete, Team  # noqa: E402
+
+
+@pytest.fixture(params=[False, True], ids=["explicit", "implicit"])
+def mode(request):
+    """Run the test in both storage modes."""
+    return request.param
+
+
+@pytest.fixture
+def ctx(request):
+    """An app context on an empty database (teams and the admin coach seeded)."""
+    implicit = request.getfixturevalue("mode") if "mode" in request.fixturenames else False
+    app.config["IMPLICIT_PRESENT"] = implicit
+    with app.app_context():
+        for table in reversed(db.metadata.sorted_tables):
+            db.session.execute(table.delete())
+        db.session.commit()
+        app_module.seed_default_coach()
+        app_module.seed_teams()
+        app_module.roll_matrix.invalidate()
+        yield app_module
+        db.session.rollback()
+    app.config["IMPLICIT_PRESENT"] = False
+
+
+@pytest.fixture
+def athletes(ctx):
+    """Six athletes, three on each of the first two teams; returns their ids."""
+    teams = Team.query.order_by(Team.id).all()
+    rows = [Athlete(first_name=f"First{i}", last_name=f"Last{i}", team_id=teams[i % 2].id)
+            for i in range(6)]
+    db.session.add_all(rows)
+    db.session.commit()
+    return [a.id for a in rows]
+
+
+@pytest.fixture
+def client(ctx):
+    c = app.test_client()
+    c.environ_base["wsgi.url_scheme"] = "https"
+    r = c.post("/login", data={"username": "admin", "password": "adminpass"})
+    assert r.status_code == 302
+    return c
@@ -0,0 +1,25 @@
+from app import db, Athlete, Team, now_ms
+
+
+def test_grid_pivots_days_and_pages_by_name(ctx, mode, client, athletes):
+    team = Team.query.order_by(Team.id).first()
+    a0, a2, a4 = [aid for aid in athletes if db.session.get(Athlete, aid).team_id == team.id]
+    days = ["2025-09-02", "2025-09-03", "2025-09-04"]
+    ctx.plan_practice_days(team.id, days)
+    r = client.post("/attendance/sync", json={"ops": [
+        {"key": f"g{i}", "ts": now_ms(), "op": "set_status", "athlete_id": a0, "date": d,
+         "status": "Absent" if d == days[1] else "Present"} for i, d in enumerate(days)]
+        + [{"key": "note", "ts": now_ms(), "op": "set_note", "athlete_id": a0, "date": days[1], "note": "sick"}]})
+    assert r.status_code == 200
+
+    args = f"team_id={team.id}&since=2025-09-01&until=2025-09-30&limit=2"
+    text = client.get(f"/attendance_grid?{args}").get_data(as_text=True)
+    assert text.count('<th title="2025-09-') == 3
+    assert "First0 Last0" in text and "First2 Last2" in text and "First4 Last4" not in text
+    assert 'class="absent" title="sick">A*' in text
+    assert "after_id=" in text  # a next page
+
+    text = client.get(f"/attendance_grid?{args}&after_last=Last2&after_first=First2&after_id={a2}")\
+        .get_data(as_text=True)
+    assert "First4 Last4" in text and "First0 Last0" not in text
+    assert "after_id=" not in text.split("First page")[-1]
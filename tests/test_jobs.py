@@ -0,0 +1,113 @@
+import csv
+import io
+import os
+import time
+
+import pytest
+
+from app import db, Athlete, Attendance, ExportJob, ImportJob, ImportRunner, JobRunner, PracticeDay, Team, now_ms
+
+
+def test_job_runner_needs_a_build():
+    class Half(JobRunner):
+        pass
+
+    with pytest.raises(TypeError):
+        Half("/tmp")
+
+
+def test_import_stalls_on_its_own_clock(ctx):
+    now = now_ms()
+    job = ImportJob(id="a" * 32, filename="roster.csv", status="running", rows_done=0,
+                    counts="{}", created_at=now, updated_at=now - ctx.IMPORT_STALL_MS + 1000)
+    db.session.add(job)
+    db.session.commit()
+    assert ctx.import_runner.state(job) == "running"
+    job.updated_at = now - ctx.IMPORT_STALL_MS - 1000
+    assert ctx.import_runner.state(job) == "failed"
+
+
+def _wait_for(client, url, timeout=10):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        job = client.get(url).get_json()
+        if job["status"] in ("done", "failed"):
+            return job
+        time.sleep(0.05)
+    raise AssertionError(f"job still {job['status']}")
+
+
+def test_attendance_backfill_runs_as_a_job(ctx, mode, client, athletes):
+    csv = ("athlete,date,status,notes\n"
+           "First0 Last0,2025-09-02,Absent,sick\n"
+           "First1 Last1,2025-09-02,Present,\n"
+           "Nobody Here,2025-09-02,Absent,\n")
+    r = client.post("/import_attendance", data={"file": (io.BytesIO(csv.encode()), "past.csv")},
+                    headers={"Accept": "application/json"})
+    assert r.status_code == 202
+    job = _wait_for(client, r.get_json()["status_url"])
+    assert job["status"] == "done" and job["rows_done"] == 3
+    assert job["unresolved"] == [["Nobody Here", 1, "no such athlete"]]
+
+    db.session.expire_all()
+    absent = Attendance.query.filter_by(athlete_id=athletes[0], date="2025-09-02").one()
+    assert (absent.status, absent.notes) == ("Absent", "sick")
+    assert PracticeDay.query.filter_by(date="2025-09-02", status="held").count() == 2
+    assert not os.path.exists(ctx.backfill_runner.path(job["id"]))
+    assert "past.csv" in client.get("/import_attendance").get_data(as_text=True)
+
+
+def _settled(job_id, timeout=10):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        db.session.expire_all()
+        job = db.session.get(ImportJob, job_id)
+        if job.status in ("done", "failed"):
+            return job
+        time.sleep(0.05)
+    raise AssertionError(f"job still {job.status}")
+
+
+def test_start_picks_up_jobs_queued_before_a_restart(ctx, tmp_path):
+    runner = ImportRunner(str(tmp_path))  # a freshly booted process
+    team = Team.query.order_by(Team.id).first()
+    now = now_ms()
+    for job_id, counts in (("a" * 32, "{}"), ("b" * 32, "not json")):
+        (tmp_path / job_id).write_text(f"first_name,last_name,team_name\nQueued,Before,{team.name}\n")
+        db.session.add(ImportJob(id=job_id, filename="roster.csv", status="queued",
+                                 counts=counts, created_at=now, updated_at=now))
+    db.session.commit()
+
+    runner.start()
+    assert _settled("a" * 32).status == "done"
+    assert Athlete.query.filter_by(first_name="Queued", last_name="Before").count() == 1
+    # bad saved counts fail the job instead of leaving it claimed and "running"
+    failed = _settled("b" * 32)
+    assert failed.status == "failed" and failed.error
+
+
+def test_export_job_is_built_once_per_data_version(ctx, client, athletes):
+    def queue():
+        r = client.post("/admin/export/jobs", data={"table": "athletes"}, headers={"Accept": "application/json"})
+        assert r.status_code == 202
+        return r.get_json()
+
+    first = queue()
+    job = _wait_for(client, first["status_url"])
+    assert job["status"] == "done" and job["rows_done"] == len(athletes)
+    body = client.get(job["download_url"]).get_data(as_text=True)
+    assert sorted(int(row["id"]) for row in csv.DictReader(io.StringIO(body))) == sorted(athletes)
+
+    # the same options at the same data version get the finished file back
+    assert queue()["id"] == first["id"]
+
+    # a failed job (or one whose worker died) is built again
+    db.session.get(ExportJob, first["id"]).status = "failed"
+    db.session.commit()
+    retry = queue()
+    assert retry["id"] != first["id"]
+    assert _wait_for(client, retry["status_url"])["status"] == "done"
+
+    # and new data means a new file
+    client.post("/attendance/toggle", json={"athlete_id": athletes[0]})
+    assert queue()["id"] != retry["id"]
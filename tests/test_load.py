@@ -0,0 +1,40 @@
+import gzip
+
+from app import app, db, Athlete, Attendance, Team
+
+
+def _load(*args):
+    result = app.test_cli_runner().invoke(args=["load", *args])
+    assert result.exit_code == 0, result.output
+    return result.output
+
+
+def test_load_roster_and_attendance(ctx, mode, athletes, tmp_path):
+    team = Team.query.order_by(Team.id).first()
+    roster = tmp_path / "roster.csv.gz"
+    with gzip.open(roster, "wt") as f:
+        f.write("First,Last,Grade,Gender,Team\n"
+                f"First0,Last0,11,F,{team.name}\n"     # already on the roster
+                "Ada,Lovelace,10,F,Engines\n"          # a team --create-teams adds
+                f"Alan,Turing,12,M,{team.name}\n"
+                f"Grace,Hopper,9,F,{team.name}\n")
+    out = _load("roster", str(roster), "--create-teams", "--batch", "2")
+    assert "Added 1 team(s)." in out and "Imported 3 athletes." in out and "Skipped 1 already" in out
+    db.session.expire_all()
+    engines = Team.query.filter_by(name="Engines").one()
+    ada = Athlete.query.filter_by(first_name="Ada", last_name="Lovelace").one()
+    assert (ada.team_id, ada.grade, ada.gender) == (engines.id, 10, "F")
+
+    marks = tmp_path / "marks.csv"
+    marks.write_text("athlete,date,status,notes\n"
+                     "Ada Lovelace,2025-09-02,Absent,sick\n"
+                     "Alan Turing,2025-09-02,Present,\n"
+                     "Nobody Here,2025-09-02,Absent,\n")
+    out = _load("attendance", str(marks), "--batch", "2")
+    assert "Nobody Here: 1 row(s), no such athlete" in out
+    db.session.expire_all()
+    rec = Attendance.query.filter_by(athlete_id=ada.id, date="2025-09-02").one()
+    assert (rec.status, rec.notes) == ("Absent", "sick")
+    turing = Athlete.query.filter_by(last_name="Turing").one()
+    stored = Attendance.query.filter_by(athlete_id=turing.id, date="2025-09-02").first()
+    assert (stored.status if stored else None) == (None if mode else "Present")
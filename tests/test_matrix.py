@@ -0,0 +1,92 @@
+import datetime as pydt
+import os
+
+import numpy as np
+
+from app import db, Attendance, central_today, season_of
+
+
+def _season_days(n):
+    season = season_of(central_today())
+    return season, [pydt.date(season, 9, d).isoformat() for d in range(1, n + 1)]
+
+
+def _cell(view, athlete_id, day):
+    i, j = view.row_of[athlete_id], view.col_of[day]
+    bits = np.unpackbits(np.asarray(view.planes[:, i]), axis=-1)[:, j]
+    return "Present" if bits[0] else "Absent" if bits[1] else None
+
+
+def _sql_counts(ctx, season):
+    since, until = ctx.season_bounds(season)
+    counts = {}
+    for aid, _, status in db.session.execute(ctx.roll_rows(None, since, until)):
+        present, absent = counts.get(aid, (0, 0))
+        counts[aid] = (present + (status == "Present"), absent + (status == "Absent"))
+    return counts
+
+
+def _matrix_counts(ctx, view):
+    present, absent = ctx.matrix_counts(view)
+    return {aid: (int(present[i]), int(absent[i])) for i, aid in enumerate(view.athlete_ids)
+            if present[i] or absent[i]}
+
+
+def _mark(ctx, athlete_id, day, status):
+    rec = ctx.get_roll_record(athlete_id, day)
+    rec.status = status
+    db.session.commit()
+
+
+def test_matrix_follows_the_roll(ctx, mode, athletes):
+    season, days = _season_days(3)
+    for day in days:
+        ctx.materialize_roll(day)
+    view = ctx.roll_matrix.load(season)
+    assert view.days == days
+    assert _matrix_counts(ctx, view) == _sql_counts(ctx, season)
+
+    # committed marks are patched into the file every worker maps
+    generation = int(view.generation[0])
+    _mark(ctx, athletes[0], days[0], "Absent")
+    _mark(ctx, athletes[1], days[2], "Absent")
+    view = ctx.roll_matrix.load(season)
+    assert int(view.generation[0]) == generation + 2
+    assert _cell(view, athletes[0], days[0]) == "Absent"
+    assert _matrix_counts(ctx, view) == _sql_counts(ctx, season)
+
+    # invalidate drops the file; the next read rebuilds the same counts
+    ctx.roll_matrix.invalidate(season)
+    assert not os.path.exists(ctx.roll_matrix._path(season))
+    rebuilt = ctx.roll_matrix.load(season)
+    assert int(rebuilt.generation[0]) == 0
+    assert _matrix_counts(ctx, rebuilt) == _sql_counts(ctx, season)
+
+
+def test_matrix_checks_the_change_stamp(ctx, athletes):
+    season, days = _season_days(1)
+    ctx.materialize_roll(days[0])
+    view = ctx.roll_matrix.load(season)
+    built = view.built_seq
+    assert built == ctx.current_change_seq() > 0
+
+    # a commit the build already read isn't patched again
+    ctx.roll_matrix.apply([{"athlete_id": athletes[0], "date": days[0], "status": "Absent", "seq": built}])
+    assert _cell(view, athletes[0], days[0]) == "Present"
+
+    ctx.roll_matrix.apply([{"athlete_id": athletes[0], "date": days[0], "status": "Absent", "seq": built + 2}])
+    assert _cell(view, athletes[0], days[0]) == "Absent" and int(view.seq[0]) == built + 2
+
+    # an older commit landing after a newer patch drops the matrix instead
+    ctx.roll_matrix.apply([{"athlete_id": athletes[1], "date": days[0], "status": "Absent", "seq": built + 1}])
+    assert not os.path.exists(ctx.roll_matrix._path(season))
+
+
+def test_session_commits_stamp_their_events(ctx, athletes):
+    season, days = _season_days(1)
+    ctx.materialize_roll(days[0])
+    ctx.roll_matrix.load(season)
+    _mark(ctx, athletes[0], days[0], "Absent")
+    seq = Attendance.query.filter_by(athlete_id=athletes[0], date=days[0]).one().change_seq
+    assert seq == ctx.current_change_seq()
+    assert int(ctx.roll_matrix.load(season).seq[0]) == seq
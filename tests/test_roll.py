@@ -0,0 +1,97 @@
+from sqlalchemy import event
+
+from app import db, Attendance, PracticeDay, Team, central_today
+
+
+def _writes(fn):
+    """Run fn and return the INSERT/UPDATE/DELETE statements it sent."""
+    seen = []
+
+    def record(conn, cursor, statement, *args):
+        if statement.lstrip().split(None, 1)[0].upper() in ("INSERT", "UPDATE", "DELETE"):
+            seen.append(statement)
+
+    event.listen(db.engine, "before_cursor_execute", record)
+    try:
+        fn()
+    finally:
+        event.remove(db.engine, "before_cursor_execute", record)
+    return seen
+
+
+def test_materialize_roll_writes_once(ctx, mode, athletes):
+    day = "2025-09-02"
+    assert _writes(lambda: ctx.materialize_roll(day))
+    assert PracticeDay.query.filter_by(date=day).count() == 2
+    rows = Attendance.query.filter_by(date=day).count()
+    assert rows == (0 if mode else len(athletes))
+    assert _writes(lambda: ctx.materialize_roll(day)) == []
+    assert Attendance.query.filter_by(date=day).count() == rows
+
+
+def test_attendance_page_view_is_read_only_after_first(client, athletes):
+    assert client.get("/attendance").status_code == 200
+    assert _writes(lambda: client.get("/attendance")) == []
+    assert Attendance.query.filter_by(date=central_today()).count() == len(athletes)
+
+
+def test_calendar_changes_refresh_history_etag(ctx, client, athletes):
+    team_id = Team.query.order_by(Team.id).first().id
+    url = f"/history?team_id={team_id}"
+    etag = client.get(url).headers["ETag"]
+    assert client.get(url, headers={"If-None-Match": etag}).status_code == 304
+
+    assert ctx.plan_practice_days(team_id, ["2025-10-01"]) == 1
+    r = client.get(url, headers={"If-None-Match": etag})
+    assert r.status_code == 200
+
+    etag = r.headers["ETag"]
+    assert ctx.unschedule_practice_day(team_id, "2025-10-01") == 1
+    assert client.get(url, headers={"If-None-Match": etag}).status_code == 200
+
+
+def test_history_dates_follow_the_team(ctx, client, athletes):
+    first, second = (t.id for t in Team.query.order_by(Team.id).limit(2))
+    db.session.add(PracticeDay(team_id=first, date="2025-09-02", status="held"))
+    db.session.commit()
+    url = f"/history?team_id={second}"
+    etag = client.get(url).headers["ETag"]
+
+    # another team's practice day neither changes this page nor its ETag
+    db.session.add(PracticeDay(team_id=first, date="2025-09-03", status="held"))
+    db.session.commit()
+    assert client.get(url, headers={"If-None-Match": etag}).status_code == 304
+    page = client.get(url).get_data(as_text=True)
+    assert "2025-09-02" not in page and "2025-09-03" not in page
+    assert "2025-09-02" in client.get(f"/history?team_id={first}").get_data(as_text=True)
+
+
+def test_implicit_marks_stay_on_the_calendar(ctx, client, athletes):
+    ctx.app.config["IMPLICIT_PRESENT"] = True
+    a0 = db.session.get(ctx.Athlete, athletes[0])
+    off, planned = "2025-09-10", "2025-09-11"
+    ctx.plan_practice_days(a0.team_id, [planned])
+
+    # off the calendar: refused, not a practice day (and Present) for the whole team
+    page = client.post("/manage_absences", data={"athlete_id": a0.id, "action": "add_absence",
+                                                 "add_date": off}).get_data(as_text=True)
+    assert "isn&#39;t a practice day" in page
+    r = client.post("/attendance/sync", json={"ops": [
+        {"key": "k1", "op": "set_status", "athlete_id": a0.id, "date": off, "ts": 1, "status": "Absent"}]})
+    assert r.json["rejected"] == [{"key": "k1", "error": "not a practice day"}]
+    db.session.expire_all()
+    assert not Attendance.query.filter_by(date=off).count()
+    assert not PracticeDay.query.filter_by(date=off).count()
+
+    # a planned day is held once someone takes roll on it
+    client.post("/manage_absences", data={"athlete_id": a0.id, "action": "add_absence", "add_date": planned})
+    db.session.expire_all()
+    assert Attendance.query.filter_by(athlete_id=a0.id, date=planned).one().status == "Absent"
+    assert PracticeDay.query.filter_by(team_id=a0.team_id, date=planned).one().status == "held"
+
+    # a Present-only mark stores no row, but still holds the planned day
+    ctx.plan_practice_days(a0.team_id, ["2025-09-12"])
+    client.post("/attendance/sync", json={"ops": [
+        {"key": "k2", "op": "set_status", "athlete_id": a0.id, "date": "2025-09-12", "ts": 1, "status": "Present"}]})
+    db.session.expire_all()
+    assert PracticeDay.query.filter_by(team_id=a0.team_id, date="2025-09-12").one().status == "held"
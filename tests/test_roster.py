@@ -0,0 +1,133 @@
+import io
+import os
+import re
+import time
+
+from sqlalchemy import event
+
+from app import db, Athlete, Team
+
+
+def _upload(client, text, **form):
+    return client.post("/import_csv", data={"file": (io.BytesIO(text.encode()), "roster.csv"), **form})
+
+
+def _roster():
+    db.session.expire_all()
+    return {(a.first_name, a.last_name): (a.team_id, a.grade) for a in Athlete.query}
+
+
+def test_roster_preview_then_apply(ctx, mode, client, athletes):
+    first, second = Team.query.order_by(Team.id).limit(2)
+    client.get("/attendance")  # some roll, so a team move has days to carry
+    before = _roster()
+    csv = ("first_name,last_name,team_name,grade\n"
+           f"First0,Last0,{first.name},11\n"         # grade change
+           f"First1,Last1,{first.name},\n"           # moves from the second team
+           f"New,Runner,{first.name},9\n"            # add
+           f"New,Runner,{first.name},9\n"            # in-file duplicate
+           f",Nameless,{first.name},\n")              # no first name
+    # First2 Last2 (first team) is left out: reported missing, not removed
+
+    page = _upload(client, csv, mode="preview")
+    assert page.status_code == 200
+    html = page.get_data(as_text=True)
+    assert "Runner" in html and "First2" in html
+    assert _roster() == before  # a preview writes nothing
+
+    token = re.search(r'name="token" value="([0-9a-f]{32})"', html).group(1)
+    r = client.post("/import_csv/apply", data={"token": token})
+    assert r.status_code == 302 and r.headers["Location"].endswith("/manage_roster")
+
+    after = _roster()
+    assert after[("First0", "Last0")] == (first.id, 11)
+    assert after[("First1", "Last1")] == (first.id, None)
+    assert after[("New", "Runner")] == (first.id, 9)
+    assert after[("First2", "Last2")] == before[("First2", "Last2")]
+    assert len(after) == len(before) + 1
+    assert not os.path.exists(os.path.join(ctx.IMPORT_DIR, token + ".preview"))
+
+    # the preview is spent: applying it again changes nothing
+    client.post("/import_csv/apply", data={"token": token})
+    assert _roster() == after
+
+
+def test_apply_rediffs_against_the_current_roster(ctx, client, athletes):
+    first = Team.query.order_by(Team.id).first()
+    html = _upload(client, f"first_name,last_name,team_name\nNew,Runner,{first.name}\n",
+                   mode="preview").get_data(as_text=True)
+    token = re.search(r'name="token" value="([0-9a-f]{32})"', html).group(1)
+
+    # someone adds the athlete by hand between preview and apply
+    db.session.add(Athlete(first_name="New", last_name="Runner", team_id=first.id))
+    db.session.commit()
+    client.post("/import_csv/apply", data={"token": token})
+    db.session.expire_all()
+    assert Athlete.query.filter_by(first_name="New", last_name="Runner").count() == 1
+
+
+def test_import_runs_in_batches(ctx, client, athletes, monkeypatch):
+    monkeypatch.setattr(ctx.RosterImport, "chunk_rows", 2)
+    monkeypatch.setattr(ctx, "IMPORT_CHUNK_ROWS", 4)  # job commits every 4 CSV rows
+    team = Team.query.order_by(Team.id).first()
+    csv = ("first_name,last_name,team_name,grade\n"
+           f"First0,Last0,{team.name},\n"            # already on the roster
+           f"first2,LAST2,{team.name},\n"            # same, in other case
+           + "".join(f"New{i},Runner,{team.name},9\n" for i in range(5))
+           + f"New0,Runner,{team.name},9\n"          # in-file duplicate
+           f",Nameless,{team.name},\n"
+           "Odd,Team,Nowhere,\n")                    # unknown team: imported without one
+    inserts = []
+
+    def count_inserts(conn, cursor, statement, *args):
+        if statement.startswith("INSERT INTO athlete "):
+            inserts.append(statement)
+
+    event.listen(db.engine, "before_cursor_execute", count_inserts)
+    try:
+        r = client.post("/import_csv", data={"file": (io.BytesIO(csv.encode()), "roster.csv")},
+                        headers={"Accept": "application/json"})
+        assert r.status_code == 202
+        deadline = time.monotonic() + 10
+        while (job := client.get(r.get_json()["status_url"]).get_json())["status"] not in ("done", "failed"):
+            assert time.monotonic() < deadline
+            time.sleep(0.05)
+    finally:
+        event.remove(db.engine, "before_cursor_execute", count_inserts)
+
+    assert job["status"] == "done" and job["rows_done"] == 10
+    assert job["counts"] == {"added": 6, "skipped_missing_names": 1, "skipped_unknown_team": 1,
+                             "skipped_infile_dupes": 1, "skipped_db_dupes": 2, "failed": 0,
+                             "possible_dupes": job["counts"]["possible_dupes"]}
+    # two athletes per multi-row INSERT, and a commit flushes a part batch:
+    # New0-1, New2-3, New4 at the row-8 commit, Odd at the end
+    assert [s.count("(?, ?, ?, ?, ?, ?, ?)") for s in inserts] == [2, 2, 1, 1]
+    roster = _roster()
+    assert all(roster[(f"New{i}", "Runner")] == (team.id, 9) for i in range(5))
+    assert roster[("Odd", "Team")] == (None, None)
+
+
+def test_duplicate_index_scoring(ctx, monkeypatch):
+    assert [ctx.soundex(w) for w in ("Robert", "Rupert", "Ashcraft", "Tymczak", "Pfister", "123")] == \
+        ["r163", "r163", "a261", "t522", "p236", ""]
+    assert [round(ctx.jaro_winkler(a, b), 3) for a, b in
+            (("martha", "marhta"), ("dwayne", "duane"), ("dixon", "dicksonx"))] == [0.961, 0.84, 0.813]
+    assert ctx.name_similarity("jon", "smith", "jonathan", "smith") == 0.975  # a first name that starts the other
+    assert ctx.name_similarity("jane", "doe", "jon", "smith", floor=0.9) == 0.0
+
+    index = ctx.DuplicateIndex()
+    for ref, (first, last) in enumerate([("Jonathan", "Smith"), ("Jon", "Smyth"), ("Jane", "Doe"),
+                                         ("Kate", "Smith")]):
+        index.add(ref, first, last)
+    assert [(ref, score) for ref, _, score in index.matches("JON", " smith ")] == [(0, 0.975), (1, 0.947)]
+    assert not index.any_match("Zed", "Quinn")
+    assert [(a, b) for a, b, _ in index.pairs()] == [(0, 1)]
+
+    # an oversized bucket is only compared between neighbours in name order
+    # (Sal, Sam, Samuel, Sandy): Sal ~ Sandy, Sam ~ Sandy and Sal ~ Samuel are never scored
+    monkeypatch.setattr(ctx, "DUPLICATE_BUCKET_MAX", 2)
+    monkeypatch.setattr(ctx, "DUPLICATE_WINDOW", 1)
+    crowded = ctx.DuplicateIndex(min_score=0.8)
+    for ref, first in enumerate(["Sam", "Samuel", "Sal", "Sandy"]):
+        crowded.add(ref, first, "Smith")
+    assert crowded.pairs() == [(0, 1, 0.975), (2, 0, 0.911), (1, 3, 0.831)]
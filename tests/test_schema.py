@@ -0,0 +1,64 @@
+import threading
+import time
+
+from sqlalchemy import String, inspect, text
+
+from app import db, Attendance
+
+
+def test_schema_lock_serializes_boot(ctx):
+    """A second worker booting at the same time waits for the first to finish."""
+    order = []
+
+    def boot(name, hold):
+        with ctx.app.app_context(), ctx.schema_lock():
+            order.append(f"{name} start")
+            time.sleep(hold)
+            order.append(f"{name} end")
+
+    first = threading.Thread(target=boot, args=("first", 0.3))
+    first.start()
+    time.sleep(0.1)
+    second = threading.Thread(target=boot, args=("second", 0))
+    second.start()
+    first.join()
+    second.join()
+    assert order == ["first start", "first end", "second start", "second end"]
+
+
+def test_migrate_day_columns_converts_legacy_text_dates(ctx, athletes):
+    a, b = athletes[:2]
+    with db.engine.begin() as conn:
+        conn.execute(text("DROP TABLE attendance"))
+        conn.execute(text(
+            "CREATE TABLE attendance (id INTEGER PRIMARY KEY, athlete_id INTEGER NOT NULL, "
+            "date VARCHAR(10) NOT NULL, status VARCHAR(20) NOT NULL, notes VARCHAR(255), "
+            "updated_at BIGINT, change_seq BIGINT, "
+            "CONSTRAINT uq_attendance_day UNIQUE (athlete_id, date))"))
+        conn.execute(text("INSERT INTO attendance (athlete_id, date, status, notes) VALUES (:a, :d, :s, :n)"), [
+            {"a": a, "d": "2025-09-02", "s": "Present", "n": None},
+            {"a": a, "d": "2025-09-02T17:03:00", "s": "Absent", "n": "sick"},  # same day
+            {"a": b, "d": "2025-09-03", "s": "Absent", "n": None},
+            {"a": b, "d": "Sept 4th", "s": "Absent", "n": "typed in"},  # unreadable
+        ])
+    try:
+        ctx.migrate_day_columns()
+        ctx.migrate_day_columns()  # nothing left to do the second time
+
+        cols = {c["name"]: c["type"] for c in inspect(db.engine).get_columns("attendance")}
+        assert not isinstance(cols["date"], String) and "date__day" not in cols
+        db.session.expire_all()
+        rows = [(r.athlete_id, r.date, r.status, r.notes)
+                for r in Attendance.query.order_by(Attendance.athlete_id, Attendance.date)]
+        # the duplicate day keeps its Absent-with-note row
+        assert rows == [(a, "2025-09-02", "Absent", "sick"), (b, "2025-09-03", "Absent", None)]
+        with db.engine.connect() as conn:
+            bad = conn.execute(text("SELECT athlete_id, date, notes FROM attendance__bad_days")).all()
+        assert bad == [(b, "Sept 4th", "typed in")]
+    finally:
+        with db.engine.begin() as conn:
+            conn.execute(text("DROP TABLE IF EXISTS attendance__bad_days"))
+        ctx.ensure_attendance_unique_index()
+        ctx.ensure_attendance_range_index()
+        ctx.ensure_attendance_covering_index()
+        ctx.ensure_change_seq_columns()
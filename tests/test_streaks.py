@@ -0,0 +1,57 @@
+import numpy as np
+
+from app import db, AthleteFlag, RollMatrixView, Team, now_ms, streak_stats
+
+
+def _view(rows):
+    """A matrix view from per-athlete strings: P present, A absent, . unmarked."""
+    days = [f"2025-09-{d:02d}" for d in range(1, len(rows[0]) + 1)]
+    bits = np.array([[[c == mark for c in row] for row in rows] for mark in "PA"], dtype=bool)
+    ids = list(range(1, len(rows) + 1))
+    return RollMatrixView(2025, ids, [1] * len(ids), days, np.packbits(bits, axis=-1),
+                          np.zeros(1, dtype=np.uint64), np.zeros(1, dtype=np.uint64), 0,
+                          {aid: i for i, aid in enumerate(ids)}, {d: j for j, d in enumerate(days)})
+
+
+def test_streak_stats_current_and_longest_runs():
+    stats = streak_stats(_view([
+        "PPAPPP.",   # unmarked days don't break a run
+        "PPP.PAA",
+        "AAAPAA.",
+        ".......",
+    ]))
+    assert stats["present_current"].tolist() == [3, 0, 0, 0]
+    assert stats["present_longest"].tolist() == [3, 4, 1, 0]
+    assert stats["absent_current"].tolist() == [0, 2, 2, 0]
+    assert stats["absent_longest"].tolist() == [1, 2, 3, 0]
+
+
+def test_streak_stats_without_practice_days():
+    view = _view([""])
+    assert streak_stats(view)["present_longest"].tolist() == [0]
+
+
+def test_consecutive_absences_and_streak_leaders(ctx, mode, client, athletes):
+    a, b = athletes[:2]
+    days = [f"2025-09-0{d}" for d in range(1, 6)]
+    for team in Team.query:
+        ctx.plan_practice_days(team.id, days)
+
+    def sync(marks):
+        r = client.post("/attendance/sync", json={"ops": [
+            {"key": f"k{now_ms()}-{i}", "ts": now_ms(), "op": "set_status", "athlete_id": aid,
+             "date": d, "status": status} for i, (aid, d, status) in enumerate(marks)]})
+        assert r.status_code == 200
+
+    sync([(a, d, "Absent") for d in days[:3]] + [(b, d, "Present") for d in days])
+    db.session.expire_all()
+    flag = AthleteFlag.query.filter_by(athlete_id=a, rule="consecutive").one()
+    assert flag.value == ctx.FLAG_RULES["consecutive"] == 3
+
+    # two Presents end the run: the flag goes, and b's streak leads a's
+    sync([(a, d, "Present") for d in days[3:]])
+    db.session.expire_all()
+    assert not AthleteFlag.query.filter_by(athlete_id=a, rule="consecutive").count()
+    page = client.get(f"/attendance_leaders?since={days[0]}&until=2025-09-30&rank_by=streak")
+    text = page.get_data(as_text=True)
+    assert text.index("First1 Last1") < text.index("First0 Last0")
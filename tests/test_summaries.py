@@ -0,0 +1,154 @@
+import datetime
+
+from app import (db, Athlete, AthleteDayIndex, AthleteFlag, AthleteSeason, Attendance, Team,
+                 central_today, now_ms, season_bounds, season_of)
+
+
+def _summaries():
+    db.session.expire_all()
+    return (
+        sorted(tuple(r) for r in db.session.query(
+            AthleteSeason.athlete_id, AthleteSeason.season, AthleteSeason.present_days,
+            AthleteSeason.absent_days, AthleteSeason.last_absence, AthleteSeason.current_streak)),
+        sorted(tuple(r) for r in db.session.query(
+            AthleteDayIndex.athlete_id, AthleteDayIndex.day,
+            AthleteDayIndex.present_cum, AthleteDayIndex.absent_cum)),
+        sorted(tuple(r) for r in db.session.query(
+            AthleteFlag.athlete_id, AthleteFlag.season, AthleteFlag.rule, AthleteFlag.value)),
+    )
+
+
+def _assert_matches_rebuild(ctx):
+    kept = _summaries()
+    db.session.commit()
+    ctx.rebuild_roll_summaries()
+    assert _summaries() == kept
+
+
+def _days_back(n):
+    """The n days before today, all in one season: early in a season, the last n of the one before."""
+    today = datetime.date.fromisoformat(central_today())
+    start = datetime.date.fromisoformat(season_bounds(season_of(today.isoformat()))[0])
+    end = today if (today - start).days >= n else start
+    return [(end - datetime.timedelta(days=d)).isoformat() for d in range(n, 0, -1)]
+
+
+def _sync(client, ops):
+    r = client.post("/attendance/sync", json={"ops": [
+        {"key": f"k{now_ms()}-{i}", "ts": now_ms(), **op} for i, op in enumerate(ops)]})
+    assert r.status_code == 200, r.get_data(as_text=True)
+
+
+def test_incremental_summaries_match_rebuild(ctx, mode, client, athletes):
+    a, b, c = athletes[:3]
+    past = _days_back(8)
+    for team in Team.query:
+        ctx.plan_practice_days(team.id, past)  # implicit mode only takes marks on the calendar
+
+    # a run of absences on past days, then today's roll
+    _sync(client, [{"op": "set_status", "athlete_id": a, "date": d,
+                    "status": "Absent" if i % 3 else "Present"} for i, d in enumerate(past)])
+    assert AthleteFlag.query.filter_by(athlete_id=a, rule="total").count() == 1
+    _assert_matches_rebuild(ctx)
+    client.get("/attendance")
+    _assert_matches_rebuild(ctx)
+
+    # toggles today, and an edit in the middle of the run
+    client.post("/attendance/toggle", json={"athlete_id": a})
+    client.post("/attendance/toggle", json={"athlete_id": b})
+    _assert_matches_rebuild(ctx)
+    _sync(client, [{"op": "toggle", "athlete_id": a, "date": past[3]},
+                   {"op": "set_note", "athlete_id": c, "date": past[5], "note": "late"}])
+    _assert_matches_rebuild(ctx)
+    client.post("/attendance/toggle", json={"athlete_id": b})
+    _assert_matches_rebuild(ctx)
+
+    # a row removed outright, and a day called off for a team
+    db.session.delete(Attendance.query.filter_by(athlete_id=a, date=past[4]).one())
+    db.session.commit()
+    _assert_matches_rebuild(ctx)
+    team_id = db.session.get(Athlete, b).team_id
+    assert ctx.cancel_practice_day(team_id, past[5]) in (True, False)
+    db.session.commit()
+    _assert_matches_rebuild(ctx)
+
+
+def test_new_practice_day_counts_for_the_team(ctx, mode, athletes):
+    day = _days_back(3)[0]
+    team_id = Team.query.order_by(Team.id).first().id
+    ctx.materialize_roll(day, team_id)
+    _assert_matches_rebuild(ctx)
+    db.session.add(Attendance(athlete_id=athletes[1], date=day, status="Absent"))
+    db.session.commit()
+    _assert_matches_rebuild(ctx)
+
+
+def test_flagged_athletes_between_dates(ctx, mode, client, athletes):
+    a, b = athletes[:2]
+    days = ["2025-09-02", "2025-09-03", "2025-09-04", "2025-09-05"]
+    for team in Team.query:
+        ctx.plan_practice_days(team.id, days)
+    _sync(client, [{"op": "set_status", "athlete_id": a, "date": d, "status": "Absent"} for d in days[:3]]
+          + [{"op": "set_status", "athlete_id": b, "date": days[2], "status": "Absent"}])
+
+    page = client.get("/flagged_athletes?rule=range&since=2025-09-03&until=2025-09-05&min_absences=2")
+    text = page.get_data(as_text=True)
+    assert "First0 Last0" in text and "2 absences 2025-09-03 to 2025-09-05" in text
+    assert "First1 Last1" not in text
+
+    # links without a rule still mean a date range (all history here)
+    text = client.get("/flagged_athletes?min_absences=1").get_data(as_text=True)
+    assert "3 absences in all" in text and "1 absence in all" in text
+    assert text.index("First0 Last0") < text.index("First1 Last1")
+
+
+def _range(ctx, athlete_id, since, until):
+    db.session.expire_all()
+    return tuple(db.session.query(*ctx.range_counts(since, until)).filter(Athlete.id == athlete_id).one())
+
+
+def test_range_counts_follow_a_past_day_edit(ctx, mode, client, athletes):
+    a = athletes[0]
+    days = _days_back(6)
+    for team in Team.query:
+        ctx.plan_practice_days(team.id, days)
+    _sync(client, [{"op": "set_status", "athlete_id": a, "date": d, "status": "Absent" if i == 1 else "Present"}
+                   for i, d in enumerate(days)])
+    assert _range(ctx, a, days[0], days[-1]) == (5, 1)
+
+    # an absence added in the middle of the range moves every later running total
+    client.post("/manage_absences", data={"athlete_id": a, "action": "add_absence",
+                                          "add_date": days[3], "add_note": "dentist"})
+    assert _range(ctx, a, days[0], days[-1]) == (4, 2)
+    assert _range(ctx, a, days[2], days[4]) == (2, 1)
+    assert _range(ctx, a, days[4], "") == (2, 0)
+    index = dict(db.session.query(AthleteDayIndex.day, AthleteDayIndex.absent_cum)
+                 .filter(AthleteDayIndex.athlete_id == a))
+    assert [index[d] for d in days] == [0, 1, 1, 2, 2, 2]
+    _assert_matches_rebuild(ctx)
+
+    # and marking it Present again takes it back out
+    rec = Attendance.query.filter_by(athlete_id=a, date=days[3]).one()
+    client.post("/manage_absences", data={"athlete_id": a, "delete_id": rec.id})
+    assert _range(ctx, a, days[0], days[-1]) == (5, 1)
+    _assert_matches_rebuild(ctx)
+
+
+def test_rolling_absences_counts_each_athletes_last_practices(ctx, mode, client, athletes):
+    a, b = athletes[:2]
+    days = [f"2025-09-0{d}" for d in range(1, 7)]
+    for team in Team.query:
+        ctx.plan_practice_days(team.id, ["2025-06-30"] + days)
+    marks = {(a, days[0]), (a, days[1]), (a, days[5]), (b, days[3]), (b, days[4]), (b, "2025-06-30")}
+    _sync(client, [{"op": "set_status", "athlete_id": aid, "date": d,
+                    "status": "Absent" if (aid, d) in marks else "Present"}
+                   for aid in (a, b) for d in ["2025-06-30"] + days])
+
+    assert ctx.rolling_absences(2, 3, as_of=days[5]) == [(b, 2)]
+    assert sorted(ctx.rolling_absences(2, 6, as_of=days[5])) == sorted([(a, 3), (b, 2)])
+    # as_of moves the window back; last season's absence is never in it
+    assert ctx.rolling_absences(2, 3, as_of=days[2]) == [(a, 2)]
+    assert ctx.rolling_absences(1, 10, as_of=days[2]) == [(a, 2)]
+    team_id = db.session.get(Athlete, b).team_id
+    assert ctx.rolling_absences(2, 3, team_id=team_id, as_of=days[5]) == [(b, 2)]
+    assert ctx.rolling_absences(2, 3, team_id=team_id, as_of=days[2]) == []
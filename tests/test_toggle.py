@@ -0,0 +1,151 @@
+from sqlalchemy import event
+
+from app import db, Attendance, central_today, now_ms
+
+
+def _stored(athlete_id):
+    db.session.expire_all()  # requests run in their own session
+    rec = Attendance.query.filter_by(athlete_id=athlete_id, date=central_today()).first()
+    return rec.status if rec else None
+
+
+def test_toggle_retries_when_another_coach_adds_the_row(client, ctx, mode, athletes, monkeypatch):
+    aid = athletes[0]
+    real = ctx.get_roll_record
+    calls = []
+
+    def racing(athlete_id, day):
+        record = real(athlete_id, day)
+        if not calls:
+            # the other coach's tap commits between our read and our insert
+            with db.engine.begin() as conn:
+                conn.execute(Attendance.__table__.insert().values(
+                    athlete_id=athlete_id, date=day, status="Absent"))
+        calls.append(day)
+        return record
+
+    monkeypatch.setattr(ctx, "get_roll_record", racing)
+    r = client.post("/attendance/toggle", json={"athlete_id": aid})
+    assert r.status_code == 200
+    assert r.json["ok"] and r.json["status"] == "Present"
+    assert len(calls) == 2
+    assert _stored(aid) == (None if mode else "Present")
+
+
+def test_roll_events_carry_server_counts(client, ctx, mode, athletes):
+    today = central_today()
+    client.get("/attendance")
+    ctx.cancel_practice_day(db.session.get(ctx.Athlete, athletes[1]).team_id, today)
+    sub = ctx.roll_broadcaster.subscribe(None, today)
+    try:
+        client.post("/attendance/toggle", json={"athlete_id": athletes[0]})
+        ev = sub[2].get(timeout=1)
+    finally:
+        ctx.roll_broadcaster.unsubscribe(sub)
+    team_id = db.session.get(ctx.Athlete, athletes[0]).team_id
+    assert ev["status"] == "Absent"
+    assert ev["counts"] == ctx.roll_counts(today, team_id) == {"present": 2, "absent": 1, "unmarked": 0}
+    assert ev["counts_all"] == ctx.roll_counts(today)
+
+
+def test_toggle_counts_the_roll_once(client, ctx, mode, athletes):
+    today = central_today()
+    client.get("/attendance")
+    team_id = db.session.get(ctx.Athlete, athletes[0]).team_id
+    counted = []
+
+    def count_queries(conn, cursor, statement, *args):
+        if "count(athlete.id)" in statement:
+            counted.append(statement)
+
+    event.listen(db.engine, "before_cursor_execute", count_queries)
+    try:
+        r = client.post("/attendance/toggle", json={"athlete_id": athletes[0], "team_id": team_id})
+    finally:
+        event.remove(db.engine, "before_cursor_execute", count_queries)
+    # the live event's grouped count is reused for the reply
+    assert len(counted) == 1
+    db.session.expire_all()
+    assert r.json["counts"] == ctx.roll_counts(today, team_id)
+
+
+def test_keyed_toggle_is_saved_and_replay_is_a_no_op(client, mode, athletes):
+    aid = athletes[0]
+    r = client.post("/attendance/toggle", json={"athlete_id": aid, "key": "k1"})
+    assert r.json["status"] == "Absent"
+    assert r.json["counts"]["absent"] == 1
+    assert _stored(aid) == "Absent"
+
+    # a retried tap whose first attempt landed doesn't flip it back
+    r = client.post("/attendance/toggle", json={"athlete_id": aid, "key": "k1"})
+    assert r.json["status"] == "Absent"
+    assert _stored(aid) == "Absent"
+
+    r = client.post("/attendance/toggle", json={"athlete_id": aid, "key": "k2"})
+    assert r.json["status"] == "Present"
+    assert r.json["counts"]["absent"] == 0
+    assert _stored(aid) == (None if mode else "Present")
+    r = client.post("/attendance/toggle", json={"athlete_id": aid, "key": "k2"})
+    assert r.json["status"] == "Present"
+
+
+def test_sync_replay_applies_each_key_once(client, mode, athletes):
+    today = central_today()
+    ops = [
+        {"key": "s1", "op": "toggle", "athlete_id": athletes[0], "date": today, "ts": 1000},
+        {"key": "s2", "op": "set_status", "athlete_id": athletes[1], "date": today, "ts": 1001,
+         "status": "Absent"},
+        {"key": "s3", "op": "set_note", "athlete_id": athletes[2], "date": today, "ts": 1002,
+         "note": "late bus"},
+    ]
+    r = client.post("/attendance/sync", json={"ops": ops})
+    assert r.json["applied"] == ["s1", "s2", "s3"]
+    first = r.json["counts"]
+    assert first["absent"] == 2
+
+    r = client.post("/attendance/sync", json={"ops": ops})
+    assert r.json["applied"] == [] and sorted(r.json["skipped"]) == ["s1", "s2", "s3"]
+    assert r.json["counts"] == first
+    assert _stored(athletes[0]) == "Absent"
+    assert _stored(athletes[1]) == "Absent"
+    rec = Attendance.query.filter_by(athlete_id=athletes[2], date=today).one()
+    assert (rec.status, rec.notes) == ("Present", "late bus")
+
+
+def test_sync_op_older_than_a_server_toggle_is_a_conflict(client, mode, athletes):
+    today, aid = central_today(), athletes[0]
+    tapped = now_ms() - 60_000  # queued offline a minute ago...
+    client.post("/attendance/toggle", json={"athlete_id": aid})  # ...then another coach marked Absent
+    op = {"key": "late", "op": "set_status", "athlete_id": aid, "date": today, "ts": tapped,
+          "status": "Present"}
+
+    r = client.post("/attendance/sync", json={"ops": [op], "sent_at": now_ms()})
+    assert r.json["applied"] == [] and r.json["skipped"] == []
+    assert r.json["conflicts"] == [{"key": "late", "op": "set_status", "athlete_id": aid,
+                                    "date": today, "status": "Absent", "note": ""}]
+    assert _stored(aid) == "Absent"
+
+    # the coach keeps their change: same key, forced
+    r = client.post("/attendance/sync", json={"ops": [{**op, "force": True}], "sent_at": now_ms()})
+    assert r.json["applied"] == ["late"]
+    assert _stored(aid) == (None if mode else "Present")
+
+
+def test_sync_corrects_a_slow_phone_clock(client, mode, athletes):
+    today, aid = central_today(), athletes[0]
+    client.post("/attendance/toggle", json={"athlete_id": aid})  # Absent, on the server's clock
+    slow = 5 * 60_000  # the phone's clock runs five minutes behind
+    phone_now = now_ms() - slow
+    op = {"key": "slow", "op": "set_status", "athlete_id": aid, "date": today, "ts": phone_now,
+          "status": "Present"}
+    r = client.post("/attendance/sync", json={"ops": [op], "sent_at": phone_now})
+    assert r.json["applied"] == ["slow"] and r.json["conflicts"] == []
+    assert _stored(aid) == (None if mode else "Present")
+
+
+def test_sync_caps_ops_per_request(ctx, client, athletes):
+    ops = [{"key": f"k{i}", "op": "toggle", "athlete_id": athletes[0], "ts": i}
+           for i in range(ctx.SYNC_MAX_OPS + 1)]
+    r = client.post("/attendance/sync", json={"ops": ops})
+    assert r.status_code == 413 and r.json["max_ops"] == ctx.SYNC_MAX_OPS
+    assert _stored(athletes[0]) is None